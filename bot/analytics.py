@@ -0,0 +1,179 @@
+"""
+Risk and trend analytics for a universe of coins, computed from the daily candles in the local kline store.
+
+Every metric is computed for the whole universe at once: closes are a matrix with a row per coin, aligned to the
+latest candle, and coins with a shorter history are padded with NaN. Metrics for a coin without enough candles are NaN.
+"""
+
+import typing as t
+
+import numpy as np
+
+from . import exchanges, kline_store
+from .data_types import SupportedExchanges
+
+# days of candles the analytics are computed over, when not specified
+DEFAULT_ANALYTICS_DAYS = 90
+
+# days momentum is measured over, which matches the coinmarketcap `change_30d` it is an alternative to
+MOMENTUM_DAYS = 30
+
+# crypto trades every day of the year
+PERIODS_PER_YEAR = 365
+
+
+class MarketAnalytics:
+    """
+    Analytics indexed by symbol. Each metric is an array with an entry per symbol, in the order of `symbols`.
+    """
+
+    def __init__(self, symbols: t.List[str], returns: np.ndarray, volatility: np.ndarray, max_drawdown: np.ndarray, momentum: np.ndarray):
+        self.symbols = symbols
+        # daily log returns, a row per symbol
+        self.returns = returns
+        # annualized standard deviation of the daily log returns
+        self.volatility = volatility
+        # largest drop from a previous high, as a fraction of the high
+        self.max_drawdown = max_drawdown
+        # return over the last `MOMENTUM_DAYS`, as a fraction
+        self.momentum = momentum
+
+        self._index_by_symbol = {symbol: index for index, symbol in enumerate(symbols)}
+
+    def momentum_for(self, symbol: str) -> t.Optional[float]:
+        index = self._index_by_symbol.get(symbol)
+
+        if index is None or np.isnan(self.momentum[index]):
+            return None
+
+        return float(self.momentum[index])
+
+    def covariance(self) -> np.ndarray:
+        return returns_covariance(self.returns)
+
+
+def log_returns(closes: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.diff(np.log(closes), axis=1)
+
+
+def realized_volatility(returns: np.ndarray) -> np.ndarray:
+    available = ~np.isnan(returns)
+    counts = available.sum(axis=1)
+    centered = np.where(available, returns - _row_means(returns, available, counts)[:, None], 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variances = (centered**2).sum(axis=1) / (counts - 1)
+
+    # a sample variance needs at least two returns
+    variances[counts < 2] = np.nan
+
+    return np.sqrt(variances * PERIODS_PER_YEAR)
+
+
+def max_drawdown(closes: np.ndarray) -> np.ndarray:
+    # `fmax` ignores the NaN padding, so the running high starts at each coin's first candle
+    running_highs = np.fmax.accumulate(closes, axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdowns = 1 - closes / running_highs
+
+    has_closes = (~np.isnan(closes)).any(axis=1)
+    return np.where(has_closes, np.where(np.isnan(drawdowns), 0.0, drawdowns).max(axis=1, initial=0.0), np.nan)
+
+
+def momentum(closes: np.ndarray, days: int = MOMENTUM_DAYS) -> np.ndarray:
+    """
+    Return since the first close of the window, which is later than `days` ago for a coin with a shorter history
+    """
+
+    # `days` returns need one more close
+    window = closes[:, -(days + 1) :]
+
+    if window.shape[1] == 0:
+        return np.full(len(closes), np.nan)
+
+    first_closes = window[np.arange(len(window)), (~np.isnan(window)).argmax(axis=1)]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return window[:, -1] / first_closes - 1
+
+
+def returns_covariance(returns: np.ndarray) -> np.ndarray:
+    """
+    Pairwise covariance: each pair of coins uses the days both have returns for. A coin without enough returns is
+    given the median variance and no correlation with the other coins.
+    """
+
+    available = ~np.isnan(returns)
+    counts = available.sum(axis=1)
+    centered = np.where(available, returns - _row_means(returns, available, counts)[:, None], 0.0)
+
+    pair_counts = available.astype(np.float64) @ available.T.astype(np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        covariance = (centered @ centered.T) / (pair_counts - 1)
+
+    covariance[pair_counts < 2] = 0.0
+
+    variances = np.diag(covariance).copy()
+    missing = counts < 2
+
+    if missing.any():
+        covariance[missing, :] = 0.0
+        covariance[:, missing] = 0.0
+        variances[missing] = np.median(variances[~missing]) if (~missing).any() else 1.0
+        np.fill_diagonal(covariance, variances)
+
+    return covariance
+
+
+def compute_analytics(symbols: t.List[str], closes: np.ndarray) -> MarketAnalytics:
+    returns = log_returns(closes)
+
+    return MarketAnalytics(
+        symbols=symbols,
+        returns=returns,
+        volatility=realized_volatility(returns),
+        max_drawdown=max_drawdown(closes),
+        momentum=momentum(closes),
+    )
+
+
+def daily_closes(symbols: t.List[str], purchasing_currency: str, count: int) -> np.ndarray:
+    """
+    The last `count` daily closes of each symbol, with a row per symbol. Candles are read from the local kline store,
+    which only requests candles it doesn't have yet.
+    """
+
+    # candles are only available for pairs listed on binance, the rows of other coins are NaN
+    trading_pairs = [symbol + purchasing_currency for symbol in symbols]
+    listed_pairs = [
+        trading_pair
+        for symbol, trading_pair in zip(symbols, trading_pairs)
+        if exchanges.can_buy_in_exchange(SupportedExchanges.BINANCE, symbol, purchasing_currency)
+    ]
+
+    store = kline_store.kline_store()
+    store.sync_many(listed_pairs, "1d", count)
+    closes_by_pair = dict(zip(listed_pairs, store.windows(listed_pairs, "1d", count, kline_store.CLOSE)))
+
+    closes = np.full((len(symbols), count), np.nan)
+
+    for row, trading_pair in enumerate(trading_pairs):
+        if trading_pair in closes_by_pair:
+            closes[row] = closes_by_pair[trading_pair]
+
+    return closes
+
+
+def market_analytics(symbols: t.List[str], purchasing_currency: str, days: t.Optional[int] = None) -> MarketAnalytics:
+    # `days` returns need one more close
+    candle_count = (days or DEFAULT_ANALYTICS_DAYS) + 1
+
+    return compute_analytics(symbols, daily_closes(symbols, purchasing_currency, candle_count))
+
+
+def _row_means(values: np.ndarray, available: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(available, values, 0.0).sum(axis=1) / counts
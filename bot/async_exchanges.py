@@ -0,0 +1,101 @@
+"""
+Asyncio layer over the exchange functions in `exchanges`. The exchange clients are blocking, so each call runs in a
+worker thread. Requests which don't depend on each other can then be awaited together, and a run takes as long as the
+slowest request rather than the sum of all of them.
+
+The synchronous functions in `exchanges` are still the primary interface, these are only used to overlap requests.
+Account data is read through the run's `RunContext`, so data loaded here is reused by the rest of the run.
+"""
+
+import asyncio
+import contextvars
+import functools
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from . import exchanges, market_cap
+from .data_types import CryptoBalance, CryptoData, ExchangeOrder, SupportedExchanges
+from .run_context import RunContext
+from .user import User
+from .utils import log
+
+T = t.TypeVar("T")
+
+
+# the requests are IO bound, so there can be far more of them in flight than there are CPUs. The default executor is
+# sized by CPU count, which would only allow a handful of requests at once on a small worker.
+MAX_CONCURRENT_REQUESTS = 16
+
+_request_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="exchange-request")
+
+
+async def in_thread(func: t.Callable[..., T], *args, **kwargs) -> T:
+    # like `asyncio.to_thread`, the current context is copied into the thread so a pinned market snapshot is still respected
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_request_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+async def portfolio(context: RunContext, exchange: SupportedExchanges) -> t.List[CryptoBalance]:
+    return await in_thread(context.portfolio, exchange)
+
+
+async def open_orders(context: RunContext, exchange: SupportedExchanges) -> t.List[ExchangeOrder]:
+    return await in_thread(context.open_orders, exchange)
+
+
+async def portfolios(context: RunContext) -> t.Dict[SupportedExchanges, t.List[CryptoBalance]]:
+    user_exchanges = context.user.exchanges
+    exchange_portfolios = await asyncio.gather(*(portfolio(context, exchange) for exchange in user_exchanges))
+    return dict(zip(user_exchanges, exchange_portfolios))
+
+
+async def load_market_data(user: User) -> None:
+    """
+    Loads all public market data used by a run, so later lookups are served from the cache.
+    """
+
+    await asyncio.gather(
+        in_thread(market_cap.coinmarketcap_data),
+        in_thread(exchanges.binance_all_prices),
+        *(in_thread(exchanges.tradability_index.pairs, exchange) for exchange in user.exchanges),
+    )
+
+
+async def coins_with_market_cap(context: RunContext) -> t.List[CryptoData]:
+    await load_market_data(context.user)
+
+    # all of the data needed to build the index is cached at this point
+    return context.coins_with_market_cap()
+
+
+async def limit_prices(symbols: t.List[str], purchasing_currency: str) -> t.Dict[str, Decimal]:
+    """
+    Limit prices for a buy list. The order book for every symbol is requested at the same time, rather than a request
+    per coin in sequence, while the last day lows are read from the kline store. The prices are then computed in a
+    single pass.
+
+    Symbols whose order book couldn't be loaded are logged and left out, so one failure doesn't stop the other orders.
+    """
+
+    from . import limit_buy
+
+    trading_pairs = [symbol + purchasing_currency for symbol in symbols]
+    pair_order_books, pair_lows = await asyncio.gather(
+        asyncio.gather(*(in_thread(limit_buy.fetch_order_book, trading_pair) for trading_pair in trading_pairs), return_exceptions=True),
+        in_thread(limit_buy.last_day_lows, trading_pairs),
+    )
+
+    priced_symbols, priced_pairs, order_books, lows = [], [], [], []
+
+    for symbol, trading_pair, order_book, low in zip(symbols, trading_pairs, pair_order_books, pair_lows):
+        if isinstance(order_book, Exception):
+            log.error("unable to load market data for limit price", symbol=trading_pair, error=order_book)
+            continue
+
+        priced_symbols.append(symbol)
+        priced_pairs.append(trading_pair)
+        order_books.append(order_book)
+        lows.append(low)
+
+    return dict(zip(priced_symbols, limit_buy.limit_prices_from_market_data(priced_pairs, order_books, lows)))
@@ -0,0 +1,357 @@
+"""
+Two-tier cache for shared market data.
+
+L1 is a small in-process LRU which holds already-unpickled values, L2 is the django (redis) cache which is
+shared across all workers. Outside of django, L2 is a directory of pickled entries, so repeated CLI runs within
+the freshness window don't need to hit the APIs at all.
+
+Each key gets its own freshness policy: ticker prices go stale in minutes, while exchange metadata rarely changes.
+
+Refreshes of the shared cache are single-flight: a redis lock ensures only one worker recomputes a key, and
+everyone else is served the stale value while the refresh runs. Keys are refreshed early, with a probability
+that increases as expiration approaches, so a refresh usually happens before any worker sees an expired value.
+"""
+
+import math
+import os
+import pickle
+import random
+import re
+import tempfile
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from decouple import config
+
+from .utils import in_django_environment, log
+
+
+class CachePolicy(t.NamedTuple):
+    # seconds a value is considered fresh in the shared cache
+    ttl: int
+    # seconds a value is held in process memory before the shared cache is checked again
+    local_ttl: int
+    # seconds past `ttl` that a stale value can be served while another worker refreshes it
+    stale_ttl: int = 60 * 30
+    # how aggressively to refresh before `ttl` runs out, 0 disables early refreshes
+    early_refresh_beta: float = 1.0
+
+
+DEFAULT_CACHE_POLICY = CachePolicy(ttl=60 * 30, local_ttl=60)
+
+CACHE_POLICIES: t.Dict[str, CachePolicy] = {
+    # prices move constantly, don't hold them for long
+    "binance_price_for_symbol": CachePolicy(ttl=60 * 5, local_ttl=30, stale_ttl=60 * 5),
+    # filters, trading status, etc change very rarely
+    "binance_all_symbol_info": CachePolicy(ttl=60 * 60, local_ttl=60 * 10, stale_ttl=60 * 60 * 6),
+    "coinbase_products": CachePolicy(ttl=60 * 60, local_ttl=60 * 10, stale_ttl=60 * 60 * 6),
+    # each refresh costs coinmarketcap credits, and the market cap ordering moves slowly
+    "coinmarketcap_data": CachePolicy(ttl=60 * 30, local_ttl=60 * 5, stale_ttl=60 * 60),
+    # per pair (i.e. 'order_book:BTCUSD'), only shared between the users buying within the same few seconds
+    "order_book": CachePolicy(ttl=10, local_ttl=5, stale_ttl=5, early_refresh_beta=0),
+}
+
+# upper bound on how long a single refresh is expected to take; the lock expires after this so a crashed worker
+# can't block refreshes forever
+REFRESH_LOCK_TIMEOUT = 60
+
+
+def policy_for_key(key: str) -> CachePolicy:
+    # keys for a specific item use the policy of their prefix, i.e. 'order_book:BTCUSD' uses 'order_book'
+    return CACHE_POLICIES.get(key) or CACHE_POLICIES.get(key.split(":", 1)[0], DEFAULT_CACHE_POLICY)
+
+
+_MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded, thread-safe LRU cache with a per-key expiration
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, t.Tuple[float, t.Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+
+            if entry is _MISSING:
+                return default
+
+            expires_at, value = entry
+
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: t.Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# order books and candles are cached per pair, leave room for a full buy list of each
+local_cache = LocalCache(max_entries=512)
+
+
+class CacheEntry(t.NamedTuple):
+    """
+    What is stored in the shared cache. The shared cache holds entries past `fresh_until` so
+    a stale value is available while a refresh is in progress.
+    """
+
+    value: t.Any
+    # wall clock time, the shared cache is used across processes and machines
+    fresh_until: float
+    # how long it took to compute the value, used to determine when to refresh early
+    compute_seconds: float
+
+
+class FileCache:
+    """
+    Stores each key in its own pickle file. Pickles load far faster than re-parsing the JSON API responses,
+    and writes are atomic (write to a temporary file, then rename) so concurrent runs never read a partial entry.
+
+    Entries are only read by this user's own processes, which is why pickle is safe to use here.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".pickle")
+
+    def get(self, key: str) -> t.Optional[CacheEntry]:
+        try:
+            with open(self._path(key), "rb") as cache_file:
+                entry = pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # a corrupt or incompatible entry is a miss, it'll be overwritten on the next write
+            log.warn("unable to read cache file", key=key, error=e)
+            return None
+
+        return entry if isinstance(entry, CacheEntry) else None
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        except OSError as e:
+            # the cache is an optimization, not being able to write it shouldn't stop the bot
+            log.warn("unable to write cache file", key=key, error=e)
+            return
+
+        try:
+            with os.fdopen(file_descriptor, "wb") as cache_file:
+                pickle.dump(entry, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _default_cache_directory() -> str:
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "crypto-index-fund-bot")
+
+
+# set `CACHE_DIR` to an empty string to disable the file cache
+_cache_directory = config("CACHE_DIR", default=None)
+file_cache: t.Optional[FileCache] = FileCache(_cache_directory or _default_cache_directory()) if _cache_directory != "" else None
+
+
+def should_refresh(entry: CacheEntry, policy: CachePolicy, now: t.Optional[float] = None) -> bool:
+    """
+    Probabilistic early expiration ("XFetch"). As `fresh_until` approaches, the chance of a refresh increases,
+    and values which are expensive to compute are refreshed earlier. With `early_refresh_beta=0` this is a plain
+    expiration check.
+    """
+
+    now = time.time() if now is None else now
+
+    if now >= entry.fresh_until:
+        return True
+
+    if policy.early_refresh_beta <= 0:
+        return False
+
+    # `random()` can return 0, which `log` does not accept
+    early_seconds = -entry.compute_seconds * policy.early_refresh_beta * math.log(max(random.random(), 1e-12))
+    return now + early_seconds >= entry.fresh_until
+
+
+def _compute_entry(key: str, func: t.Callable, policy: CachePolicy) -> CacheEntry:
+    started_at = time.time()
+    value = func()
+    finished_at = time.time()
+
+    log.debug("computed cache value", key=key, seconds=finished_at - started_at)
+
+    return CacheEntry(value=value, fresh_until=finished_at + policy.ttl, compute_seconds=finished_at - started_at)
+
+
+def _store_entry(key: str, entry: CacheEntry, policy: CachePolicy) -> None:
+    from django.core.cache import cache
+
+    cache.set(key, entry, timeout=policy.ttl + policy.stale_ttl)
+    _store_local(key, entry, policy)
+
+
+def _store_local(key: str, entry: CacheEntry, policy: CachePolicy) -> None:
+    # the local copy must not outlive the freshness of the shared copy
+    local_ttl = min(policy.local_ttl, entry.fresh_until - time.time())
+
+    if local_ttl > 0:
+        local_cache.set(key, entry.value, ttl=local_ttl)
+
+
+def _refresh_lock(key: str):
+    from django.core.cache import cache
+
+    return cache.lock(f"{key}:refresh_lock", timeout=REFRESH_LOCK_TIMEOUT)
+
+
+def _release(lock) -> None:
+    from redis.exceptions import LockError
+
+    try:
+        lock.release()
+    except LockError:
+        # the lock expired before the refresh finished, another worker may already be refreshing
+        log.warn("refresh lock expired before release")
+
+
+def _refreshed_entry(key: str, stale_entry: t.Optional[CacheEntry]) -> t.Optional[CacheEntry]:
+    """
+    Returns the shared entry if it was refreshed after `stale_entry` was read and is still fresh
+    """
+
+    from django.core.cache import cache
+
+    entry = cache.get(key)
+
+    if not isinstance(entry, CacheEntry) or time.time() >= entry.fresh_until:
+        return None
+
+    if stale_entry is not None and entry.fresh_until <= stale_entry.fresh_until:
+        return None
+
+    return entry
+
+
+def _refresh_shared_entry(key: str, func: t.Callable, policy: CachePolicy, stale_entry: t.Optional[CacheEntry]) -> t.Any:
+    lock = _refresh_lock(key)
+
+    if lock.acquire(blocking=False):
+        try:
+            # another worker may have finished a refresh between our read and acquiring the lock
+            if (entry := _refreshed_entry(key, stale_entry)) is not None:
+                _store_local(key, entry, policy)
+                return entry.value
+
+            entry = _compute_entry(key, func, policy)
+            _store_entry(key, entry, policy)
+            return entry.value
+        finally:
+            _release(lock)
+
+    # another worker is refreshing this key
+    if stale_entry is not None:
+        log.debug("serving stale value while another worker refreshes", key=key)
+        return stale_entry.value
+
+    # nothing to serve, wait for the other worker to finish and use its result
+    log.debug("waiting for another worker to compute value", key=key)
+
+    if lock.acquire(blocking=True, blocking_timeout=REFRESH_LOCK_TIMEOUT):
+        try:
+            entry = _refreshed_entry(key, stale_entry=None)
+
+            if entry is None:
+                # the other worker failed, compute it ourselves while still holding the lock
+                entry = _compute_entry(key, func, policy)
+                _store_entry(key, entry, policy)
+            else:
+                _store_local(key, entry, policy)
+
+            return entry.value
+        finally:
+            _release(lock)
+
+    # the lock holder is taking far too long; don't block the caller any longer
+    log.warn("timed out waiting for cache refresh, computing value", key=key)
+    return func()
+
+
+def _file_cached_result(key: str, func: t.Callable, policy: CachePolicy) -> t.Any:
+    # without the file cache, the in-process cache avoids hitting the APIs too many times within a single process
+    if file_cache is None:
+        value = func()
+        local_cache.set(key, value, ttl=policy.ttl)
+        return value
+
+    entry = file_cache.get(key)
+
+    # only a single process is expected to be running at once, so there's no need to serve stale values
+    if entry is None or should_refresh(entry, policy):
+        log.debug("file cache refresh required", key=key, stale=entry is not None)
+        entry = _compute_entry(key, func, policy)
+        file_cache.set(key, entry)
+
+    _store_local(key, entry, policy)
+    return entry.value
+
+
+def cached_result(key: str, func: t.Callable):
+    policy = policy_for_key(key)
+
+    if (value := local_cache.get(key, _MISSING)) is not _MISSING:
+        return value
+
+    if not in_django_environment():
+        return _file_cached_result(key, func, policy)
+
+    from django.core.cache import cache
+
+    entry = cache.get(key)
+
+    # values written before entries were wrapped in `CacheEntry` are treated as a miss
+    if not isinstance(entry, CacheEntry):
+        entry = None
+
+    if entry is not None and not should_refresh(entry, policy):
+        _store_local(key, entry, policy)
+        return entry.value
+
+    log.debug("shared cache refresh required", key=key, stale=entry is not None)
+    return _refresh_shared_entry(key, func, policy, stale_entry=entry)
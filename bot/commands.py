@@ -1,12 +1,15 @@
+import asyncio
 import typing as t
 from decimal import Decimal
 
 from . import (
+    async_exchanges,
     convert_stablecoins,
-    exchanges,
     market_buy,
     market_cap,
+    market_snapshot,
     open_orders,
+    order_pipeline,
     portfolio,
 )
 from .data_types import (
@@ -16,6 +19,7 @@ from .data_types import (
     MarketBuyStrategy,
     SupportedExchanges,
 )
+from .run_context import RunContext
 from .user import User
 from .utils import log
 
@@ -23,67 +27,113 @@ from .utils import log
 # TODO not really sure the best pattern for implementing the command/interactor pattern but we are going to give this a try
 class PortfolioCommand:
     @classmethod
-    def execute(cls, user: User) -> t.List[CryptoBalance]:
-        portfolio_target = market_cap.coins_with_market_cap(user)
+    def execute(cls, user: User, context: t.Optional[RunContext] = None) -> t.List[CryptoBalance]:
+        return asyncio.run(cls.execute_async(context or RunContext(user)))
+
+    @classmethod
+    async def execute_async(cls, context: RunContext) -> t.List[CryptoBalance]:
+        user = context.user
+
+        # the index and the user's balances are independent, load them at the same time
+        coins, exchange_portfolios = await asyncio.gather(async_exchanges.coins_with_market_cap(context), async_exchanges.portfolios(context))
+
+        portfolio_target = market_cap.TargetIndex(coins)
         external_portfolio = user.external_portfolio
-        user_portfolio = []
+        user_portfolio: t.List[CryptoBalance] = []
 
         # pull a raw binance reportfolio from exchanges.py and add percentage allocations to it
         for exchange in user.exchanges:
-            user_portfolio = exchanges.portfolio(exchange, user)
+            user_portfolio = exchange_portfolios[exchange]
             # TODO when we actually support multiple exchanges we'll need to do something like this
             # user_portfolio = portfolio.merge_portfolio(user_portfolio, external_portfolio)
 
-        user_portfolio = portfolio.merge_portfolio(user_portfolio, external_portfolio)
-        user_portfolio = portfolio.add_price_to_portfolio(user_portfolio, user.purchasing_currency)
-        user_portfolio = portfolio.portfolio_with_allocation_percentages(user_portfolio)
-        user_portfolio = portfolio.add_missing_assets_to_portfolio(user, user_portfolio, portfolio_target)
-        user_portfolio = portfolio.add_percentage_target_to_portfolio(user_portfolio, portfolio_target)
+        merged_portfolio = portfolio.merge_portfolio(user_portfolio, external_portfolio)
+        merged_portfolio = portfolio.add_price_to_portfolio(merged_portfolio, user.purchasing_currency)
+        merged_portfolio = portfolio.portfolio_with_allocation_percentages(merged_portfolio)
+        merged_portfolio = portfolio.add_missing_assets_to_portfolio(user, merged_portfolio, portfolio_target)
+        merged_portfolio = portfolio.add_percentage_target_to_portfolio(merged_portfolio, portfolio_target)
 
-        # TODO https://github.com/python/typing/issues/760
         # highest percentages first in the output table
-        user_portfolio.sort(key=lambda balance: balance["target_percentage"], reverse=True)
+        merged_portfolio.sort(key=lambda balance: balance.target_percentage, reverse=True)
 
-        return user_portfolio
+        return merged_portfolio.to_list()
 
 
 class SellStablecoinsCommand:
     @classmethod
     # TODO refine return type once we convert the raw exchange order into ExchangeOrder types
-    def execute(cls, user: User) -> t.List[t.Dict]:
+    def execute(cls, user: User, context: t.Optional[RunContext] = None) -> t.List[t.Dict]:
         if not user.convert_stablecoins:
             log.info("user not configured to sell stablecoins")
             return []
 
+        context = context or RunContext(user)
         orders = []
 
         for exchange in user.exchanges:
             log.info("selling stablecoins", exchange=exchange)
-            exchange_portfolio = exchanges.portfolio(exchange, user)
-            orders = orders + convert_stablecoins.convert_stablecoins(user, exchange, exchange_portfolio)
+            exchange_portfolio = context.portfolio(exchange)
+            orders = orders + convert_stablecoins.convert_stablecoins(user, exchange, exchange_portfolio, context=context).orders
 
         return orders
 
 
 class BuyCommand:
-    # TODO we should break this up into smaller functions
     @classmethod
     def execute(
-        cls, user: User, purchase_balance: t.Optional[Decimal] = None
+        cls,
+        user: User,
+        purchase_balance: t.Optional[Decimal] = None,
+        snapshot: t.Optional[market_snapshot.MarketSnapshot] = None,
+        context: t.Optional[RunContext] = None,
     ) -> t.List[t.Tuple[SupportedExchanges, Decimal, t.List[MarketBuy], t.List[ExchangeOrder]]]:
+        """
+        If a market snapshot is provided, all market data (prices, index, exchange info) is read from it
+        and only the user's account data is pulled from the exchange.
+
+        Account data is pulled once per run and reused, unless the run places or cancels an order on the exchange.
+        Pass the context used by `precheck.buy_skip_reason` to reuse the account data it pulled.
+        """
+
+        with market_snapshot.pinned(snapshot):
+            return asyncio.run(cls.execute_async(context or RunContext(user), purchase_balance))
+
+    @classmethod
+    async def _prepare_account(cls, context: RunContext) -> t.Dict[SupportedExchanges, t.List[CryptoBalance]]:
+        """
+        Frees up purchasing currency (stale orders, stablecoins) and returns the resulting balances on each exchange
+        """
+
+        user = context.user
+
         if user.buy_strategy == MarketBuyStrategy.LIMIT and user.cancel_stale_orders:
-            for exchange in user.exchanges:
-                open_orders.cancel_stale_open_orders(user, exchange)
+            await asyncio.gather(
+                *(async_exchanges.in_thread(open_orders.cancel_stale_open_orders, user, exchange, context) for exchange in user.exchanges)
+            )
+
+        await async_exchanges.in_thread(SellStablecoinsCommand.execute, user, context)
+
+        # balances worked out from settled stablecoin sales are recorded on the context and used as is, otherwise any
+        # cancelled orders or sales have invalidated the balances and they are pulled again to reflect the freed up currency
+        return await async_exchanges.portfolios(context)
+
+    # TODO we should break this up into smaller functions
+    @classmethod
+    async def execute_async(
+        cls, context: RunContext, purchase_balance: t.Optional[Decimal] = None
+    ) -> t.List[t.Tuple[SupportedExchanges, Decimal, t.List[MarketBuy], t.List[ExchangeOrder]]]:
+        user = context.user
 
-        SellStablecoinsCommand.execute(user)
+        # public market data doesn't depend on the account, so it is loaded while the account is prepared
+        coins, exchange_portfolios = await asyncio.gather(async_exchanges.coins_with_market_cap(context), cls._prepare_account(context))
 
         # calculates the porfolio target across all supported exchanges
-        portfolio_target = market_cap.coins_with_market_cap(user)
-        merged_portfolio = user.external_portfolio
+        portfolio_target = market_cap.TargetIndex(coins)
+        merged_portfolio = portfolio.Portfolio.from_balances(user.external_portfolio)
         purchase_balance_for_exchange: t.Dict[SupportedExchanges, Decimal] = {}
 
         for exchange in user.exchanges:
-            exchange_portfolio = exchanges.portfolio(exchange, user)
+            exchange_portfolio = exchange_portfolios[exchange]
 
             # TODO we need to determine how coinbase handles purchasing currencies
 
@@ -120,9 +170,11 @@ class BuyCommand:
                 target_portfolio=portfolio_target,
                 purchase_balance=exchange_purchase_balance,
                 exchange=exchange,
+                context=context,
             )
 
-            completed_orders = market_buy.make_market_buys(user, market_buys)
+            # each order is priced and submitted concurrently, results are in the same order as `market_buys`
+            completed_orders = await order_pipeline.execute_market_buys(context, market_buys)
 
             results_by_exchange.append((exchange, exchange_purchase_balance, market_buys, completed_orders))
 
@@ -1,46 +1,52 @@
-import time
 import typing as t
 from decimal import Decimal
 
-from . import exchanges
-from .data_types import CryptoBalance, SupportedExchanges
+from . import exchanges, order_fills, user_data_stream
+from .data_types import CryptoBalance, ExchangeOrder, SupportedExchanges
+from .run_context import RunContext
 from .user import User
 from .utils import log
 
+# the proceeds credited when balances are worked out from fills, leaving room for the trading fee. Anything left over is
+# picked up by the next run.
+PROCEEDS_FEE_ALLOWANCE = Decimal("0.001")
 
-def wait_until_orders_cleared(user: User, orders) -> None:
-    client = user.binance_client()
 
-    for i in range(5):
-        latest_orders = [client.get_order(orderId=order["id"], symbol=order["trading_pair"]) for order in orders]
+class StablecoinConversion(t.NamedTuple):
+    orders: t.List[t.Dict]
+    fill_state: order_fills.FillState
 
-        if all([order["status"] == client.ORDER_STATUS_FILLED for order in latest_orders]):
-            break
 
-        log.info("waiting for orders to clear", attempt=i)
-        time.sleep(i**i)
+def wait_until_orders_cleared(user: User, orders: t.List[ExchangeOrder]) -> order_fills.FillState:
+    # fills pushed by the user data stream are seen immediately, the exchange is polled when the stream isn't connected
+    fill_state = order_fills.wait_for_fills(user, orders, updates=user_data_stream.order_update_source(user))
 
+    # whatever has filled is already in the account balance, so the run continues rather than failing
+    if not fill_state.is_settled:
+        log.warn("stablecoin conversions did not settle", pending=fill_state.pending, proceeds=fill_state.quote_quantity)
 
-# TODO is this required across all exchanges? Or is this just a binance thing?
-def convert_stablecoins(user: User, exchange: SupportedExchanges, portfolio: t.List[CryptoBalance]) -> t.List[t.Dict]:
-    """
-    convert all stablecoins of the purchasing currency into the purchasing currency so we can use it
-    in binance, you need to purchase in USD and cannot purchase most currencies from a stablecoin
-    """
-    purchasing_currency = user.purchasing_currency
-    stablecoin_symbols = []
+    return fill_state
 
+
+def stablecoin_symbols(purchasing_currency: str) -> t.List[str]:
     # TODO check if currency is a stablecoin? Can we do this programmatically?
 
     if purchasing_currency == "USD":
-        stablecoin_symbols = ["USDC", "USDT", "BUSD"]
-    else:
-        raise Exception("unexpected purchasing currency input")
+        return ["USDC", "USDT", "BUSD"]
 
-    orders = []
+    raise Exception("unexpected purchasing currency input")
+
+
+def stablecoin_conversions(user: User, exchange: SupportedExchanges, portfolio: t.List[CryptoBalance]) -> t.List[t.Tuple[str, Decimal]]:
+    """
+    Symbol and amount of each stablecoin balance which is large enough to be converted into the purchasing currency
+    """
+
+    conversions = []
     exchange_purchase_min = exchanges.purchase_minimum(exchange)
+    convertible_symbols = stablecoin_symbols(user.purchasing_currency)
 
-    stablecoin_portfolio = [balance for balance in portfolio if balance["symbol"] in stablecoin_symbols]
+    stablecoin_portfolio = [balance for balance in portfolio if balance["symbol"] in convertible_symbols]
 
     for balance in stablecoin_portfolio:
         # TODO dynamically calculate the holdback based on the exchange definition
@@ -52,13 +58,68 @@ def convert_stablecoins(user: User, exchange: SupportedExchanges, portfolio: t.L
             log.info("cannot convert stablecoin, not above minimum", min=exchange_purchase_min, symbol=symbol, amount=amount)
             continue
 
+        conversions.append((symbol, amount))
+
+    return conversions
+
+
+def portfolio_after_conversions(user: User, portfolio: t.List[CryptoBalance], fill_state: order_fills.FillState) -> t.List[CryptoBalance]:
+    """
+    `portfolio` with the filled stablecoin conversions applied: the sold stablecoins are removed and the proceeds added
+    to the purchasing currency
+    """
+
+    amounts = {balance["symbol"]: balance["amount"] for balance in portfolio}
+
+    for fill in fill_state.fills.values():
+        # i.e. 'USDCUSD' sells USDC for USD
+        sold_symbol = fill.trading_pair[: -len(user.purchasing_currency)]
+
+        amounts[sold_symbol] = amounts.get(sold_symbol, Decimal(0)) - fill.executed_quantity
+        amounts[user.purchasing_currency] = amounts.get(user.purchasing_currency, Decimal(0)) + fill.quote_quantity * (1 - PROCEEDS_FEE_ALLOWANCE)
+
+    return [
+        CryptoBalance(
+            symbol=symbol,
+            amount=amount,
+            usd_price=Decimal(0),
+            usd_total=Decimal(0),
+            percentage=Decimal(0),
+            target_percentage=Decimal(0),
+        )
+        for symbol, amount in amounts.items()
+        if amount > 0
+    ]
+
+
+# TODO is this required across all exchanges? Or is this just a binance thing?
+def convert_stablecoins(
+    user: User, exchange: SupportedExchanges, portfolio: t.List[CryptoBalance], context: t.Optional[RunContext] = None
+) -> StablecoinConversion:
+    """
+    convert all stablecoins of the purchasing currency into the purchasing currency so we can use it
+    in binance, you need to purchase in USD and cannot purchase most currencies from a stablecoin
+
+    Once the conversions settle, the resulting balances are recorded on the context, so the buys start with the
+    proceeds without pulling the account again.
+    """
+
+    context = context or RunContext(user)
+    orders = []
+
+    for symbol, amount in stablecoin_conversions(user, exchange, portfolio):
         log.info("converting stablecoins", symbol=symbol, amount=amount)
 
-        order = exchanges.market_sell(exchange=exchange, user=user, symbol=symbol, amount=amount, purchasing_currency=purchasing_currency)
-        orders.append(order)
+        order = context.market_sell(exchange=exchange, symbol=symbol, amount=amount, purchasing_currency=user.purchasing_currency)
+
+        # in testmode, or if the order was rejected, there is no order to wait on
+        if order:
+            orders.append(order)
 
-    wait_until_orders_cleared(user, orders)
+    fill_state = wait_until_orders_cleared(user, orders)
 
-    # TODO convert to ExchangeOrder
+    # unsettled orders still hold part of the stablecoin balance, the account is pulled again to see where they stand
+    if orders and fill_state.is_settled:
+        context.record_portfolio(exchange, portfolio_after_conversions(user, portfolio, fill_state))
 
-    return orders
+    return StablecoinConversion(orders=orders, fill_state=fill_state)
@@ -17,7 +17,10 @@ class MarketBuyStrategy(str, enum.Enum):
 class MarketIndexStrategy(str, enum.Enum):
     MARKET_CAP = "market_cap"
     SQRT_MARKET_CAP = "sqrt_market_cap"
+    EQUAL_WEIGHT = "equal_weight"
     SMA = "sma"
+    INVERSE_VOLATILITY = "inverse_volatility"
+    RISK_PARITY = "risk_parity"
 
 
 class OrderType(str, enum.Enum):
@@ -29,6 +32,17 @@ class OrderTimeInForce(str, enum.Enum):
     GTC = "GTC"
 
 
+# https://binance-docs.github.io/apidocs/spot/en/#public-api-definitions
+class OrderStatus(str, enum.Enum):
+    NEW = "NEW"
+    PARTIALLY_FILLED = "PARTIALLY_FILLED"
+    FILLED = "FILLED"
+    CANCELED = "CANCELED"
+    PENDING_CANCEL = "PENDING_CANCEL"
+    REJECTED = "REJECTED"
+    EXPIRED = "EXPIRED"
+
+
 ExchangeOrder = typing.TypedDict(
     "ExchangeOrder",
     {
@@ -26,6 +26,15 @@ def purchase_minimum(exchange: SupportedExchanges) -> Decimal:
     return mapping[exchange]()
 
 
+def minimum_order_amount(exchange: SupportedExchanges, symbol: str, purchasing_currency: str) -> Decimal:
+    mapping = {
+        SupportedExchanges.BINANCE: binance_minimum_order_amount,
+        # SupportedExchanges.COINBASE: coinbase_minimum_order_amount,
+    }
+
+    return mapping[exchange](symbol, purchasing_currency)
+
+
 def open_orders(exchange: SupportedExchanges, user: User) -> t.List[ExchangeOrder]:
     mapping = {
         SupportedExchanges.BINANCE: binance_open_orders,
@@ -71,12 +80,53 @@ def market_buy(exchange: SupportedExchanges, user: User, purchasing_currency: st
     return mapping[exchange](user, symbol, purchasing_currency, amount)
 
 
+class TradabilityIndex:
+    """
+    Answers "can (base asset) be bought with (quote asset) on (exchange)" with set lookups.
+
+    Each exchange's pairs are pulled from that exchange's metadata, which is only loaded when the exchange is first
+    used. The pair sets are rebuilt by the exchange modules whenever their metadata is refreshed.
+    """
+
+    def __init__(self, pair_loaders: t.Dict[SupportedExchanges, t.Callable[[], t.AbstractSet[t.Tuple[str, str]]]]):
+        self._pair_loaders = pair_loaders
+
+    def pairs(self, exchange: SupportedExchanges) -> t.AbstractSet[t.Tuple[str, str]]:
+        return self._pair_loaders[exchange]()
+
+    def can_buy(self, exchange: SupportedExchanges, symbol: str, purchasing_currency: str) -> bool:
+        return (symbol, purchasing_currency) in self.pairs(exchange)
+
+    def exchanges_with_symbol(
+        self, symbol: str, purchasing_currency: str, candidate_exchanges: t.Optional[t.Iterable[SupportedExchanges]] = None
+    ) -> t.List[SupportedExchanges]:
+        if candidate_exchanges is None:
+            candidate_exchanges = SupportedExchanges
+
+        return [exchange for exchange in candidate_exchanges if self.can_buy(exchange, symbol, purchasing_currency)]
+
+    def base_assets(self, exchange: SupportedExchanges, purchasing_currency: t.Optional[str] = None) -> t.Set[str]:
+        """
+        All symbols listed on the exchange, optionally limited to those that can be bought with `purchasing_currency`
+        """
+
+        return {base for base, quote in self.pairs(exchange) if purchasing_currency is None or quote == purchasing_currency}
+
+
+tradability_index = TradabilityIndex(
+    {
+        SupportedExchanges.BINANCE: binance_tradable_pairs,
+        SupportedExchanges.COINBASE: coinbase_tradable_pairs,
+    }
+)
+
+
 def exchanges_with_symbol(symbol: str, purchasing_currency: str) -> t.List[SupportedExchanges]:
     """
     This method is used to determine which exchange trades a given symbol
     """
 
-    return [exchange for exchange in SupportedExchanges if can_buy_in_exchange(exchange, symbol, purchasing_currency)]
+    return tradability_index.exchanges_with_symbol(symbol, purchasing_currency)
 
 
 def is_trading_active_for_coin_in_exchange(exchange: SupportedExchanges, paired_symbol: str, purchasing_currency: str) -> bool:
@@ -94,9 +144,7 @@ def is_trading_active_for_coin_in_exchange(exchange: SupportedExchanges, paired_
 
 
 def can_buy_in_exchange(exchange: SupportedExchanges, symbol: str, purchasing_currency: str) -> bool:
-    mapping = {"binance": can_buy_in_binance, "coinbase": can_buy_in_coinbase}
-
-    return mapping[exchange](symbol, purchasing_currency)
+    return tradability_index.can_buy(exchange, symbol, purchasing_currency)
 
 
 def price_of_symbol(symbol: str, purchasing_currency: str) -> Decimal:
@@ -0,0 +1,218 @@
+"""
+Index weighting engines. Weights are calculated with float64 arrays and only converted back to `Decimal`
+when the index (`CryptoData`) is built.
+
+Fractional `Decimal` powers are very slow, and an index can include up to 1000 coins. float64 carries ~15 significant
+digits, which is far more precision than is needed to allocate a portfolio: percentages are quantized to
+`PERCENTAGE_QUANTUM` and are within `PERCENTAGE_TOLERANCE` percentage points of the same calculation done with `Decimal`.
+"""
+
+import typing as t
+from decimal import Decimal
+
+import numpy as np
+
+from .data_types import MarketIndexStrategy
+from .utils import log
+
+if t.TYPE_CHECKING:
+    from .analytics import MarketAnalytics
+
+PERCENTAGE_QUANTUM = Decimal("1e-12")
+PERCENTAGE_TOLERANCE = Decimal("1e-10")
+
+# guards against dividing by zero for a coin whose price hasn't moved at all
+MINIMUM_VOLATILITY = 1e-6
+
+# the covariance of a large index from a few months of daily returns is noisy and singular, shrinking it towards the
+# variances makes the risk parity weights well defined
+RISK_PARITY_SHRINKAGE = 0.5
+# the undamped iteration oscillates when coins are highly correlated, which most coins are
+RISK_PARITY_DAMPING = 0.5
+RISK_PARITY_MAX_ITERATIONS = 500
+RISK_PARITY_TOLERANCE = 1e-10
+
+
+class IndexWeights(t.NamedTuple):
+    # market caps after the strategy's adjustment, i.e. the square root of the market cap for `SQRT_MARKET_CAP`
+    adjusted_market_caps: np.ndarray
+    # % of the index, sums to 100
+    percentages: np.ndarray
+
+
+def market_cap_array(market_caps: t.Iterable[t.Union[Decimal, float, int]]) -> np.ndarray:
+    return np.fromiter((float(market_cap) for market_cap in market_caps), dtype=np.float64)
+
+
+def root_market_caps(market_caps: np.ndarray, root: float) -> np.ndarray:
+    return np.power(market_caps, 1.0 / root)
+
+
+def percentages_from_weights(weights: np.ndarray) -> np.ndarray:
+    if len(weights) == 0:
+        return weights
+
+    return weights / weights.sum() * 100
+
+
+def equal_percentages(count: int) -> np.ndarray:
+    return np.full(count, 100.0 / count) if count else np.zeros(0)
+
+
+def capped_percentages(percentages: np.ndarray, weight_cap: float) -> np.ndarray:
+    """
+    Limit each coin to `weight_cap`% of the index. The excess is redistributed proportionally to the coins under
+    the cap, which can push additional coins over the cap, so this is repeated until every coin is under the cap.
+    """
+
+    count = len(percentages)
+
+    if weight_cap * count < 100:
+        log.warn("weight cap is too small for the size of the index, using equal weights", weight_cap=weight_cap, count=count)
+        return equal_percentages(count)
+
+    percentages = percentages.copy()
+    capped = np.zeros(count, dtype=bool)
+
+    # each iteration caps at least one additional coin
+    for _ in range(count):
+        over_cap = ~capped & (percentages > weight_cap)
+
+        if not over_cap.any():
+            break
+
+        excess = (percentages[over_cap] - weight_cap).sum()
+        percentages[over_cap] = weight_cap
+        capped |= over_cap
+
+        uncapped = ~capped
+        uncapped_total = percentages[uncapped].sum()
+
+        if uncapped_total > 0:
+            percentages[uncapped] += excess * percentages[uncapped] / uncapped_total
+        else:
+            # remaining coins have no weight, they split the excess evenly
+            percentages[uncapped] += excess / uncapped.sum()
+
+    return percentages
+
+
+def sma_market_caps(market_caps: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """
+    Market caps averaged over the window of daily `closes`, which has a row for each coin.
+
+    Supply changes slowly compared to price, so the average market cap is the current market cap scaled by the average
+    close over the latest close. Coins without any candles keep their current market cap.
+    """
+
+    available = ~np.isnan(closes)
+    candle_counts = available.sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average_closes = np.where(available, closes, 0.0).sum(axis=1) / candle_counts
+        price_ratios = average_closes / closes[:, -1] if closes.shape[1] else np.full(len(market_caps), np.nan)
+
+    return market_caps * np.where(np.isfinite(price_ratios), price_ratios, 1.0)
+
+
+def inverse_volatility_percentages(volatility: np.ndarray) -> np.ndarray:
+    """
+    Each coin is weighted by the inverse of its volatility. Coins without enough history to measure their volatility
+    are given the median volatility of the index.
+    """
+
+    missing = np.isnan(volatility)
+
+    if missing.all():
+        log.warn("no volatility data for the index, using equal weights", count=len(volatility))
+        return equal_percentages(len(volatility))
+
+    volatility = np.where(missing, np.median(volatility[~missing]), volatility)
+    return percentages_from_weights(1.0 / np.maximum(volatility, MINIMUM_VOLATILITY))
+
+
+def risk_parity_percentages(covariance: np.ndarray) -> np.ndarray:
+    """
+    Equal risk contribution: unlike inverse volatility, correlations are accounted for, so every coin contributes the
+    same amount to the variance of the index.
+
+    Each coin's condition, `x_i * (covariance @ x)_i == 1 / n`, is a quadratic in `x_i`. Every coin is solved at once
+    using the previous iteration's values for the other coins, until the weights stop changing.
+    """
+
+    count = len(covariance)
+
+    if count == 0:
+        return np.zeros(0)
+
+    variances = np.maximum(np.diag(covariance), MINIMUM_VOLATILITY**2)
+    covariance = (1 - RISK_PARITY_SHRINKAGE) * covariance + RISK_PARITY_SHRINKAGE * np.diag(variances)
+    risk_budget = 1.0 / count
+
+    # inverse volatility is exact for uncorrelated coins, which makes it a good starting point
+    weights = 1.0 / np.sqrt(variances)
+
+    for _ in range(RISK_PARITY_MAX_ITERATIONS):
+        # contribution from every other coin
+        others = covariance @ weights - variances * weights
+        solved_weights = (-others + np.sqrt(others**2 + 4 * variances * risk_budget)) / (2 * variances)
+        next_weights = RISK_PARITY_DAMPING * solved_weights + (1 - RISK_PARITY_DAMPING) * weights
+
+        converged = np.abs(next_weights - weights).max() <= RISK_PARITY_TOLERANCE * next_weights.max()
+        weights = next_weights
+
+        if converged:
+            break
+    else:
+        log.warn("risk parity weights did not converge", count=count)
+
+    return percentages_from_weights(weights)
+
+
+def index_weights(
+    market_caps: np.ndarray,
+    strategy: MarketIndexStrategy,
+    sqrt_adjustment: t.Union[None, str] = None,
+    weight_cap: t.Union[None, float, Decimal] = None,
+    market_analytics: t.Optional["MarketAnalytics"] = None,
+) -> IndexWeights:
+    """
+    `market_analytics` is required by the strategies which weight coins by their risk
+    """
+
+    if strategy in (MarketIndexStrategy.INVERSE_VOLATILITY, MarketIndexStrategy.RISK_PARITY):
+        assert market_analytics is not None, f"{strategy} requires market analytics"
+
+        adjusted_market_caps = market_caps
+
+        if strategy == MarketIndexStrategy.INVERSE_VOLATILITY:
+            percentages = inverse_volatility_percentages(market_analytics.volatility)
+        else:
+            percentages = risk_parity_percentages(market_analytics.covariance())
+    elif strategy == MarketIndexStrategy.SQRT_MARKET_CAP:
+        # sqrt() == ^0.5, the adjustment allows for any root
+        root = float(sqrt_adjustment) if sqrt_adjustment else 2.0
+        adjusted_market_caps = root_market_caps(market_caps, root)
+        percentages = percentages_from_weights(adjusted_market_caps)
+    elif strategy == MarketIndexStrategy.EQUAL_WEIGHT:
+        adjusted_market_caps = market_caps
+        percentages = equal_percentages(len(market_caps))
+    else:
+        adjusted_market_caps = market_caps
+        percentages = percentages_from_weights(market_caps)
+
+    if weight_cap:
+        percentages = capped_percentages(percentages, float(weight_cap))
+
+    return IndexWeights(adjusted_market_caps=adjusted_market_caps, percentages=percentages)
+
+
+def to_decimal(value: float, quantum: t.Optional[Decimal] = None) -> Decimal:
+    # `Decimal(float)` is the exact binary value, which has a long tail of meaningless digits; the shortest
+    # repr round-trips to the same float without them
+    decimal_value = Decimal(repr(float(value)))
+    return decimal_value.quantize(quantum) if quantum is not None else decimal_value
+
+
+def to_decimal_percentage(value: float) -> Decimal:
+    return to_decimal(value, PERCENTAGE_QUANTUM)
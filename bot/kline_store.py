@@ -0,0 +1,210 @@
+"""
+Local store of exchange candles (klines), kept in SQLite so candle history is only requested once.
+
+Each sync only requests candles newer than the last stored candle for a pair, and a pair which was synced recently
+isn't requested at all. A pair listed recently has fewer candles than a full window, the store remembers that it
+holds every candle the exchange has so the pair isn't backfilled again. Reads return numpy arrays, so windows for a whole index can be computed at once.
+
+The store is a file in the cache directory, and is in memory when the file cache is disabled (`CACHE_DIR=""`).
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+import time
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from decouple import config
+
+from . import cache
+from .utils import log
+
+INTERVAL_SECONDS = {"1h": 60 * 60, "1d": 60 * 60 * 24}
+
+# how long a sync is trusted before the exchange is checked for newer candles
+SYNC_TTL_SECONDS = {"1h": 60, "1d": 60 * 10}
+
+# binance returns at most 1000 candles per request
+MAX_CANDLES_PER_REQUEST = 1000
+
+# the requests are IO bound, but all of them count against the same rate limit
+MAX_CONCURRENT_SYNCS = 8
+
+# columns of the arrays returned by `window`
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(5)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS klines (
+    trading_pair TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    open_time INTEGER NOT NULL,
+    open REAL NOT NULL,
+    high REAL NOT NULL,
+    low REAL NOT NULL,
+    close REAL NOT NULL,
+    volume REAL NOT NULL,
+    PRIMARY KEY (trading_pair, interval, open_time)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    trading_pair TEXT NOT NULL,
+    interval TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    -- every candle the exchange has from this open time onwards is stored, set by a full fetch
+    covered_from INTEGER,
+    PRIMARY KEY (trading_pair, interval)
+) WITHOUT ROWID;
+"""
+
+
+class StoredState(t.NamedTuple):
+    synced_at: t.Optional[float]
+    covered_from: t.Optional[int]
+    latest_open_time: t.Optional[int]
+    stored_count: int
+
+
+class KlineStore:
+    def __init__(self, path: str, fetch_klines: t.Callable[..., t.List[t.List]], clock: t.Callable[[], float] = time.time):
+        self.path = path
+        self._fetch_klines = fetch_klines
+        self._clock = clock
+
+        # a single connection is shared by every thread, the lock serializes access to it
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+        if path != ":memory:":
+            # other processes (i.e. workers) can read while a sync is writing
+            self._connection.execute("PRAGMA journal_mode=WAL")
+
+        self._connection.executescript(SCHEMA)
+
+        # stores created before `covered_from` was added
+        sync_state_columns = [column[1] for column in self._connection.execute("PRAGMA table_info(sync_state)")]
+
+        if "covered_from" not in sync_state_columns:
+            self._connection.execute("ALTER TABLE sync_state ADD COLUMN covered_from INTEGER")
+
+    def _stored_state(self, trading_pair: str, interval: str) -> StoredState:
+        with self._lock:
+            sync_state = self._connection.execute(
+                "SELECT synced_at, covered_from FROM sync_state WHERE trading_pair = ? AND interval = ?", (trading_pair, interval)
+            ).fetchone()
+            latest_open_time, stored_count = self._connection.execute(
+                "SELECT MAX(open_time), COUNT(*) FROM klines WHERE trading_pair = ? AND interval = ?", (trading_pair, interval)
+            ).fetchone()
+
+        synced_at, covered_from = sync_state or (None, None)
+        return StoredState(synced_at, covered_from, latest_open_time, stored_count)
+
+    def sync(self, trading_pair: str, interval: str, count: int) -> None:
+        """
+        Stores candles newer than the last stored candle. A pair whose stored candles don't cover the last `count`
+        intervals is backfilled with the last `count` candles.
+        """
+
+        now = self._clock()
+        state = self._stored_state(trading_pair, interval)
+        window_start_time = int((now - count * INTERVAL_SECONDS[interval]) * 1000)
+
+        # a pair listed fewer than `count` intervals ago never has `count` candles, but a full fetch stored all it has
+        is_covered = state.stored_count >= count or (state.covered_from is not None and state.covered_from <= window_start_time)
+
+        if state.synced_at is not None and now - state.synced_at < SYNC_TTL_SECONDS[interval] and is_covered:
+            return
+
+        if state.latest_open_time is not None and is_covered:
+            # the latest candle was probably still open when it was stored, so it is requested again
+            start_time = state.latest_open_time
+            covered_from = state.covered_from
+        else:
+            start_time = window_start_time
+            covered_from = window_start_time
+
+        candles: t.List[t.List] = []
+
+        while True:
+            page = self._fetch_klines(symbol=trading_pair, interval=interval, startTime=start_time, limit=MAX_CANDLES_PER_REQUEST)
+            candles.extend(page)
+
+            if len(page) < MAX_CANDLES_PER_REQUEST:
+                break
+
+            start_time = page[-1][0] + 1
+
+        log.debug("synced klines", trading_pair=trading_pair, interval=interval, count=len(candles))
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO klines VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (trading_pair, interval, int(candle[0]), float(candle[1]), float(candle[2]), float(candle[3]), float(candle[4]), float(candle[5]))
+                    for candle in candles
+                ],
+            )
+            self._connection.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)", (trading_pair, interval, now, covered_from))
+
+    def sync_many(self, trading_pairs: t.List[str], interval: str, count: int) -> None:
+        """
+        Pairs are synced concurrently. A pair which fails to sync is logged and keeps whatever was already stored.
+        """
+
+        def sync(trading_pair: str) -> None:
+            try:
+                self.sync(trading_pair, interval, count)
+            except Exception as e:
+                log.error("unable to sync klines", trading_pair=trading_pair, interval=interval, error=e)
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SYNCS, thread_name_prefix="kline-sync") as executor:
+            list(executor.map(sync, trading_pairs))
+
+    def window(self, trading_pair: str, interval: str, count: int) -> np.ndarray:
+        """
+        The last `count` stored candles, oldest first. Each row is open, high, low, close and volume.
+        """
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT open, high, low, close, volume FROM klines WHERE trading_pair = ? AND interval = ? ORDER BY open_time DESC LIMIT ?",
+                (trading_pair, interval, count),
+            ).fetchall()
+
+        return np.array(rows[::-1], dtype=np.float64).reshape(-1, 5)
+
+    def windows(self, trading_pairs: t.List[str], interval: str, count: int, column: int) -> np.ndarray:
+        """
+        A single column (i.e. `CLOSE`) of the last `count` candles of each pair, with a row per pair. Rows are aligned
+        to the latest candle, pairs with fewer candles are padded with NaN at the start.
+        """
+
+        values = np.full((len(trading_pairs), count), np.nan)
+
+        for row, trading_pair in enumerate(trading_pairs):
+            pair_values = self.window(trading_pair, interval, count)[:, column]
+
+            if len(pair_values):
+                values[row, -len(pair_values) :] = pair_values
+
+        return values
+
+
+def _default_store_path() -> str:
+    if cache.file_cache is None:
+        return ":memory:"
+
+    os.makedirs(cache.file_cache.directory, mode=0o700, exist_ok=True)
+    return os.path.join(cache.file_cache.directory, "klines.sqlite3")
+
+
+@functools.cache
+def kline_store() -> KlineStore:
+    def fetch_klines(**params) -> t.List[t.List]:
+        from .supported_exchanges.binance import public_binance_client
+
+        return public_binance_client().get_klines(**params)
+
+    return KlineStore(config("KLINE_STORE_PATH", default=None) or _default_store_path(), fetch_klines)
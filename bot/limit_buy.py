@@ -1,65 +1,113 @@
+import typing as t
 from decimal import Decimal
 
-from . import exchanges
-from .user import User
+import numpy as np
+
+from . import cache, exchanges, index_weighting, kline_store, market_data_stream
 from .utils import log
 
 # TODO this logic isn't scientific in any way, mostly a playground
 
+# multiple of the lowest ask which a limit order is placed at, at most
+MAXIMUM_ASK_MULTIPLE = Decimal(0.97)
 
-def determine_limit_price(user: User, symbol: str, purchasing_currency: str) -> Decimal:
-    # TODO this is binance-specific right now, refactor this out
-
-    trading_pair = symbol + purchasing_currency
+# the candles are hourly, so this covers the last day
+CANDLES_PER_DAY = 24
 
-    client = user.binance_client()
 
+def fetch_order_book(trading_pair: str) -> t.Dict:
     # order depth returns the lowest asks and the highest bids
     # increasing limits returns lower bids and higher asks
     # grab a long-ish order book to get some analytics on the order book
 
-    order_book = client.get_order_book(symbol=trading_pair, limit=100)
+    # only the top of the book is used for pricing, which the market data stream keeps current
+    if book_top := market_data_stream.streamed_book_top(trading_pair):
+        return {"bids": [[book_top.bid, book_top.bid_quantity]], "asks": [[book_top.ask, book_top.ask_quantity]]}
+
+    # most users buy the same coins within the same cycle, so the book is shared across users for a few seconds
+    return cache.cached_result(
+        f"order_book:{trading_pair}",
+        lambda: exchanges.public_binance_client().get_order_book(symbol=trading_pair, limit=100),
+    )
+
+
+def determine_limit_price(symbol: str, purchasing_currency: str) -> Decimal:
+    # TODO this is binance-specific right now, refactor this out
+
+    trading_pair = symbol + purchasing_currency
+
+    return limit_price_from_market_data(trading_pair, fetch_order_book(trading_pair), last_day_lows([trading_pair])[0])
+
+
+def limit_price_from_market_data(trading_pair: str, order_book: t.Dict, last_day_low: t.Optional[Decimal]) -> Decimal:
+    """
+    Calculates the limit price from an order book and the low over the last day, which can be loaded concurrently
+    """
+
+    return limit_prices_from_market_data([trading_pair], [order_book], [last_day_low])[0]
+
+
+def limit_prices_from_market_data(
+    trading_pairs: t.List[str], order_books: t.List[t.Dict], last_day_lows: t.List[t.Optional[Decimal]]
+) -> t.List[Decimal]:
+    """
+    Limit prices for a whole buy list, the analytics for every pair are computed at once.
+
+    The analytics are computed with floats, but each price is one of the exact decimal values it was chosen from.
+    """
+
+    if not trading_pairs:
+        return []
 
     # price that binance reports is at the bottom of the order book
     # looks like they use the bottom of the ask stack to clear market orders (makes sense)
     # cannot determine if the orders in the book are market, limit, or other order types.
     # I wonder if other exchanges expose that sort of information?
-    lowest_ask = order_book["asks"][0][0]
-    highest_bid = order_book["bids"][0][0]
-
-    ask_difference = Decimal(highest_bid) - Decimal(lowest_ask)
+    lowest_asks = [Decimal(order_book["asks"][0][0]) for order_book in order_books]
+    highest_bids = [Decimal(order_book["bids"][0][0]) for order_book in order_books]
 
     # TODO can we inspect the low price and determine the volume that was traded at that price point?
-    last_day_low = low_over_last_day(user, trading_pair)
-
-    log.warn(
-        "price analytics",
-        symbol=trading_pair,
-        ask_bid_difference=ask_difference,
-        ask_bid_percentage_difference=ask_difference / Decimal(lowest_ask) * -100,
-        last_day_low_difference=100 - (last_day_low / Decimal(lowest_ask) * 100),
-        bid=highest_bid,
-        ask=lowest_ask,
-        last_day_low=last_day_low,
-        reported_price=exchanges.binance_price_for_symbol(trading_pair),
-    )
+    # a pair without candles has no low, which never wins the `min`
+    lows = np.array([np.inf if low is None else float(low) for low in last_day_lows], dtype=np.float64)
+    asks = np.array(lowest_asks, dtype=np.float64)
+    bids = np.array(highest_bids, dtype=np.float64)
+
+    ask_differences = bids - asks
 
     # TODO calculate momentum, or low price over last 24hrs, to determine the ideal drop price
     # TODO pull percentage drop attempt from user model
 
-    limit_price = min(Decimal(highest_bid), Decimal(lowest_ask) * Decimal(0.97))
-    limit_price = min(last_day_low, limit_price)
+    # each row holds the candidate prices for a pair, the lowest one is used. On a tie the earlier column wins, which
+    # prefers the last day low, then the highest bid
+    chosen_columns = np.column_stack((lows, bids, asks * float(MAXIMUM_ASK_MULTIPLE))).argmin(axis=1)
+    candidates = zip(last_day_lows, highest_bids, (ask * MAXIMUM_ASK_MULTIPLE for ask in lowest_asks))
+
+    for index, trading_pair in enumerate(trading_pairs):
+        log.warn(
+            "price analytics",
+            symbol=trading_pair,
+            ask_bid_difference=ask_differences[index],
+            ask_bid_percentage_difference=ask_differences[index] / asks[index] * -100,
+            last_day_low_difference=100 - (lows[index] / asks[index] * 100),
+            bid=highest_bids[index],
+            ask=lowest_asks[index],
+            last_day_low=last_day_lows[index],
+            reported_price=exchanges.binance_price_for_symbol(trading_pair),
+        )
 
     # TODO can we inspect the order book depth here? Or general liquidity for the market?
     #      what else can we do to improve our purchase strategy?
 
     # TODO add option to use the midpoint, or some other position, of the order book instead of the lowest ask
 
-    return limit_price
+    return [row[column] for row, column in zip(candidates, chosen_columns)]
 
 
-def low_over_last_day(user: User, trading_pair: str) -> Decimal:
-    # import datetime
+def last_day_lows(trading_pairs: t.List[str]) -> t.List[t.Optional[Decimal]]:
+    """
+    The low of each pair over the last day of hourly candles, read from the kline store in a single pass. `None` for a
+    pair without stored candles, i.e. when they couldn't be synced.
+    """
 
     # TODO coinbase option is below, but ran into some issues with it that I can't remember
     # candles = coinbase_public_client.get_product_historic_rates(
@@ -69,26 +117,9 @@ def low_over_last_day(user: User, trading_pair: str) -> Decimal:
     #   stop=datetime.datetime.now().isoformat()
     # )
     # min([candle['low'] for candle in candles])
-    # https://binance-docs.github.io/apidocs/spot/en/#kline-candlestick-data
-    # the API just returns an ordered array, which is insane
-
-    """
-      [
-      1499040000000,      // Open time
-      "0.01634790",       // Open
-      "0.80000000",       // High
-      "0.01575800",       // Low
-      "0.01577100",       // Close
-      "148976.11427815",  // Volume
-      1499644799999,      // Close time
-      "2434.19055334",    // Quote asset volume
-      308,                // Number of trades
-      "1756.87402397",    // Taker buy base asset volume
-      "28.46694368",      // Taker buy quote asset volume
-      "17928899.62484339" // Ignore.
-    ]
-    """
 
-    candles = user.binance_client().get_klines(symbol=trading_pair, interval="1h")
+    store = kline_store.kline_store()
+    store.sync_many(trading_pairs, "1h", CANDLES_PER_DAY)
+    lows = store.windows(trading_pairs, "1h", CANDLES_PER_DAY, kline_store.LOW)
 
-    return Decimal(min([candle[3] for candle in candles]))
+    return [None if np.isnan(pair_lows).all() else index_weighting.to_decimal(np.nanmin(pair_lows)) for pair_lows in lows]
@@ -1,13 +1,45 @@
 import typing as t
 from decimal import Decimal
 
-from . import exchanges, utils
+from . import analytics, cache, exchanges, index_weighting, market_snapshot
 from .data_types import CryptoData, MarketIndexStrategy, SupportedExchanges
 from .user import User
 from .utils import log
 
 
+class TargetIndex:
+    """
+    Index targets (`CryptoData`) indexed by symbol. Iteration order is the order of the index.
+    """
+
+    def __init__(self, coins: t.Iterable[CryptoData]):
+        self._coins: t.List[CryptoData] = list(coins)
+        self._coins_by_symbol: t.Dict[str, CryptoData] = {}
+
+        # coinmarketcap symbols are not unique, the coin with the largest market cap (first) wins
+        for coin in self._coins:
+            self._coins_by_symbol.setdefault(coin["symbol"], coin)
+
+    def get(self, symbol: str) -> t.Optional[CryptoData]:
+        return self._coins_by_symbol.get(symbol)
+
+    def to_list(self) -> t.List[CryptoData]:
+        return list(self._coins)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._coins_by_symbol
+
+    def __iter__(self) -> t.Iterator[CryptoData]:
+        return iter(self._coins)
+
+    def __len__(self) -> int:
+        return len(self._coins)
+
+
 def coinmarketcap_data():
+    if snapshot := market_snapshot.current_market_snapshot():
+        return snapshot.coinmarketcap_data
+
     import decouple
     import requests
 
@@ -22,7 +54,7 @@ def coinmarketcap_data():
 
         return response.json(parse_float=Decimal)
 
-    return utils.cached_result("coinmarketcap_data", get_coinmarketcap_data)
+    return cache.cached_result("coinmarketcap_data", get_coinmarketcap_data)
 
 
 # for debugging / testing only
@@ -84,50 +116,57 @@ def filtered_coins_by_market_cap(
     return coins
 
 
+# number of daily candles averaged by the `SMA` strategy when the user doesn't specify it
+DEFAULT_SMA_DAYS = 30
+
+
 # TODO hardcoded against USD quotes right now, support different purchase currencies in the future
 # `coins` is data from coinmarketcap
 def calculate_market_cap_from_coin_list(
-    purchasing_currency: str, coins, strategy: MarketIndexStrategy, sqrt_adjustment: t.Union[None, str]
+    purchasing_currency: str,
+    coins,
+    strategy: MarketIndexStrategy,
+    sqrt_adjustment: t.Union[None, str],
+    weight_cap: t.Union[None, int, Decimal] = None,
+    sma_days: t.Optional[int] = None,
+    volatility_days: t.Optional[int] = None,
 ) -> t.List[CryptoData]:
     log.info("calculating market index", strategy=strategy)
 
-    if strategy == MarketIndexStrategy.SMA:
-        for coin in coins:
-            breakpoint()
-
+    symbols = [coin["symbol"] for coin in coins]
     market_cap_list = [Decimal(coin["quote"][purchasing_currency]["market_cap"]) for coin in coins]
-    sqrt_power_equivilent = None
+    market_caps = index_weighting.market_cap_array(market_cap_list)
+    market_analytics = None
 
-    if strategy == MarketIndexStrategy.SQRT_MARKET_CAP:
-        if sqrt_adjustment:
-            sqrt_power_equivilent = Decimal("1.0") / Decimal(sqrt_adjustment)
-        else:
-            # sqrt() == ^0.5
-            sqrt_power_equivilent = Decimal("0.5")
+    if strategy == MarketIndexStrategy.SMA:
+        closes = analytics.daily_closes(symbols, purchasing_currency, sma_days or DEFAULT_SMA_DAYS)
+        market_caps = index_weighting.sma_market_caps(market_caps, closes)
+    elif strategy in (MarketIndexStrategy.INVERSE_VOLATILITY, MarketIndexStrategy.RISK_PARITY):
+        market_analytics = analytics.market_analytics(symbols, purchasing_currency, volatility_days)
+
+    # weights are calculated in float64, see `index_weighting` for the precision this guarantees
+    weights = index_weighting.index_weights(
+        market_caps,
+        strategy,
+        sqrt_adjustment=sqrt_adjustment,
+        weight_cap=weight_cap,
+        market_analytics=market_analytics,
+    )
 
-        total_market_cap = sum([cap**sqrt_power_equivilent for cap in market_cap_list])
-    else:
-        total_market_cap = sum(market_cap_list)
+    log.info("total market cap", total_market_cap=weights.adjusted_market_caps.sum())
 
-    log.info("total market cap", total_market_cap=total_market_cap)
+    # market caps are only adjusted by root and average strategies, otherwise keep the exact value from coinmarketcap
+    is_market_cap_adjusted = strategy in (MarketIndexStrategy.SQRT_MARKET_CAP, MarketIndexStrategy.SMA)
 
     coins_with_market_cap_calculation = []
 
-    for coin in coins:
-        market_cap = Decimal(coin["quote"][purchasing_currency]["market_cap"])
-
-        if strategy == MarketIndexStrategy.SQRT_MARKET_CAP:
-            # make the typechecker happy
-            assert sqrt_power_equivilent is not None
-            market_cap = market_cap**sqrt_power_equivilent
-
+    for coin, market_cap, adjusted_market_cap, percentage in zip(coins, market_cap_list, weights.adjusted_market_caps, weights.percentages):
         coins_with_market_cap_calculation.append(
             CryptoData(
                 symbol=coin["symbol"],
-                market_cap=market_cap,
-                # TODO we probably need safer FPA calculations
+                market_cap=index_weighting.to_decimal(adjusted_market_cap) if is_market_cap_adjusted else market_cap,
                 # represents % of total market cap of the portfolio
-                percentage=market_cap / total_market_cap * 100,
+                percentage=index_weighting.to_decimal_percentage(percentage),
                 # include percent changes for purchase priority decisions
                 change_7d=coin["quote"][purchasing_currency]["percent_change_7d"],
                 change_30d=coin["quote"][purchasing_currency]["percent_change_30d"]
@@ -155,4 +194,7 @@ def coins_with_market_cap(user: User) -> t.List[CryptoData]:
         coins=filtered_coins,
         strategy=user.index_strategy,
         sqrt_adjustment=user.index_strategy_sqrt_adjustment,
+        weight_cap=user.index_strategy_weight_cap,
+        sma_days=user.index_strategy_sma_days,
+        volatility_days=user.index_strategy_volatility_days,
     )
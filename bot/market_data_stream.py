@@ -0,0 +1,183 @@
+"""
+Market data pushed by the binance websocket streams: the latest price of every pair (`!miniTicker@arr`) and the top of
+every order book (`!bookTicker`).
+
+A daemon process (`python manage.py market_data_stream`) holds the streams and publishes the table to the shared cache
+about once a second. While the table is fresh, workers read prices and book tops from it instead of requesting every
+ticker or an order book. When the daemon isn't running the table goes stale, and the REST endpoints are used again.
+
+A run pinned to a market snapshot values portfolios with the snapshot's prices, so every run in a cycle uses the same
+prices. Streamed prices are used by runs without a snapshot, and when a snapshot is built. Order books are not part of
+a snapshot, so limit prices always come from the current book top.
+
+https://binance-docs.github.io/apidocs/spot/en/#websocket-market-streams
+"""
+
+import asyncio
+import json
+import time
+import typing as t
+from decimal import Decimal
+
+from . import cache
+from .utils import in_django_environment, log
+
+STREAMS = ["!miniTicker@arr", "!bookTicker"]
+
+TABLE_CACHE_KEY = "market_data_stream:table"
+
+PUBLISH_INTERVAL_SECONDS = 1.0
+
+# workers go back to the REST endpoints once the last streamed update is older than this
+MAX_TABLE_AGE_SECONDS = 10.0
+
+# a run reads many prices, the shared table is only read this often by each process
+LOCAL_TABLE_TTL_SECONDS = 1.0
+
+FIRST_RECONNECT_DELAY_SECONDS = 1.0
+MAX_RECONNECT_DELAY_SECONDS = 60.0
+
+_MISSING = object()
+
+
+class BookTop(t.NamedTuple):
+    bid: Decimal
+    bid_quantity: Decimal
+    ask: Decimal
+    ask_quantity: Decimal
+
+
+class MarketDataTable(t.NamedTuple):
+    # trading pair => last price, i.e. 'BTCUSD' => Decimal('60000.0')
+    prices: t.Dict[str, Decimal]
+    books: t.Dict[str, BookTop]
+    # time of the last streamed update
+    updated_at: float
+
+
+def current_table() -> t.Optional[MarketDataTable]:
+    """
+    The published table, or `None` if the daemon isn't running or the table is stale
+    """
+
+    if not in_django_environment():
+        return None
+
+    table = cache.local_cache.get(TABLE_CACHE_KEY, _MISSING)
+
+    if table is _MISSING:
+        from django.core.cache import cache as shared_cache
+
+        table = shared_cache.get(TABLE_CACHE_KEY)
+        # misses are cached too, so a process without a daemon doesn't read the shared cache on every price
+        cache.local_cache.set(TABLE_CACHE_KEY, table, ttl=LOCAL_TABLE_TTL_SECONDS)
+
+    if table is None or time.time() - table.updated_at > MAX_TABLE_AGE_SECONDS:
+        return None
+
+    return table
+
+
+def streamed_prices() -> t.Optional[t.Dict[str, Decimal]]:
+    table = current_table()
+    return table.prices if table else None
+
+
+def streamed_book_top(trading_pair: str) -> t.Optional[BookTop]:
+    table = current_table()
+    return table.books.get(trading_pair) if table else None
+
+
+class MarketDataStream:
+    def __init__(self, stream_url: t.Optional[str] = None, clock: t.Callable[[], float] = time.time):
+        from .supported_exchanges.binance import BINANCE_STREAM_URL
+
+        self._stream_url = stream_url or BINANCE_STREAM_URL
+        self._clock = clock
+
+        self.prices: t.Dict[str, Decimal] = {}
+        self.books: t.Dict[str, BookTop] = {}
+        self.updated_at: t.Optional[float] = None
+        self._published_at: t.Optional[float] = None
+
+    def handle_message(self, message: t.Dict) -> None:
+        stream, data = message["stream"], message["data"]
+
+        if stream == "!miniTicker@arr":
+            # only pairs which changed in the last second are sent
+            for ticker in data:
+                self.prices[ticker["s"]] = Decimal(ticker["c"])
+        elif stream == "!bookTicker":
+            self.books[data["s"]] = BookTop(
+                bid=Decimal(data["b"]), bid_quantity=Decimal(data["B"]), ask=Decimal(data["a"]), ask_quantity=Decimal(data["A"])
+            )
+        else:
+            return
+
+        self.updated_at = self._clock()
+
+    def table(self) -> MarketDataTable:
+        assert self.updated_at is not None
+        return MarketDataTable(prices=dict(self.prices), books=dict(self.books), updated_at=self.updated_at)
+
+    def publish(self) -> None:
+        # nothing new since the last publish, the table is left to go stale rather than looking fresh
+        if self.updated_at is None or self.updated_at == self._published_at:
+            return
+
+        from django.core.cache import cache as shared_cache
+
+        shared_cache.set(TABLE_CACHE_KEY, self.table(), timeout=MAX_TABLE_AGE_SECONDS * 6)
+        self._published_at = self.updated_at
+
+    async def _publish_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(PUBLISH_INTERVAL_SECONDS)
+            self.publish()
+
+    def _seed_prices(self) -> None:
+        from .supported_exchanges.binance import public_binance_client
+
+        # the ticker stream only sends pairs as they trade, so every price is requested once on connect. This replaces
+        # prices from before a reconnect, which may have changed while disconnected.
+        self.prices = {ticker["symbol"]: Decimal(ticker["price"]) for ticker in public_binance_client().get_all_tickers()}
+
+    async def _stream(self) -> None:
+        import websockets
+
+        async with websockets.connect(f"{self._stream_url}/stream?streams={'/'.join(STREAMS)}") as websocket:
+            # updates received while seeding are newer, and are applied once it finishes
+            await asyncio.to_thread(self._seed_prices)
+            log.info("market data stream connected", pairs=len(self.prices))
+
+            async for message in websocket:
+                self.handle_message(json.loads(message))
+
+    async def run(self) -> None:
+        """
+        Streams and publishes until cancelled, reconnecting with a backoff when the connection drops
+        """
+
+        publisher = asyncio.create_task(self._publish_periodically())
+        delay = FIRST_RECONNECT_DELAY_SECONDS
+
+        try:
+            while True:
+                connected_at = self._clock()
+
+                try:
+                    await self._stream()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.warn("market data stream failed", error=e)
+
+                # a connection which stayed up for a while was healthy, start the backoff over
+                if self._clock() - connected_at > MAX_RECONNECT_DELAY_SECONDS:
+                    delay = FIRST_RECONNECT_DELAY_SECONDS
+
+                log.info("reconnecting market data stream", delay=delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+        finally:
+            publisher.cancel()
@@ -0,0 +1,98 @@
+"""
+A market snapshot is an immutable copy of all public market data (coinmarketcap listings, binance tickers and
+exchange info) used during a single buy cycle.
+
+The snapshot is built once per cycle, stored under a version id, and pinned while each user's buy runs. When a
+snapshot is pinned, all market data lookups read from it instead of hitting the public APIs, which ensures every
+user in the same cycle makes decisions against the same data.
+"""
+
+import contextlib
+import contextvars
+import dataclasses
+import secrets
+import time
+import typing as t
+from decimal import Decimal
+
+from .utils import in_django_environment, log
+
+# snapshots only need to live as long as a buy cycle, with some buffer for slow queues
+SNAPSHOT_TIMEOUT = 60 * 60 * 2
+
+
+@dataclasses.dataclass(frozen=True)
+class MarketSnapshot:
+    version: str
+    created_at: float
+    coinmarketcap_data: t.Dict
+    # trading pair => price, i.e. 'BTCUSD' => Decimal('60000.0')
+    tickers: t.Dict[str, Decimal]
+    # `symbols` from the binance exchange info
+    symbol_info: t.List[t.Dict]
+
+
+_pinned_snapshot: contextvars.ContextVar[t.Optional[MarketSnapshot]] = contextvars.ContextVar("pinned_market_snapshot", default=None)
+
+
+def current_market_snapshot() -> t.Optional[MarketSnapshot]:
+    return _pinned_snapshot.get()
+
+
+@contextlib.contextmanager
+def pinned(snapshot: t.Optional[MarketSnapshot]):
+    """
+    All market data read within this block comes from the snapshot. Passing `None` is a no-op, so
+    callers don't need to special-case running without a snapshot.
+    """
+
+    if snapshot is None:
+        yield None
+        return
+
+    token = _pinned_snapshot.set(snapshot)
+
+    try:
+        yield snapshot
+    finally:
+        _pinned_snapshot.reset(token)
+
+
+def build_market_snapshot() -> MarketSnapshot:
+    from . import market_cap
+    from .supported_exchanges import binance
+
+    # a pinned snapshot would be copied into the new one, which is never what we want
+    assert current_market_snapshot() is None
+
+    snapshot = MarketSnapshot(
+        version=f"{int(time.time())}-{secrets.token_hex(4)}",
+        created_at=time.time(),
+        coinmarketcap_data=market_cap.coinmarketcap_data(),
+        tickers=binance.binance_all_prices(),
+        symbol_info=binance.binance_all_symbol_info(),
+    )
+
+    log.info("built market snapshot", version=snapshot.version)
+
+    return snapshot
+
+
+def _snapshot_key(version: str) -> str:
+    return f"market_snapshot:{version}"
+
+
+def store_market_snapshot(snapshot: MarketSnapshot) -> None:
+    assert in_django_environment()
+
+    from django.core.cache import cache
+
+    cache.set(_snapshot_key(snapshot.version), snapshot, timeout=SNAPSHOT_TIMEOUT)
+
+
+def load_market_snapshot(version: str) -> t.Optional[MarketSnapshot]:
+    assert in_django_environment()
+
+    from django.core.cache import cache
+
+    return cache.get(_snapshot_key(version))
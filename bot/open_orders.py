@@ -1,23 +1,29 @@
 import datetime
 import typing as t
 
-from . import exchanges
-from .data_types import OrderTimeInForce, OrderType, SupportedExchanges
+from .data_types import ExchangeOrder, OrderTimeInForce, OrderType, SupportedExchanges
+from .run_context import RunContext
 from .user import User, user_from_env
 from .utils import log
 
 
-def cancel_stale_open_orders(user: User, exchange: SupportedExchanges) -> t.List:
+def stale_open_orders(user: User, exchange: SupportedExchanges, context: t.Optional[RunContext] = None) -> t.List[ExchangeOrder]:
+    context = context or RunContext(user)
     order_time_limit = user.stale_order_hour_limit
 
-    old_orders = [
+    return [
         order
-        for order in exchanges.open_orders(exchange, user)
+        for order in context.open_orders(exchange)
         if order["type"] == OrderType.BUY
         and order["time_in_force"] == OrderTimeInForce.GTC
         and order["created_at"] < (datetime.datetime.now() - datetime.timedelta(hours=order_time_limit)).timestamp()
     ]
 
+
+def cancel_stale_open_orders(user: User, exchange: SupportedExchanges, context: t.Optional[RunContext] = None) -> t.List:
+    context = context or RunContext(user)
+    old_orders = stale_open_orders(user, exchange, context)
+
     if not old_orders:
         log.info("no stale open orders")
         return []
@@ -26,7 +32,7 @@ def cancel_stale_open_orders(user: User, exchange: SupportedExchanges) -> t.List
 
     for order in old_orders:
         log.info("cancelling order", order=order)
-        cancelled_orders.append(exchanges.cancel_order(exchange, user, order))
+        cancelled_orders.append(context.cancel_order(exchange, order))
 
     return cancelled_orders
 
@@ -0,0 +1,180 @@
+"""
+Tracks orders until the exchange has settled them, so a run can use the proceeds of an order (e.g. a stablecoin
+conversion) as soon as it fills instead of sleeping for a fixed amount of time.
+
+Order updates pushed by the exchange (the binance user data stream) are used when a source is available. Otherwise the
+exchange is polled, each round using whichever requests cost the least rate limit weight: looking up every pending
+order, or requesting the open orders (per pair, or every pair at once) and only looking up orders which have left the
+open order list to get their final state. Rounds back off exponentially up to a cap, and tracking gives up at a
+deadline rather than blocking the worker.
+"""
+
+import time
+import typing as t
+from decimal import Decimal
+
+from . import rate_limit
+from .data_types import ExchangeOrder, OrderStatus
+from .user import User
+from .utils import log
+
+# orders in these states will never change again
+SETTLED_STATUSES = {OrderStatus.FILLED, OrderStatus.CANCELED, OrderStatus.REJECTED, OrderStatus.EXPIRED}
+
+FIRST_POLL_DELAY_SECONDS = 0.25
+MAX_POLL_DELAY_SECONDS = 4.0
+DEFAULT_FILL_DEADLINE_SECONDS = 30.0
+
+
+class OrderFill(t.NamedTuple):
+    id: str
+    trading_pair: str
+    status: OrderStatus
+    # quantity of the base asset which has been bought or sold
+    executed_quantity: Decimal
+    # quantity of the quote asset spent (buys) or received (sells)
+    quote_quantity: Decimal
+
+    @property
+    def is_settled(self) -> bool:
+        return self.status in SETTLED_STATUSES
+
+    @classmethod
+    def from_binance(cls, order: t.Dict) -> "OrderFill":
+        return cls(
+            id=order["orderId"],
+            trading_pair=order["symbol"],
+            status=OrderStatus(order["status"]),
+            executed_quantity=Decimal(order["executedQty"]),
+            quote_quantity=Decimal(order["cummulativeQuoteQty"]),
+        )
+
+
+class FillState(t.NamedTuple):
+    # latest known state of each tracked order, keyed by order id
+    fills: t.Dict[str, OrderFill]
+    # ids of orders which had not settled when tracking stopped
+    pending: t.List[str]
+
+    @property
+    def is_settled(self) -> bool:
+        return not self.pending
+
+    @property
+    def quote_quantity(self) -> Decimal:
+        """
+        Total quote asset spent or received so far, including partial fills of orders which have not settled
+        """
+
+        return sum((fill.quote_quantity for fill in self.fills.values()), Decimal(0))
+
+
+class OrderUpdateSource(t.Protocol):
+    def wait_for_updates(self, order_ids: t.List[str], timeout: float) -> t.List[OrderFill]:
+        """
+        Blocks until at least one of `order_ids` is updated or `timeout` seconds pass, returning the updates
+        """
+        ...
+
+
+def poll_order_fills(
+    user: User,
+    orders: t.List[ExchangeOrder],
+    deadline_seconds: float = DEFAULT_FILL_DEADLINE_SECONDS,
+    sleep: t.Callable[[float], None] = time.sleep,
+    clock: t.Callable[[], float] = time.monotonic,
+) -> FillState:
+    client = user.binance_client()
+    pending = {order["id"]: order for order in orders}
+    fills: t.Dict[str, OrderFill] = {}
+
+    deadline = clock() + deadline_seconds
+    delay = FIRST_POLL_DELAY_SECONDS
+    attempt = 0
+
+    while pending:
+        trading_pairs = sorted({order["trading_pair"] for order in pending.values()})
+        scoped_open_orders_weight = len(trading_pairs) * rate_limit.request_weight("openOrders", {"symbol": trading_pairs[0]})
+        open_orders_weight = min(scoped_open_orders_weight, rate_limit.request_weight("openOrders", None))
+        order_lookups_weight = len(pending) * rate_limit.request_weight("order", {"symbol": trading_pairs[0]})
+
+        # each lookup returns the order's latest state, and there are no follow up lookups for settled orders
+        if order_lookups_weight <= open_orders_weight:
+            for order_id, order in list(pending.items()):
+                fills[order_id] = OrderFill.from_binance(client.get_order(orderId=order_id, symbol=order["trading_pair"]))
+
+                if fills[order_id].is_settled:
+                    del pending[order_id]
+        else:
+            # scoping the request to a pair is far cheaper than requesting every open order, unless there are many pairs
+            if scoped_open_orders_weight <= open_orders_weight:
+                open_orders = [open_order for trading_pair in trading_pairs for open_order in client.get_open_orders(symbol=trading_pair)]
+            else:
+                open_orders = client.get_open_orders()
+
+            open_orders_by_id = {open_order["orderId"]: open_order for open_order in open_orders}
+
+            for order_id, order in list(pending.items()):
+                if open_order := open_orders_by_id.get(order_id):
+                    # a partial fill is still useful to report if the deadline is hit
+                    fills[order_id] = OrderFill.from_binance(open_order)
+                    continue
+
+                # the order is no longer open, so this lookup returns its final state
+                fills[order_id] = OrderFill.from_binance(client.get_order(orderId=order_id, symbol=order["trading_pair"]))
+                del pending[order_id]
+
+        if not pending:
+            break
+
+        remaining = deadline - clock()
+
+        if remaining <= 0:
+            log.warn("orders did not settle before deadline", pending=list(pending), deadline=deadline_seconds)
+            break
+
+        log.info("waiting for orders to clear", attempt=attempt, pending=len(pending), delay=min(delay, remaining))
+        sleep(min(delay, remaining))
+
+        delay = min(delay * 2, MAX_POLL_DELAY_SECONDS)
+        attempt += 1
+
+    return FillState(fills=fills, pending=list(pending))
+
+
+def wait_for_fills(
+    user: User,
+    orders: t.List[ExchangeOrder],
+    deadline_seconds: float = DEFAULT_FILL_DEADLINE_SECONDS,
+    updates: t.Optional[OrderUpdateSource] = None,
+    clock: t.Callable[[], float] = time.monotonic,
+) -> FillState:
+    """
+    Waits until every order has settled or the deadline passes. The returned state includes any partial fills, so
+    callers can continue with whatever has filled instead of failing when the deadline is hit.
+    """
+
+    if not orders:
+        return FillState(fills={}, pending=[])
+
+    if updates is None:
+        return poll_order_fills(user, orders, deadline_seconds=deadline_seconds, clock=clock)
+
+    fills: t.Dict[str, OrderFill] = {}
+    pending = [order["id"] for order in orders]
+    deadline = clock() + deadline_seconds
+
+    while pending and (remaining := deadline - clock()) > 0:
+        for fill in updates.wait_for_updates(pending, timeout=remaining):
+            fills[fill.id] = fill
+
+        pending = [order_id for order_id in pending if not (order_id in fills and fills[order_id].is_settled)]
+
+    if not pending:
+        return FillState(fills=fills, pending=[])
+
+    # the stream can drop updates while reconnecting, confirm whatever is left with a single polling round
+    log.info("confirming unsettled orders with the exchange", pending=pending)
+    polled_state = poll_order_fills(user, [order for order in orders if order["id"] in pending], deadline_seconds=0, clock=clock)
+
+    return FillState(fills=fills | polled_state.fills, pending=polled_state.pending)
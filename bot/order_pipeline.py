@@ -0,0 +1,78 @@
+"""
+Executes a run's buys concurrently. In limit mode the whole buy list is priced at once, then each order is submitted
+independently of the others, so a run takes about as long as its slowest order rather than the sum of every order's
+round trips.
+
+The number of orders submitted at once is capped by the user's `order_parallelism`. The exchange order rate limits are
+enforced by the binance client itself (see `rate_limit`), which delays an order when a limit would be exceeded, so
+submitting concurrently can't push an account over them.
+"""
+
+import asyncio
+import typing as t
+from decimal import Decimal
+
+from . import async_exchanges, market_buy
+from .data_types import ExchangeOrder, MarketBuy, MarketBuyStrategy
+from .run_context import RunContext
+from .utils import log
+
+
+async def execute_market_buy(
+    context: RunContext,
+    buy: MarketBuy,
+    submission_slots: asyncio.Semaphore,
+    limit_price: t.Optional[Decimal] = None,
+) -> t.Optional[ExchangeOrder]:
+    """
+    A failure is isolated to its own order: it is logged and `None` is returned, the rest of the run's orders are unaffected
+    """
+
+    symbol = buy["symbol"]
+
+    if context.user.buy_strategy == MarketBuyStrategy.LIMIT and limit_price is None:
+        # the market data for this pair couldn't be loaded, which was logged when pricing
+        log.error("skipping order without a limit price", symbol=symbol, amount=buy["amount"])
+        return None
+
+    try:
+        async with submission_slots:
+            return await async_exchanges.in_thread(market_buy.submit_market_buy, context, buy, limit_price)
+    except Exception as e:
+        log.error("failed to execute order", symbol=symbol, amount=buy["amount"], error=e)
+        return None
+
+
+async def execute_market_buys(
+    context: RunContext,
+    market_buys: t.List[MarketBuy],
+    limit_prices: t.Optional[t.Dict[str, Decimal]] = None,
+    parallelism: t.Optional[int] = None,
+) -> t.List[ExchangeOrder]:
+    """
+    Orders are returned in the same order as `market_buys`, which is the user's buy preference order, no matter which
+    order they are completed in. Orders which failed, or were not placed because the user is in testmode, are excluded.
+    """
+
+    if not market_buys:
+        return []
+
+    user = context.user
+    limit_prices = limit_prices or {}
+    parallelism = parallelism or user.order_parallelism
+    submission_slots = asyncio.Semaphore(parallelism)
+
+    # the whole buy list is priced at once, the market data for every pair is requested concurrently
+    if user.buy_strategy == MarketBuyStrategy.LIMIT:
+        if unpriced_symbols := [buy["symbol"] for buy in market_buys if buy["symbol"] not in limit_prices]:
+            limit_prices = limit_prices | await async_exchanges.limit_prices(unpriced_symbols, user.purchasing_currency)
+
+    log.info("executing orders", strategy=user.buy_strategy, count=len(market_buys), parallelism=parallelism)
+
+    orders = await asyncio.gather(
+        *(execute_market_buy(context, buy, submission_slots, limit_price=limit_prices.get(buy["symbol"])) for buy in market_buys)
+    )
+
+    # in testmode, or in the case of an error, there is no order
+    # remove these since they don't provide any useful information and are confusing to parse downstream
+    return [order for order in orders if order]
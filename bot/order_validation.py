@@ -0,0 +1,118 @@
+"""
+Checks orders against the exchange's symbol filters (LOT_SIZE, PRICE_FILTER, MIN_NOTIONAL/NOTIONAL) before they are
+submitted. An order which the exchange would reject is rejected locally, without a signed round trip, and values which
+only need rounding (price ticks, quantity steps) are adjusted to what the exchange accepts.
+
+The filters checked here are the ones the test order endpoint checks for the orders the bot places, so in testmode
+orders are validated locally instead and a dry run doesn't make any order requests.
+
+https://binance-docs.github.io/apidocs/spot/en/#filters
+"""
+
+import decimal
+import typing as t
+from decimal import Decimal
+
+if t.TYPE_CHECKING:
+    from .supported_exchanges.binance import BinanceSymbol
+
+
+class OrderRejected(Exception):
+    def __init__(self, trading_pair: str, reason: str):
+        super().__init__(f"{trading_pair}: {reason}")
+        self.trading_pair = trading_pair
+        self.reason = reason
+
+
+class ValidatedOrder(t.NamedTuple):
+    trading_pair: str
+    # quantity of the base asset, for orders placed by quantity
+    quantity: t.Optional[Decimal]
+    # amount of the quote asset, for market orders placed with `quoteOrderQty`
+    quote_quantity: t.Optional[Decimal]
+    price: t.Optional[Decimal]
+    # description of each change made to the requested order
+    adjustments: t.List[str]
+
+
+def _tradable_symbol(binance_symbol: t.Optional["BinanceSymbol"], trading_pair: str) -> "BinanceSymbol":
+    if binance_symbol is None:
+        raise OrderRejected(trading_pair, "not listed on the exchange")
+
+    if binance_symbol.status != "TRADING":
+        raise OrderRejected(trading_pair, f"not trading, status is {binance_symbol.status}")
+
+    return binance_symbol
+
+
+def _check_notional(binance_symbol: "BinanceSymbol", notional: Decimal, is_market: bool) -> None:
+    trading_pair = binance_symbol.trading_pair
+
+    # a limit of zero means the filter is disabled
+    if (not is_market or binance_symbol.min_notional_applies_to_market) and notional < binance_symbol.min_notional:
+        raise OrderRejected(trading_pair, f"order value {notional} is below the minimum of {binance_symbol.min_notional}")
+
+    if (not is_market or binance_symbol.max_notional_applies_to_market) and binance_symbol.max_notional and notional > binance_symbol.max_notional:
+        raise OrderRejected(trading_pair, f"order value {notional} is above the maximum of {binance_symbol.max_notional}")
+
+
+def validate_quote_order(binance_symbol: t.Optional["BinanceSymbol"], trading_pair: str, quote_quantity: Decimal) -> ValidatedOrder:
+    """
+    Market orders placed with an amount of the quote asset (`quoteOrderQty`), i.e. buying $25 of BTC
+    """
+
+    binance_symbol = _tradable_symbol(binance_symbol, trading_pair)
+    adjustments = []
+
+    # rounded down so more than the requested amount (i.e. the available balance) is never spent
+    rounded_quote_quantity = Decimal(quote_quantity).quantize(Decimal(1).scaleb(-binance_symbol.price_precision), rounding=decimal.ROUND_DOWN)
+
+    if rounded_quote_quantity != quote_quantity:
+        adjustments.append(f"amount rounded from {quote_quantity} to {rounded_quote_quantity}")
+
+    if rounded_quote_quantity <= 0:
+        raise OrderRejected(trading_pair, f"amount {quote_quantity} is too small to be submitted")
+
+    _check_notional(binance_symbol, rounded_quote_quantity, is_market=True)
+
+    return ValidatedOrder(trading_pair=trading_pair, quantity=None, quote_quantity=rounded_quote_quantity, price=None, adjustments=adjustments)
+
+
+def validate_limit_order(binance_symbol: t.Optional["BinanceSymbol"], trading_pair: str, quantity: Decimal, price: Decimal) -> ValidatedOrder:
+    binance_symbol = _tradable_symbol(binance_symbol, trading_pair)
+    adjustments = []
+
+    if binance_symbol.tick_size:
+        # prices must be a multiple of the tick size above the minimum price, round down so a buy never overpays
+        rounded_price = price - (price - binance_symbol.min_price) % binance_symbol.tick_size
+        rounded_price = rounded_price.quantize(binance_symbol.tick_size.normalize())
+
+        if rounded_price != price:
+            adjustments.append(f"price rounded from {price} to {rounded_price}")
+
+        price = rounded_price
+
+    if price <= 0 or (binance_symbol.min_price and price < binance_symbol.min_price):
+        raise OrderRejected(trading_pair, f"price {price} is below the minimum of {binance_symbol.min_price}")
+
+    if binance_symbol.max_price and price > binance_symbol.max_price:
+        raise OrderRejected(trading_pair, f"price {price} is above the maximum of {binance_symbol.max_price}")
+
+    if binance_symbol.quantity_quantizer is not None:
+        # rounded up, like `binance_normalize_purchase_amount`, so the order isn't pushed below the minimums by rounding
+        rounded_quantity = Decimal(quantity).quantize(binance_symbol.quantity_quantizer, rounding=decimal.ROUND_UP)
+
+        if rounded_quantity != quantity:
+            adjustments.append(f"quantity rounded from {quantity} to {rounded_quantity}")
+
+        quantity = rounded_quantity
+
+    if quantity < binance_symbol.min_quantity or quantity <= 0:
+        raise OrderRejected(trading_pair, f"quantity {quantity} is below the minimum of {binance_symbol.min_quantity}")
+
+    if binance_symbol.max_quantity and quantity > binance_symbol.max_quantity:
+        raise OrderRejected(trading_pair, f"quantity {quantity} is above the maximum of {binance_symbol.max_quantity}")
+
+    _check_notional(binance_symbol, quantity * price, is_market=False)
+
+    return ValidatedOrder(trading_pair=trading_pair, quantity=quantity, quote_quantity=None, price=price, adjustments=adjustments)
@@ -2,115 +2,193 @@ import typing as t
 from decimal import Decimal
 
 from . import exchanges
-from .data_types import CryptoBalance, CryptoData
+from .data_types import CryptoBalance
+from .market_cap import TargetIndex
 from .user import User
 
 
-def portfolio_with_allocation_percentages(portfolio: t.List[CryptoBalance]) -> t.List[CryptoBalance]:
-    portfolio_total = sum([balance["usd_price"] * balance["amount"] for balance in portfolio])
+class PortfolioEntry:
+    """
+    A single balance within a `Portfolio`. Entries are enriched in place (price, totals, percentages) as the
+    portfolio moves through the functions below.
+
+    Fields can be accessed like a `CryptoBalance` (`entry["symbol"]`) or as attributes (`entry.symbol`).
+    """
+
+    __slots__ = ("symbol", "amount", "usd_price", "usd_total", "percentage", "target_percentage")
+
+    def __init__(
+        self,
+        symbol: str,
+        amount: Decimal,
+        usd_price: Decimal = Decimal(0),
+        usd_total: Decimal = Decimal(0),
+        percentage: Decimal = Decimal(0),
+        target_percentage: Decimal = Decimal(0),
+    ):
+        self.symbol = symbol
+        self.amount = amount
+        self.usd_price = usd_price
+        self.usd_total = usd_total
+        self.percentage = percentage
+        self.target_percentage = target_percentage
+
+    @classmethod
+    def from_balance(cls, balance: t.Union["PortfolioEntry", t.Mapping[str, t.Any]]) -> "PortfolioEntry":
+        # external portfolios only specify a symbol and amount, everything else is calculated
+        return cls(**{field: balance[field] for field in cls.__slots__ if field in balance})
+
+    def __getitem__(self, key: str) -> t.Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: t.Any) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def to_dict(self) -> CryptoBalance:
+        return CryptoBalance(
+            symbol=self.symbol,
+            amount=self.amount,
+            usd_price=self.usd_price,
+            usd_total=self.usd_total,
+            percentage=self.percentage,
+            target_percentage=self.target_percentage,
+        )
 
-    return t.cast(
-        t.List[CryptoBalance],
-        [
-            balance
-            | {
-                "usd_total": usd_total,
-                "percentage": usd_total / portfolio_total * Decimal(100),
-            }
-            for balance in portfolio
-            # this is silly: we are only using a conditional here to assign `usd_total`
-            if (usd_total := balance["usd_price"] * balance["amount"])
-        ],
-    )
+    def __repr__(self):
+        return f"<PortfolioEntry {self.symbol} {self.amount}>"
 
 
-# useful for adding in externally held assets
-# in the future, we'll also use this for merging portfolios from multiple exchanges
-def merge_portfolio(portfolio_1: t.List[CryptoBalance], portfolio_2: t.List[CryptoBalance]) -> t.List[CryptoBalance]:
-    new_portfolio: t.List[CryptoBalance] = []
+class Portfolio:
+    """
+    Balances indexed by symbol. Iteration order is insertion order, which matches the order balances were
+    reported by the exchange (or external portfolio), so downstream sorting behaves the same as with a list.
+    """
 
-    for balance in portfolio_1:
-        portfolio_2_balance = next(
-            (portfolio_2_balance for portfolio_2_balance in portfolio_2 if portfolio_2_balance["symbol"] == balance["symbol"]), None
-        )
+    def __init__(self, entries: t.Iterable[PortfolioEntry] = ()):
+        self._entries: t.Dict[str, PortfolioEntry] = {}
 
-        # if an asset is in porfolio 2, combine them
-        if portfolio_2_balance:
-            new_portfolio.append(
-                t.cast(
-                    CryptoBalance,
-                    balance
-                    | {
-                        "amount": balance["amount"] + portfolio_2_balance["amount"],
-                    },
-                )
-            )
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def from_balances(cls, balances: t.Iterable[t.Union[PortfolioEntry, t.Mapping[str, t.Any]]]) -> "Portfolio":
+        """
+        Entries are copied, so the resulting portfolio can be mutated without modifying the source balances
+        """
+
+        return cls(PortfolioEntry.from_balance(balance) for balance in balances)
+
+    def add(self, entry: PortfolioEntry) -> None:
+        """
+        Adding a symbol which is already in the portfolio combines the holdings into the existing entry
+        """
+
+        if existing_entry := self._entries.get(entry.symbol):
+            existing_entry.amount = existing_entry.amount + entry.amount
+            existing_entry.usd_total = existing_entry.usd_total + entry.usd_total
         else:
-            new_portfolio.append(balance)
+            self._entries[entry.symbol] = entry
+
+    def remove(self, symbol: str) -> None:
+        del self._entries[symbol]
+
+    def get(self, symbol: str) -> t.Optional[PortfolioEntry]:
+        return self._entries.get(symbol)
+
+    def sort(self, key: t.Callable[[PortfolioEntry], t.Any], reverse: bool = False) -> None:
+        self._entries = {entry.symbol: entry for entry in sorted(self._entries.values(), key=key, reverse=reverse)}
+
+    def to_list(self) -> t.List[CryptoBalance]:
+        return [entry.to_dict() for entry in self]
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._entries
+
+    def __iter__(self) -> t.Iterator[PortfolioEntry]:
+        # iterate over a copy so entries can be removed while iterating
+        return iter(list(self._entries.values()))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+PortfolioLike = t.Union[Portfolio, t.Iterable[t.Union[PortfolioEntry, t.Mapping[str, t.Any]]]]
 
-    # add in any new assets from the 2nd portfolio
+
+def portfolio_with_allocation_percentages(portfolio: Portfolio) -> Portfolio:
+    portfolio_total = sum([balance.usd_price * balance.amount for balance in portfolio])
+
+    for balance in portfolio:
+        balance.usd_total = balance.usd_price * balance.amount
+
+        # assets without any value don't have an allocation
+        if not balance.usd_total:
+            portfolio.remove(balance.symbol)
+            continue
+
+        balance.percentage = balance.usd_total / portfolio_total * Decimal(100)
+
+    return portfolio
+
+
+# useful for adding in externally held assets
+# in the future, we'll also use this for merging portfolios from multiple exchanges
+def merge_portfolio(portfolio_1: PortfolioLike, portfolio_2: PortfolioLike) -> Portfolio:
+    # copying keeps the source portfolios untouched
+    new_portfolio = Portfolio.from_balances(portfolio_1)
+
+    # assets in both portfolios are combined, new assets from the 2nd portfolio are added
     for balance in portfolio_2:
-        if balance["symbol"] not in [balance["symbol"] for balance in new_portfolio]:
-            new_portfolio.append(balance)
+        new_portfolio.add(PortfolioEntry.from_balance(balance))
 
     return new_portfolio
 
 
-def add_price_to_portfolio(portfolio: t.List[CryptoBalance], purchasing_currency: str) -> t.List[CryptoBalance]:
-    # TODO the new python dict merge syntax doesn't seem to play well with typed dicts
-    #      https://github.com/python/mypy/issues/6462
-    #      can't use `update` https://stackoverflow.com/questions/1452995/why-doesnt-a-python-dict-update-return-the-object
-    return t.cast(
-        t.List[CryptoBalance],
-        [
-            balance
-            | {
-                "usd_price": exchanges.price_of_symbol(balance["symbol"], purchasing_currency) if balance["symbol"] != purchasing_currency else 1,
-            }
-            for balance in portfolio
-        ],
-    )
+def add_price_to_portfolio(portfolio: Portfolio, purchasing_currency: str) -> Portfolio:
+    for balance in portfolio:
+        if balance.symbol == purchasing_currency:
+            balance.usd_price = Decimal(1)
+        else:
+            balance.usd_price = exchanges.price_of_symbol(balance.symbol, purchasing_currency)
 
+    return portfolio
 
-# TODO maybe remove user preference? The target porfolio should take into the account the user's purchasing currency preference?
-def add_missing_assets_to_portfolio(user: User, portfolio: t.List[CryptoBalance], portfolio_target: t.List[CryptoData]) -> t.List[CryptoBalance]:
-    from . import exchanges
 
+# TODO maybe remove user preference? The target porfolio should take into the account the user's purchasing currency preference?
+def add_missing_assets_to_portfolio(user: User, portfolio: Portfolio, portfolio_target: TargetIndex) -> Portfolio:
     purchasing_currency = user.purchasing_currency
 
-    return portfolio + [
-        CryptoBalance(
-            symbol=balance["symbol"],
-            usd_price=exchanges.binance_price_for_symbol(balance["symbol"] + purchasing_currency),
-            amount=Decimal(0),
-            # we can't mark specific arguments as optional, so instead we pass a value that will be ignored
-            target_percentage=Decimal(0),
-            usd_total=Decimal(0),
-            percentage=Decimal(0),
+    for coin in portfolio_target:
+        if coin["symbol"] in portfolio:
+            continue
+
+        portfolio.add(
+            PortfolioEntry(
+                symbol=coin["symbol"],
+                amount=Decimal(0),
+                usd_price=t.cast(Decimal, exchanges.binance_price_for_symbol(coin["symbol"] + purchasing_currency)),
+            )
         )
-        for balance in portfolio_target
-        if balance["symbol"] not in [balance["symbol"] for balance in portfolio]
-    ]
+
+    return portfolio
 
 
 # right now, this is for tinkering/debugging purposes only
-def add_percentage_target_to_portfolio(portfolio: t.List[CryptoBalance], portfolio_target: t.List[CryptoData]) -> t.List[CryptoBalance]:
-    return t.cast(
-        t.List[CryptoBalance],
-        [
-            # updating TypedDicts is not simple https://github.com/python/mypy/issues/6462
-            balance
-            | {
-                "target_percentage":
-                # `next` is a little trick to return the first match in a list comprehension
-                # https://stackoverflow.com/questions/9542738/python-find-in-list
-                next(
-                    (target["percentage"] for target in portfolio_target if target["symbol"] == balance["symbol"]),
-                    # coin may exist in portfolio but not available for purchase
-                    # this can occur if deposits are allowed but trades are not
-                    Decimal(0),
-                ),
-            }
-            for balance in portfolio
-        ],
-    )
+def add_percentage_target_to_portfolio(portfolio: Portfolio, portfolio_target: TargetIndex) -> Portfolio:
+    for balance in portfolio:
+        target = portfolio_target.get(balance.symbol)
+
+        # coin may exist in portfolio but not available for purchase
+        # this can occur if deposits are allowed but trades are not
+        balance.target_percentage = target["percentage"] if target else Decimal(0)
+
+    return portfolio
@@ -0,0 +1,52 @@
+"""
+Cheap check of whether a buy run has anything to do, so idle accounts skip the index, portfolio and ranking work.
+
+Only the account balances are requested, plus open orders when stale orders are cancelled. Both are memoized in the
+run context, so a run which goes ahead doesn't request them again.
+"""
+
+import enum
+import typing as t
+from decimal import Decimal
+
+from . import convert_stablecoins, exchanges, market_buy, open_orders
+from .data_types import MarketBuyStrategy
+from .run_context import RunContext
+from .utils import log
+
+
+class SkipReason(str, enum.Enum):
+    NO_PURCHASING_CURRENCY = "no_purchasing_currency"
+    BELOW_PURCHASE_MINIMUM = "below_purchase_minimum"
+
+
+def buy_skip_reason(context: RunContext) -> t.Optional[SkipReason]:
+    """
+    Reason the buy run can be skipped, or `None` if any exchange has currency to invest, stablecoins to convert or
+    stale orders to cancel
+    """
+
+    user = context.user
+    purchase_balance = Decimal(0)
+
+    for exchange in user.exchanges:
+        exchange_portfolio = context.portfolio(exchange)
+        exchange_purchase_balance = market_buy.purchasing_currency_in_portfolio(user, exchange_portfolio)
+        purchase_balance += exchange_purchase_balance
+
+        if exchange_purchase_balance >= exchanges.purchase_minimum(exchange):
+            return None
+
+        if user.convert_stablecoins and convert_stablecoins.stablecoin_conversions(user, exchange, exchange_portfolio):
+            log.info("stablecoins need converting", exchange=exchange)
+            return None
+
+        # cancelling frees up the currency held by the order
+        if user.buy_strategy == MarketBuyStrategy.LIMIT and user.cancel_stale_orders and open_orders.stale_open_orders(user, exchange, context):
+            log.info("stale orders need cancelling", exchange=exchange)
+            return None
+
+    if purchase_balance == 0:
+        return SkipReason.NO_PURCHASING_CURRENCY
+
+    return SkipReason.BELOW_PURCHASE_MINIMUM
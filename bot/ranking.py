@@ -0,0 +1,182 @@
+"""
+Ranking engine used to determine the order coins are purchased in.
+
+Each criterion computes a score for a coin, lower scores are bought first. Criteria are ordered from highest to
+lowest priority and combined into a single composite sort key, so the ranking is a single O(n log n) sort. Ties
+keep the order of the index, since python's sort is stable.
+
+New criteria can be added by inserting a `RankingCriterion` into a copy of `DEFAULT_RANKING_CRITERIA` at the
+priority it should have.
+"""
+
+import typing as t
+from decimal import Decimal
+
+from .analytics import MarketAnalytics
+from .data_types import CryptoData
+from .portfolio import Portfolio
+from .user import User
+from .utils import log
+
+
+class RankingContext(t.NamedTuple):
+    merged_portfolio: Portfolio
+    deprioritized_coins: t.List[str]
+    user: User
+    # only required by the momentum criterion
+    analytics: t.Optional[MarketAnalytics] = None
+
+    def current_percentage(self, coin_data: CryptoData) -> t.Optional[Decimal]:
+        balance = self.merged_portfolio.get(coin_data["symbol"])
+        return balance.percentage if balance else None
+
+
+class RankingCriterion(t.NamedTuple):
+    name: str
+    # lower scores are bought first
+    score: t.Callable[[CryptoData, RankingContext], t.Any]
+    # criteria which depend on optional user configuration are skipped when that configuration is not set
+    is_enabled: t.Callable[[User], bool] = lambda _user: True
+
+
+class RankedCoin(t.NamedTuple):
+    coin: CryptoData
+    # criterion name => score, in priority order
+    scores: t.Dict[str, t.Any]
+
+
+def is_coin_deprioritized_by_user(coin_data: CryptoData, context: RankingContext) -> int:
+    if coin_data["symbol"] in context.deprioritized_coins:
+        log.debug("coin is in user's deprioritized list, deprioritized", symbol=coin_data["symbol"])
+        return 1
+
+    return 0
+
+
+def does_token_drift_percentage_limit(coin_data: CryptoData, context: RankingContext) -> int:
+    current_percentage = context.current_percentage(coin_data)
+    target_percentage = coin_data["percentage"]
+
+    # criterion is only enabled when the limit is set, which is why we can safely cast
+    allocation_drift_percentage_limit = t.cast(int, context.user.allocation_drift_percentage_limit)
+
+    if not current_percentage:
+        return 0
+
+    percentage_delta = target_percentage - current_percentage
+    if percentage_delta > allocation_drift_percentage_limit:
+        log.debug("allocation drift percentage exceeded, prioritizing", symbol=coin_data["symbol"], drift=percentage_delta)
+        return -1 * int(percentage_delta)
+
+    return 0
+
+
+# prioritize tokens that either:
+#   - are not owned or
+#   - our target allocation is off by a user-specified factor (defaults to five)
+#
+# some notes:
+#   - by returning zero we are holding previous sorting constant
+#   - previously, we only prioritized tokens with >1% market cap, but I decided this is not a good strategy
+#     if allocation is off on a smaller token, we want to prioritize it so we can rebalance before the cost
+#     of fully rebalancing gets too high.
+def should_token_be_treated_as_unowned(coin_data: CryptoData, context: RankingContext) -> int:
+    target_percentage = coin_data["percentage"]
+    current_percentage = context.current_percentage(coin_data)
+
+    # if don't special case unowned coins, then we'll most likely prioritize other coins under the target multiple
+    # above new coins, which is not something I want to do. Getting some exposer to new coins is a high priority
+    # so we want to prioritize unowned tokens as marginally owned (0.01)
+    if current_percentage is None:
+        current_percentage = Decimal("0.01")
+
+    # criterion is only enabled when the limit is set, which is why we can safely cast
+    allocation_drift_multiple_limit = t.cast(int, context.user.allocation_drift_multiple_limit)
+
+    # if the current allocation is off by a user-defined factor, prioritize it
+    # note that this is prioritized by a relative % factor, not an absolute %.
+    # for instance, if target allocation is 1% but you currently hold 0.1% anything up
+    # to a `allocation_drift_multiple_limit` of 10 would trigger this coin to be prioritized
+    # for absolute % prioritization, use `allocation_drift_percentage_limit`
+    current_allocation_multiple = target_percentage / current_percentage
+    if current_allocation_multiple > allocation_drift_multiple_limit:
+        log.debug(
+            "allocation percentage drift multiple exceeds user-specified percentage, prioritizing",
+            symbol=coin_data["symbol"],
+            drift_multiple=current_allocation_multiple,
+        )
+        return int(current_allocation_multiple) * -1
+
+    return 0
+
+
+# prioritize tokens we don't own yet
+# previously, in this logic, coins with holdings below the minimum purchase amount were considered unowned
+# instead of being prioritized here, they will be prioritized in the (optional) `allocation_drift_multiple_limit`
+# filtering by the minimum ownership amount would cause purchases to be made against tokens which are not as off
+# from a relative or absolute percentage basis as other tokens
+def is_token_unowned(coin_data: CryptoData, context: RankingContext) -> int:
+    if coin_data["symbol"] not in context.merged_portfolio:
+        log.debug("coin not in current allocation or does not exceed the minimum purchase amount, prioritizing", symbol=coin_data["symbol"])
+        return 0
+
+    return 1
+
+
+# prioritize coins with the highest drop/lowest gains in the last 30d
+# TODO maybe we should apply some filter here? Only sort when change exceeds a treshold?
+# TODO should we use 7d change vs 30?
+def recent_change(coin_data: CryptoData, _context: RankingContext) -> t.Any:
+    return coin_data["change_30d"]
+
+
+# same as `recent_change`, but measured from exchange candles, which reflects the price actually paid on the exchange
+def recent_momentum(coin_data: CryptoData, context: RankingContext) -> float:
+    momentum = context.analytics.momentum_for(coin_data["symbol"]) if context.analytics else None
+
+    # coins without enough candles keep their position in the index
+    return momentum if momentum is not None else 0.0
+
+
+# TODO think about grouping drops into tranches so this criterion isn't completely overshadowed by the ones above
+# sort by coins with the largest allocation delta
+def target_delta(coin_data: CryptoData, context: RankingContext) -> Decimal:
+    return (context.current_percentage(coin_data) or Decimal(0)) - coin_data["percentage"]
+
+
+# highest priority first
+DEFAULT_RANKING_CRITERIA: t.List[RankingCriterion] = [
+    RankingCriterion("deprioritized", is_coin_deprioritized_by_user),
+    RankingCriterion(
+        "allocation_drift_percentage", does_token_drift_percentage_limit, is_enabled=lambda user: bool(user.allocation_drift_percentage_limit)
+    ),
+    RankingCriterion(
+        "allocation_drift_multiple", should_token_be_treated_as_unowned, is_enabled=lambda user: bool(user.allocation_drift_multiple_limit)
+    ),
+    RankingCriterion("unowned", is_token_unowned),
+    RankingCriterion("change_30d", recent_change, is_enabled=lambda user: not user.rank_by_momentum),
+    RankingCriterion("momentum", recent_momentum, is_enabled=lambda user: user.rank_by_momentum),
+    RankingCriterion("target_delta", target_delta),
+]
+
+
+def rank_coins(coins: t.Iterable[CryptoData], context: RankingContext, criteria: t.Optional[t.List[RankingCriterion]] = None) -> t.List[RankedCoin]:
+    """
+    Scores every coin once and sorts on the composite key. Returns the coins in purchase order,
+    along with the score each criterion assigned to it.
+    """
+
+    if criteria is None:
+        criteria = DEFAULT_RANKING_CRITERIA
+
+    enabled_criteria = [criterion for criterion in criteria if criterion.is_enabled(context.user)]
+
+    ranked_coins = [
+        RankedCoin(coin=coin_data, scores={criterion.name: criterion.score(coin_data, context) for criterion in enabled_criteria})
+        for coin_data in coins
+    ]
+
+    # dicts preserve insertion order, so the score tuple is in priority order
+    ranked_coins.sort(key=lambda ranked_coin: tuple(ranked_coin.scores.values()))
+
+    return ranked_coins
@@ -0,0 +1,358 @@
+"""
+Governs how fast we hit the binance API. Binance limits request weight and order counts per IP, and all workers share
+a single egress IP, so the budget has to be shared by every process and node making requests.
+
+Each limit is a token bucket. In django the buckets live in redis and are updated atomically with lua scripts, outside
+of django (single-user CLI) they are kept in process. Binance reports how much of each limit has been used in the
+response headers, so the buckets are corrected after every response to account for requests we didn't make ourselves.
+"""
+
+import functools
+import re
+import threading
+import time
+import typing as t
+
+from .utils import in_django_environment, log
+
+# fraction of each limit which is never used, so a small amount of drift between our count and binance's doesn't get us banned
+HEADROOM = 0.1
+
+# give up instead of blocking a worker forever if the API is saturated
+MAX_WAIT_SECONDS = 120
+
+# binance does not always include `Retry-After`, default to waiting out a full request weight interval
+DEFAULT_RETRY_AFTER_SECONDS = 60
+
+# refilled token counts are floats, so a bucket which is "full enough" can be a rounding error short of the cost
+TOKEN_TOLERANCE = 1e-6
+
+# don't spin on tiny waits, other workers are competing for the same tokens anyway
+MIN_WAIT_SECONDS = 0.01
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimit(t.NamedTuple):
+    name: str
+    limit: int
+    interval_seconds: int
+    # response header reporting how much of the limit the IP has used in the current interval
+    used_header: str
+
+    @property
+    def capacity(self) -> float:
+        return self.limit * (1 - HEADROOM)
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.capacity / self.interval_seconds
+
+
+# https://docs.binance.us/#limits
+REQUEST_WEIGHT_LIMIT = RateLimit(name="request_weight", limit=1200, interval_seconds=60, used_header="x-mbx-used-weight-1m")
+ORDER_LIMIT = RateLimit(name="orders", limit=100, interval_seconds=10, used_header="x-mbx-order-count-10s")
+
+RATE_LIMITS = [REQUEST_WEIGHT_LIMIT, ORDER_LIMIT]
+
+DEFAULT_ENDPOINT_WEIGHT = 1
+
+# request weights of the endpoints we use which cost more than the default
+ENDPOINT_WEIGHTS = {
+    "account": 10,
+    "allOrders": 10,
+    "exchangeInfo": 10,
+    "myTrades": 10,
+    "openOrders": 3,
+    "ticker/24hr": 1,
+}
+
+# some endpoints are much more expensive when they are not scoped to a single symbol
+ENDPOINT_WEIGHTS_WITHOUT_SYMBOL = {
+    "openOrders": 40,
+    "ticker/24hr": 40,
+    "ticker/price": 2,
+}
+
+# "https://api.binance.us/api/v3/ticker/price" => "ticker/price"
+ENDPOINT_PATTERN = re.compile(r"/(?:api|sapi|wapi)/v\d+/([^?]+)")
+
+
+def endpoint_path(uri: str) -> str:
+    if match := ENDPOINT_PATTERN.search(uri):
+        return match.group(1)
+
+    return uri
+
+
+def request_weight(path: str, params: t.Optional[t.Dict]) -> int:
+    if not (params or {}).get("symbol") and path in ENDPOINT_WEIGHTS_WITHOUT_SYMBOL:
+        return ENDPOINT_WEIGHTS_WITHOUT_SYMBOL[path]
+
+    return ENDPOINT_WEIGHTS.get(path, DEFAULT_ENDPOINT_WEIGHT)
+
+
+def is_order_request(method: str, path: str) -> bool:
+    # test orders and cancellations do not count towards the order limit
+    return method == "post" and path in ("order", "order/oco")
+
+
+def request_costs(method: str, uri: str, params: t.Optional[t.Dict]) -> t.List[t.Tuple[RateLimit, int]]:
+    path = endpoint_path(uri)
+    costs = [(REQUEST_WEIGHT_LIMIT, request_weight(path, params))]
+
+    if is_order_request(method, path):
+        costs.append((ORDER_LIMIT, 1))
+
+    return costs
+
+
+class TokenBucketStore(t.Protocol):
+    def take(self, rate_limit: RateLimit, cost: int) -> float:
+        """
+        Takes `cost` tokens if they are available. Returns 0 on success, otherwise the seconds to wait before trying again.
+        """
+        ...
+
+    def observe(self, rate_limit: RateLimit, used: t.Optional[int], blocked_for: float) -> None:
+        """
+        Corrects the bucket with the usage reported by binance, and blocks it for `blocked_for` seconds
+        """
+        ...
+
+
+class LocalTokenBuckets:
+    """
+    Token buckets for a single process
+    """
+
+    def __init__(self, clock: t.Callable[[], float] = time.monotonic):
+        self.clock = clock
+        # limit name => (tokens, updated_at, blocked_until)
+        self._buckets: t.Dict[str, t.Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _refilled(self, rate_limit: RateLimit, now: float) -> t.Tuple[float, float]:
+        tokens, updated_at, blocked_until = self._buckets.get(rate_limit.name, (rate_limit.capacity, now, 0.0))
+        tokens = min(rate_limit.capacity, tokens + max(0.0, now - updated_at) * rate_limit.refill_per_second)
+        return tokens, blocked_until
+
+    def take(self, rate_limit: RateLimit, cost: int) -> float:
+        with self._lock:
+            now = self.clock()
+            tokens, blocked_until = self._refilled(rate_limit, now)
+            cost = min(cost, rate_limit.capacity)
+            wait = 0.0
+
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif tokens + TOKEN_TOLERANCE < cost:
+                wait = (cost - tokens) / rate_limit.refill_per_second
+            else:
+                tokens = max(0.0, tokens - cost)
+
+            self._buckets[rate_limit.name] = (tokens, now, blocked_until)
+            return wait
+
+    def observe(self, rate_limit: RateLimit, used: t.Optional[int], blocked_for: float) -> None:
+        with self._lock:
+            now = self.clock()
+            tokens, blocked_until = self._refilled(rate_limit, now)
+
+            if used is not None:
+                tokens = min(tokens, rate_limit.capacity - used)
+
+            blocked_until = max(blocked_until, now + blocked_for)
+            self._buckets[rate_limit.name] = (tokens, now, blocked_until)
+
+
+# both scripts use the redis server clock, so buckets are consistent across nodes regardless of clock drift
+_REDIS_REFILL = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'blocked_until')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+local blocked_until = tonumber(state[3]) or 0
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * refill_per_second)
+"""
+
+_REDIS_SAVE = """
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now), 'blocked_until', tostring(blocked_until))
+redis.call('EXPIRE', KEYS[1], math.ceil(math.max(capacity / refill_per_second, blocked_until - now)) + 60)
+"""
+
+# ARGV: capacity, refill_per_second, cost, tolerance
+REDIS_TAKE_SCRIPT = (
+    _REDIS_REFILL
+    + """
+local cost = math.min(tonumber(ARGV[3]), capacity)
+local wait = 0
+if blocked_until > now then
+  wait = blocked_until - now
+elseif tokens + tonumber(ARGV[4]) < cost then
+  wait = (cost - tokens) / refill_per_second
+else
+  tokens = math.max(0, tokens - cost)
+end
+"""
+    + _REDIS_SAVE
+    # lua numbers are truncated to integers when returned to redis, strings are not
+    + "return tostring(wait)"
+)
+
+# ARGV: capacity, refill_per_second, used (-1 if not reported), blocked_for
+REDIS_OBSERVE_SCRIPT = (
+    _REDIS_REFILL
+    + """
+local used = tonumber(ARGV[3])
+if used >= 0 then
+  tokens = math.min(tokens, capacity - used)
+end
+blocked_until = math.max(blocked_until, now + tonumber(ARGV[4]))
+"""
+    + _REDIS_SAVE
+    # scripts without a return value return nil, which is indistinguishable from an unsupported script
+    + "return 1"
+)
+
+
+class RedisTokenBuckets:
+    """
+    Token buckets shared by every worker connected to the same redis
+    """
+
+    KEY_PREFIX = "binance_rate_limit"
+
+    def __init__(self, connection):
+        self._take = connection.register_script(REDIS_TAKE_SCRIPT)
+        self._observe = connection.register_script(REDIS_OBSERVE_SCRIPT)
+        # used if the redis server can't run the scripts
+        self._fallback: t.Optional[LocalTokenBuckets] = None
+
+    def _key(self, rate_limit: RateLimit) -> str:
+        return f"{self.KEY_PREFIX}:{rate_limit.name}"
+
+    def _run_script(self, script, rate_limit: RateLimit, args: t.List) -> t.Optional[t.Any]:
+        from redis.exceptions import ResponseError
+
+        try:
+            return script(keys=[self._key(rate_limit)], args=args)
+        except (NotImplementedError, ResponseError) as e:
+            # some redis compatible servers (and fakes) don't support lua scripting
+            log.warn("redis does not support rate limit scripts, limiting requests within this process", error=str(e))
+            self._fallback = LocalTokenBuckets()
+            return None
+
+    def take(self, rate_limit: RateLimit, cost: int) -> float:
+        if self._fallback is None:
+            wait = self._run_script(self._take, rate_limit, [rate_limit.capacity, rate_limit.refill_per_second, cost, TOKEN_TOLERANCE])
+
+            if wait is not None:
+                return float(wait)
+
+        assert self._fallback is not None
+        return self._fallback.take(rate_limit, cost)
+
+    def observe(self, rate_limit: RateLimit, used: t.Optional[int], blocked_for: float) -> None:
+        if self._fallback is None:
+            used_arg = -1 if used is None else used
+
+            if self._run_script(self._observe, rate_limit, [rate_limit.capacity, rate_limit.refill_per_second, used_arg, blocked_for]) is not None:
+                return
+
+        assert self._fallback is not None
+        self._fallback.observe(rate_limit, used, blocked_for)
+
+
+class RateLimitGovernor:
+    def __init__(self, buckets: TokenBucketStore, max_wait_seconds: float = MAX_WAIT_SECONDS, sleep: t.Callable[[float], None] = time.sleep):
+        self.buckets = buckets
+        self.max_wait_seconds = max_wait_seconds
+        self.sleep = sleep
+
+    def acquire(self, method: str, uri: str, params: t.Optional[t.Dict] = None) -> None:
+        """
+        Blocks until the request can be made without exceeding any binance limit
+        """
+
+        for rate_limit, cost in request_costs(method, uri, params):
+            self._take(rate_limit, cost, uri)
+
+    def _take(self, rate_limit: RateLimit, cost: int, uri: str) -> None:
+        waited = 0.0
+
+        while (wait := self.buckets.take(rate_limit, cost)) > 0:
+            if waited + wait > self.max_wait_seconds:
+                raise RateLimitExceeded(f"{rate_limit.name} budget exhausted, waited {waited:.1f}s for {uri}")
+
+            log.info("throttling binance request", limit=rate_limit.name, cost=cost, wait=wait, uri=uri)
+
+            # other workers may take tokens while we sleep, so the bucket is checked again rather than assuming success
+            wait = max(wait, MIN_WAIT_SECONDS)
+            self.sleep(wait)
+            waited += wait
+
+    def record_response(self, response) -> None:
+        headers = response.headers
+        blocked_for = 0.0
+
+        # 429 is a warning that the limits have been exceeded, 418 means the IP has been banned
+        if response.status_code in (418, 429):
+            blocked_for = float(headers.get("retry-after") or DEFAULT_RETRY_AFTER_SECONDS)
+            log.warn("binance rate limit exceeded", status=response.status_code, retry_after=blocked_for)
+
+        for rate_limit in RATE_LIMITS:
+            used = headers.get(rate_limit.used_header)
+
+            if used is not None or blocked_for:
+                self.buckets.observe(rate_limit, int(used) if used is not None else None, blocked_for)
+
+
+def _shared_token_buckets() -> t.Optional[RedisTokenBuckets]:
+    from django_redis import get_redis_connection
+
+    try:
+        connection = get_redis_connection("default")
+    except NotImplementedError:
+        # the django cache is not backed by redis, so there is nothing to share the budget through
+        log.warn("cache backend is not redis, limiting requests within this process")
+        return None
+
+    return RedisTokenBuckets(connection)
+
+
+@functools.cache
+def governor() -> RateLimitGovernor:
+    if in_django_environment() and (shared_buckets := _shared_token_buckets()):
+        return RateLimitGovernor(shared_buckets)
+
+    return RateLimitGovernor(LocalTokenBuckets())
+
+
+@functools.cache
+def governed_binance_client_class():
+    """
+    A binance client which runs every request through the rate limit governor
+    """
+
+    # python-binance is slow to import, only load it when the API is actually used
+    from binance.client import Client
+
+    class GovernedBinanceClient(Client):
+        def _request(self, method, uri: str, signed: bool, force_params: bool = False, **kwargs):
+            limiter = governor()
+            limiter.acquire(method, uri, kwargs.get("data"))
+
+            # unlike the base client, the response isn't stored on `self.response`: a client is shared by the threads
+            # of a run, and each request must handle and record its own response
+            response = getattr(self.session, method)(uri, **self._get_request_kwargs(method, signed, force_params, **kwargs))
+            limiter.record_response(response)
+
+            return self._handle_response(response)
+
+    return GovernedBinanceClient
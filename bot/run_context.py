@@ -0,0 +1,120 @@
+"""
+A `RunContext` memoizes account and order data for a single user run, so each exchange endpoint is hit once per run
+even though several steps of the run (cancelling stale orders, converting stablecoins, buying) read the same data.
+
+Orders must be placed and cancelled through the context. Doing so invalidates the data cached for that exchange,
+since balances and open orders change as soon as an order is placed or cancelled.
+"""
+
+import threading
+import typing as t
+from decimal import Decimal
+
+from . import exchanges, market_cap, user_data_stream
+from .data_types import CryptoBalance, CryptoData, ExchangeOrder, SupportedExchanges
+from .user import User
+from .utils import log
+
+T = t.TypeVar("T")
+
+
+class RunContext:
+    def __init__(self, user: User):
+        self.user = user
+
+        self._values: t.Dict[t.Tuple[str, t.Optional[SupportedExchanges]], t.Any] = {}
+        # a lock per key, so concurrent steps of the run wait for a single request instead of duplicating it
+        self._locks: t.Dict[t.Tuple[str, t.Optional[SupportedExchanges]], threading.Lock] = {}
+        # incremented whenever an exchange is invalidated, so a request which was in flight at the time isn't stored
+        self._generations: t.Dict[t.Optional[SupportedExchanges], int] = {}
+        self._state_lock = threading.Lock()
+
+    def _memoized(self, name: str, exchange: t.Optional[SupportedExchanges], loader: t.Callable[[], T]) -> T:
+        key = (name, exchange)
+
+        with self._state_lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            with self._state_lock:
+                if key in self._values:
+                    return self._values[key]
+
+                generation = self._generations.get(exchange, 0)
+
+            value = loader()
+
+            with self._state_lock:
+                # an order was placed or cancelled while loading, the value may be from before the order
+                if self._generations.get(exchange, 0) == generation:
+                    self._values[key] = value
+
+            return value
+
+    def invalidate(self, exchange: SupportedExchanges) -> None:
+        """
+        Account data for `exchange` will be pulled from the exchange again on next use
+        """
+
+        log.debug("invalidating run data", exchange=exchange)
+
+        with self._state_lock:
+            self._generations[exchange] = self._generations.get(exchange, 0) + 1
+
+            for key in [key for key in self._values if key[1] == exchange]:
+                del self._values[key]
+
+    def portfolio(self, exchange: SupportedExchanges) -> t.List[CryptoBalance]:
+        return self._memoized("portfolio", exchange, lambda: self._load_portfolio(exchange))
+
+    def _load_portfolio(self, exchange: SupportedExchanges) -> t.List[CryptoBalance]:
+        # the balances kept by the user data stream are current, until this run places an order which the stream
+        # may not have reported yet
+        if exchange == SupportedExchanges.BINANCE and not self._generations.get(exchange):
+            if (streamed_portfolio := user_data_stream.streamed_portfolio(self.user)) is not None:
+                log.debug("using balances from the user data stream")
+                return streamed_portfolio
+
+        return exchanges.portfolio(exchange, self.user)
+
+    def record_portfolio(self, exchange: SupportedExchanges, portfolio: t.List[CryptoBalance]) -> None:
+        """
+        Stores balances the run worked out itself (i.e. by applying the fills of its orders), so they are used instead
+        of pulling the account again. The next order placed or cancelled invalidates them as usual.
+        """
+
+        with self._state_lock:
+            self._values[("portfolio", exchange)] = portfolio
+
+    def open_orders(self, exchange: SupportedExchanges) -> t.List[ExchangeOrder]:
+        return self._memoized("open_orders", exchange, lambda: exchanges.open_orders(exchange, self.user))
+
+    def coins_with_market_cap(self) -> t.List[CryptoData]:
+        # market data is not changed by the user's orders, so this is never invalidated
+        return self._memoized("coins_with_market_cap", None, lambda: market_cap.coins_with_market_cap(self.user))
+
+    def market_buy(self, exchange: SupportedExchanges, symbol: str, purchasing_currency: str, amount: Decimal) -> ExchangeOrder:
+        try:
+            return exchanges.market_buy(exchange=exchange, user=self.user, symbol=symbol, purchasing_currency=purchasing_currency, amount=amount)
+        finally:
+            self.invalidate(exchange)
+
+    def limit_buy(self, exchange: SupportedExchanges, purchasing_currency: str, symbol: str, quantity: Decimal, price: Decimal) -> ExchangeOrder:
+        try:
+            return exchanges.limit_buy(
+                exchange=exchange, user=self.user, purchasing_currency=purchasing_currency, symbol=symbol, quantity=quantity, price=price
+            )
+        finally:
+            self.invalidate(exchange)
+
+    def market_sell(self, exchange: SupportedExchanges, symbol: str, purchasing_currency: str, amount: Decimal):
+        try:
+            return exchanges.market_sell(exchange=exchange, user=self.user, symbol=symbol, purchasing_currency=purchasing_currency, amount=amount)
+        finally:
+            self.invalidate(exchange)
+
+    def cancel_order(self, exchange: SupportedExchanges, order: ExchangeOrder):
+        try:
+            return exchanges.cancel_order(exchange, self.user, order)
+        finally:
+            self.invalidate(exchange)
@@ -0,0 +1,81 @@
+"""
+Spreads the hourly user runs across the hour, so the exchange, redis and the database see a steady trickle of runs
+instead of every user at the top of the hour.
+
+Users are split into shards by a hash of their id, so each worker node can schedule its own users. Within a shard,
+users are ordered by priority and each is given an evenly spaced slot of the period, which keeps the rate of runs flat
+no matter how many users there are. A user's offset within its slot is also derived from a hash of its id: it is
+stable from one cycle to the next, but runs don't line up on the slot boundaries.
+"""
+
+import hashlib
+import typing as t
+from datetime import datetime
+from decimal import Decimal
+
+DEFAULT_SCHEDULE_PERIOD_SECONDS = 60 * 60
+
+
+class SchedulableUser(t.NamedTuple):
+    id: int
+    last_ordered_at: t.Optional[datetime]
+    # purchasing currency left uninvested by the user's last run
+    pending_balance: t.Optional[Decimal]
+
+
+class ScheduledRun(t.NamedTuple):
+    user_id: int
+    # seconds after the start of the cycle
+    delay: float
+
+
+def _stable_fraction(key: str) -> float:
+    # python's `hash` is randomized per process, which would move users between shards & slots on every deploy
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def shard_for_user(user_id: int, shard_count: int) -> int:
+    return int(_stable_fraction(f"shard:{user_id}") * shard_count)
+
+
+def run_priority(user: SchedulableUser) -> t.Tuple:
+    """
+    Lower values run earlier in the cycle:
+
+    1. Users with currency left over from the last run, largest balance first. These have money waiting to be invested.
+    2. Users who have never placed an order, since their account hasn't been invested at all
+    3. Users who have gone the longest without an order
+    """
+
+    return (
+        -(user.pending_balance or 0),
+        user.last_ordered_at is not None,
+        user.last_ordered_at.timestamp() if user.last_ordered_at else 0,
+        # keeps the order, and therefore the slots, independent of the order users are loaded in
+        user.id,
+    )
+
+
+def schedule_user_runs(
+    users: t.Iterable[SchedulableUser],
+    shard: int = 0,
+    shard_count: int = 1,
+    period_seconds: float = DEFAULT_SCHEDULE_PERIOD_SECONDS,
+) -> t.List[ScheduledRun]:
+    """
+    Runs for the users in `shard`, in the order they should be started
+    """
+
+    assert 0 <= shard < shard_count, f"shard {shard} is out of range for {shard_count} shards"
+
+    shard_users = sorted((user for user in users if shard_for_user(user.id, shard_count) == shard), key=run_priority)
+
+    if not shard_users:
+        return []
+
+    slot_seconds = period_seconds / len(shard_users)
+
+    return [
+        ScheduledRun(user_id=user.id, delay=(rank + _stable_fraction(f"offset:{user.id}")) * slot_seconds) for rank, user in enumerate(shard_users)
+    ]
@@ -0,0 +1,130 @@
+"""
+Measures where CLI startup time goes. The command is re-run in a fresh interpreter with `-X importtime`, which
+reports how long each module import took, and the timings are grouped by top-level package.
+
+The cron deployment runs `main.py buy` from a cold interpreter every hour, so import time is paid on every run.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import time
+import typing as t
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import time:       self [us] |  cumulative | imported package
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$")
+
+
+class ImportTiming(t.NamedTuple):
+    module: str
+    # microseconds spent importing the module itself, excluding its imports
+    self_us: int
+    # microseconds including everything the module imported
+    cumulative_us: int
+    # how deeply nested the import was, 0 for imports made directly by the command
+    depth: int
+
+
+class StartupProfile(t.NamedTuple):
+    command: t.List[str]
+    wall_seconds: float
+    returncode: int
+    imports: t.List[ImportTiming]
+
+    @property
+    def import_seconds(self) -> float:
+        return sum(timing.self_us for timing in self.imports) / 1_000_000
+
+    def imported_modules(self) -> t.Set[str]:
+        return {timing.module for timing in self.imports}
+
+    def by_package(self) -> t.List[t.Tuple[str, int]]:
+        totals: t.Dict[str, int] = {}
+
+        for timing in self.imports:
+            package = timing.module.split(".")[0]
+            totals[package] = totals.get(package, 0) + timing.self_us
+
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def parse_import_times(stderr: str) -> t.Tuple[t.List[ImportTiming], t.List[str]]:
+    """
+    Splits `-X importtime` output from the rest of stderr
+    """
+
+    imports = []
+    other_lines = []
+
+    for line in stderr.splitlines():
+        if match := IMPORT_TIME_PATTERN.match(line):
+            self_us, cumulative_us, indent, module = match.groups()
+            # the module name is indented by two spaces per level, after the single separator space
+            imports.append(ImportTiming(module=module, self_us=int(self_us), cumulative_us=int(cumulative_us), depth=(len(indent) - 1) // 2))
+        elif not line.startswith("import time:"):
+            other_lines.append(line)
+
+    return imports, other_lines
+
+
+def _run_with_import_times(python_args: t.List[str], command: t.List[str], passthrough: bool = True) -> StartupProfile:
+    started_at = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", *python_args], capture_output=True, text=True, cwd=PROJECT_ROOT)
+    wall_seconds = time.perf_counter() - started_at
+
+    imports, other_lines = parse_import_times(result.stderr)
+
+    # pass through everything the command wrote so the profile doesn't hide errors
+    if passthrough:
+        sys.stdout.write(result.stdout)
+
+        if other_lines:
+            sys.stderr.write("\n".join(other_lines) + "\n")
+
+    return StartupProfile(command=command, wall_seconds=wall_seconds, returncode=result.returncode, imports=imports)
+
+
+def profile_command(args: t.List[str]) -> StartupProfile:
+    """
+    Runs `main.py` with `args` and records every import made while it ran
+    """
+
+    return _run_with_import_times([os.path.join(PROJECT_ROOT, "main.py"), *args], command=args)
+
+
+def profile_imports(modules: t.List[str]) -> StartupProfile:
+    """
+    Records the cost of importing the CLI along with `modules`, without running anything. Useful for measuring the
+    cold start of a command without needing API access.
+    """
+
+    statements = "; ".join(f"import {module}" for module in ["main", *modules])
+    return _run_with_import_times(["-c", statements], command=modules, passthrough=False)
+
+
+def profile_report(profile: StartupProfile, limit: int = 15) -> str:
+    from tabulate import tabulate
+
+    package_rows = [
+        {"package": package, "ms": self_us / 1000, "%": self_us / 1_000_000 / profile.import_seconds * 100}
+        for package, self_us in profile.by_package()[:limit]
+    ]
+
+    # the imports made directly by main.py and the bot, which is where lazy imports can make a difference
+    top_level_rows = [
+        {"module": timing.module, "cumulative ms": timing.cumulative_us / 1000}
+        for timing in sorted(profile.imports, key=lambda timing: timing.cumulative_us, reverse=True)
+        if timing.module.split(".")[0] in ("bot", "users", "botweb")
+    ][:limit]
+
+    return "\n\n".join(
+        [
+            f"Command: main.py {' '.join(profile.command)}",
+            f"Total: {profile.wall_seconds * 1000:.0f}ms, imports: {profile.import_seconds * 1000:.0f}ms ({len(profile.imports)} modules)",
+            tabulate(package_rows, headers="keys", tablefmt="github", floatfmt=".1f"),
+            tabulate(top_level_rows, headers="keys", tablefmt="github", floatfmt=".1f"),
+        ]
+    )
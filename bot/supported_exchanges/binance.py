@@ -1,12 +1,14 @@
 import decimal
 import functools
 import math
+import threading
 import typing as t
+from collections import OrderedDict
 from decimal import Decimal
 
-from binance.client import Client as BinanceClient
+from decouple import config
 
-from .. import utils
+from .. import cache, market_data_stream, market_snapshot, order_validation, rate_limit
 from ..data_types import (
     CryptoBalance,
     ExchangeOrder,
@@ -17,6 +19,12 @@ from ..data_types import (
 from ..user import User
 from ..utils import log
 
+if t.TYPE_CHECKING:
+    from binance.client import Client as BinanceClient
+
+# websocket streams, which push market and account updates instead of being polled
+BINANCE_STREAM_URL = config("BINANCE_STREAM_URL", default="wss://stream.binance.us:9443")
+
 # binance.us API is difference from binance.com
 # https://github.com/binance-us/binance-official-api-docs
 # https://docs.binance.us/#introduction
@@ -28,30 +36,123 @@ from ..utils import log
 # https://github.com/timggraf/crypto-index-bot seems to have details about binance errors. Need to handle more error types
 
 
+# clients are held for this many API keys, the least recently used client is dropped past that
+MAX_CACHED_CLIENTS = 256
+
+# connections kept open to each binance host, shared by every client in the process. This should cover the order
+# threads of a run plus the public requests made alongside them.
+POOL_CONNECTIONS_PER_HOST = 32
+
+
+@functools.cache
+def pooled_http_adapter():
+    """
+    Holds the keep-alive connections of every binance client in the process, so a client reuses a warm TLS
+    connection instead of opening its own
+    """
+
+    from requests.adapters import HTTPAdapter
+
+    return HTTPAdapter(pool_connections=4, pool_maxsize=POOL_CONNECTIONS_PER_HOST)
+
+
+@functools.cache
+def pooled_binance_client_class():
+    class PooledBinanceClient(rate_limit.governed_binance_client_class()):
+        def _init_session(self):
+            # the session holds this client's API key header, the connections come from the shared adapter
+            session = super()._init_session()
+            session.mount("https://", pooled_http_adapter())
+            return session
+
+    return PooledBinanceClient
+
+
 # initializing a new client actually hits the `ping` endpoint on the API
 # which is on of the reasons we want to cache it
+def binance_client(api_key: str, secret_key: str) -> "BinanceClient":
+    # every client shares the rate limit budget of our IP
+    return pooled_binance_client_class()(api_key, secret_key, tld="us")
+
+
+class BinanceClientRegistry:
+    """
+    Process-wide LRU of clients keyed by API key, so every task run for a user in a worker shares one client
+    """
+
+    def __init__(self, max_clients: int = MAX_CACHED_CLIENTS, build_client: t.Callable[[str, str], "BinanceClient"] = binance_client):
+        self.max_clients = max_clients
+        self._build_client = build_client
+        self._clients: "OrderedDict[str, t.Tuple[str, BinanceClient]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, api_key: str, secret_key: str) -> t.Optional["BinanceClient"]:
+        entry = self._clients.get(api_key)
+
+        # a changed secret needs a new client
+        if entry is None or entry[0] != secret_key:
+            return None
+
+        self._clients.move_to_end(api_key)
+        return entry[1]
+
+    def get(self, api_key: str, secret_key: str) -> "BinanceClient":
+        with self._lock:
+            if (client := self._cached(api_key, secret_key)) is not None:
+                return client
+
+        # building a client makes a request, which shouldn't block threads getting other clients
+        client = self._build_client(api_key, secret_key)
+
+        with self._lock:
+            # another thread may have built the same client in the meantime
+            if (cached_client := self._cached(api_key, secret_key)) is not None:
+                return cached_client
+
+            self._clients[api_key] = (secret_key, client)
+
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+
+        return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+client_registry = BinanceClientRegistry()
+
+
+def cached_binance_client(api_key: str, secret_key: str) -> "BinanceClient":
+    return client_registry.get(api_key, secret_key)
+
+
 @functools.cache
-def public_binance_client() -> BinanceClient:
-    return BinanceClient("", "", tld="us")
+def public_binance_client() -> "BinanceClient":
+    return binance_client("", "")
 
 
 def binance_purchase_minimum() -> Decimal:
     return Decimal(10)
 
 
-def can_buy_in_binance(symbol: str, purchasing_currency: str) -> bool:
-    for coin in binance_all_symbol_info():
-        if coin["baseAsset"] == symbol and coin["quoteAsset"] == purchasing_currency:
-            return True
+def binance_tradable_pairs() -> t.FrozenSet[t.Tuple[str, str]]:
+    return binance_symbol_index().pairs
 
-    return False
+
+def can_buy_in_binance(symbol: str, purchasing_currency: str) -> bool:
+    return binance_symbol_index().has_pair(symbol, purchasing_currency)
 
 
 def is_trading_active_for_coin_in_binance(symbol: str, purchasing_currency: str) -> bool:
     paired_symbol = symbol + purchasing_currency
-    binance_symbol_info = binance_get_symbol_info(paired_symbol)
+    binance_symbol = binance_symbol_index().get(paired_symbol)
 
-    if binance_symbol_info is None:
+    if binance_symbol is None:
         log.warn("symbol did not return any data", symbol=symbol)
         return False
 
@@ -59,32 +160,45 @@ def is_trading_active_for_coin_in_binance(symbol: str, purchasing_currency: str)
     # that needs to be purchased. Most of the time, the minimum is enforced by
     # the binance-wide minimum, but this is not always the case.
 
-    if binance_symbol_info["status"] != "TRADING":
+    if binance_symbol.status != "TRADING":
         log.info("symbol is not trading, skipping", symbol=symbol)
         return False
 
     return True
 
 
-# TODO is there a way to enforce trading pair via typing?
-def binance_price_for_symbol(trading_pair: str) -> Decimal:
+def binance_all_prices() -> t.Dict[str, Decimal]:
     """
-    trading_pair must be in the format of "BTCUSD"
-
-    This method will throw an exception if the price does not exist.
+    Maps trading pairs to their current price. This includes both USD and USDT prices.
     """
 
-    # `symbol` is a trading pair
-    # this includes both USDT and USD prices
+    # every run in a cycle values portfolios against the same prices, even when the stream has newer ones
+    if snapshot := market_snapshot.current_market_snapshot():
+        return snapshot.tickers
+
+    if (streamed_prices := market_data_stream.streamed_prices()) is not None:
+        return streamed_prices
+
     # the pair formatting is 'BTCUSD'
-    return utils.cached_result(
+    return cache.cached_result(
         "binance_price_for_symbol",
         lambda: {
             price_dict["symbol"]: Decimal(price_dict["price"])
             # `get_all_tickers` is only called once
             for price_dict in public_binance_client().get_all_tickers()
         },
-    ).get(trading_pair)
+    )
+
+
+# TODO is there a way to enforce trading pair via typing?
+def binance_price_for_symbol(trading_pair: str) -> t.Optional[Decimal]:
+    """
+    trading_pair must be in the format of "BTCUSD"
+
+    Returns `None` if the price does not exist.
+    """
+
+    return binance_all_prices().get(trading_pair)
 
 
 def binance_portfolio(user: User) -> t.List[CryptoBalance]:
@@ -151,76 +265,219 @@ def binance_open_orders(user: User) -> t.List[ExchangeOrder]:
             exchange=SupportedExchanges.BINANCE,
         )
         for order in user.binance_client().get_open_orders()
-        if order["side"] == BinanceClient.SIDE_BUY
+        if order["side"] == OrderType.BUY
     ]
 
 
 # TODO maybe document struct of dict?
 def binance_all_symbol_info() -> t.List[t.Dict]:
-    return utils.cached_result(
+    if snapshot := market_snapshot.current_market_snapshot():
+        return snapshot.symbol_info
+
+    return cache.cached_result(
         "binance_all_symbol_info",
         # exchange info includes filters, status, etc but does NOT include pricing data
         lambda: public_binance_client().get_exchange_info()["symbols"],
     )
 
 
-def binance_get_symbol_info(trading_pair: str):
-    return next((symbol_info for symbol_info in binance_all_symbol_info() if symbol_info["symbol"] == trading_pair))
+class BinanceSymbol:
+    """
+    Compact representation of a single trading pair from the exchange info. Filters are parsed
+    once when the exchange info is refreshed instead of on every lookup.
+    """
 
+    __slots__ = (
+        "trading_pair",
+        "status",
+        "base_asset",
+        "quote_asset",
+        "step_size",
+        "min_quantity",
+        "max_quantity",
+        "tick_size",
+        "min_price",
+        "max_price",
+        "min_notional",
+        "max_notional",
+        "min_notional_applies_to_market",
+        "max_notional_applies_to_market",
+        "quantity_quantizer",
+        "price_precision",
+        "info",
+    )
 
-def binance_normalize_purchase_amount(amount: t.Union[str, Decimal], symbol: str) -> str:
-    symbol_info = binance_get_symbol_info(symbol)
+    def __init__(self, info: t.Dict):
+        filters = {f["filterType"]: f for f in info["filters"]}
+
+        self.trading_pair: str = info["symbol"]
+        self.status: str = info["status"]
+        self.base_asset: str = info["baseAsset"]
+        self.quote_asset: str = info["quoteAsset"]
+
+        # a listing can be missing filters, which should only break normalizing that pair rather than the whole index
+        # {'filterType': 'LOT_SIZE', 'minQty': '0.10000000', 'maxQty': '9000000.00000000', 'stepSize': '0.10000000'},
+        lot_size_filter = filters.get("LOT_SIZE", {})
+        self.step_size: t.Optional[Decimal] = Decimal(lot_size_filter["stepSize"]) if lot_size_filter else None
+        self.min_quantity = Decimal(lot_size_filter.get("minQty", 0))
+        self.max_quantity = Decimal(lot_size_filter.get("maxQty", 0))
+
+        # {'filterType': 'PRICE_FILTER', 'minPrice': '0.00010000', 'maxPrice': '1000.00000000', 'tickSize': '0.00010000'}
+        price_filter = filters.get("PRICE_FILTER", {})
+        self.tick_size: t.Optional[Decimal] = Decimal(price_filter["tickSize"]) if price_filter else None
+        self.min_price = Decimal(price_filter.get("minPrice", 0))
+        self.max_price = Decimal(price_filter.get("maxPrice", 0))
+
+        # binance has replaced MIN_NOTIONAL with NOTIONAL on some pairs, both use `minNotional`
+        # {'filterType': 'NOTIONAL', 'minNotional': '10.00', 'applyMinToMarket': True, 'maxNotional': '9000000.00', 'applyMaxToMarket': False}
+        notional_filter = filters.get("MIN_NOTIONAL") or filters.get("NOTIONAL") or {}
+        self.min_notional = Decimal(notional_filter.get("minNotional", 0))
+        self.max_notional = Decimal(notional_filter.get("maxNotional", 0))
+        self.min_notional_applies_to_market: bool = notional_filter.get("applyToMarket", notional_filter.get("applyMinToMarket", True))
+        self.max_notional_applies_to_market: bool = notional_filter.get("applyMaxToMarket", False)
+
+        # normalize removes trailing zeros, which modifies the precision that quantize uses for rounding
+        # https://stackoverflow.com/questions/11227620/drop-trailing-zeros-from-decimal
+        self.quantity_quantizer = self.step_size.normalize() if self.step_size is not None else None
+
+        # not 100% sure of the logic below, but I imagine it's possible for the quote asset precision
+        # and the tick size precision to be different. In this case, to satisfy both filters, we need to pick the min
+        asset_rounding_precision = info["quoteAssetPrecision"]
+
+        if self.tick_size:
+            tick_size_rounding_precision = int(round(-math.log(float(self.tick_size), 10), 0))
+            self.price_precision = min(asset_rounding_precision, tick_size_rounding_precision)
+        else:
+            self.price_precision = asset_rounding_precision
+
+        # raw exchange info, this is what `get_symbol_info` returns
+        self.info = info
+
+
+class SymbolIndex:
+    """
+    Exchange info indexed by trading pair (i.e. 'BTCUSD'), built once per exchange info refresh.
+    """
+
+    def __init__(self, symbol_info: t.List[t.Dict]):
+        self._symbols = {info["symbol"]: BinanceSymbol(info) for info in symbol_info}
+        # (base asset, quote asset) pairs which are listed, regardless of trading status
+        self.pairs = frozenset((symbol.base_asset, symbol.quote_asset) for symbol in self._symbols.values())
+
+    def get(self, trading_pair: str) -> t.Optional[BinanceSymbol]:
+        return self._symbols.get(trading_pair)
+
+    def has_pair(self, base_asset: str, quote_asset: str) -> bool:
+        return (base_asset, quote_asset) in self.pairs
+
+    def __iter__(self) -> t.Iterator[BinanceSymbol]:
+        return iter(self._symbols.values())
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+
+# the index is rebuilt when `binance_all_symbol_info` returns a different object, which
+# happens when the cached exchange info is refreshed or a different market snapshot is pinned
+_symbol_index: t.Tuple[t.Optional[t.List[t.Dict]], t.Optional[SymbolIndex]] = (None, None)
 
-    # not 100% sure of the logic below, but I imagine it's possible for the quote asset precision
-    # and the step size precision to be different. In this case, to satisfy both filters, we'd need to pick the min
-    # asset_rounding_precision = symbol_info['quoteAssetPrecision']
+
+def binance_symbol_index() -> SymbolIndex:
+    global _symbol_index
+
+    symbol_info = binance_all_symbol_info()
+    indexed_symbol_info, index = _symbol_index
+
+    if index is None or indexed_symbol_info is not symbol_info:
+        index = SymbolIndex(symbol_info)
+        _symbol_index = (symbol_info, index)
+
+    return index
+
+
+def binance_get_symbol_info(trading_pair: str) -> t.Optional[t.Dict]:
+    binance_symbol = binance_symbol_index().get(trading_pair)
+    return binance_symbol.info if binance_symbol else None
+
+
+def binance_normalize_purchase_amount(amount: t.Union[str, Decimal], symbol: str) -> str:
+    binance_symbol = binance_symbol_index().get(symbol)
+    assert binance_symbol is not None
+    assert binance_symbol.quantity_quantizer is not None, f"{symbol} has no LOT_SIZE filter"
 
     # the quote precision is not what we need to round by, the stepSize needs to be used instead:
     # https://github.com/sammchardy/python-binance/issues/219
-    # {'filterType': 'LOT_SIZE', 'minQty': '0.10000000', 'maxQty': '9000000.00000000', 'stepSize': '0.10000000'},
-    step_size = next(Decimal(f["stepSize"]) for f in symbol_info["filters"] if f["filterType"] == "LOT_SIZE")
-    amount = Decimal(amount)
-
-    # normalize removes trailing zeros, which modifies the precision that quantize uses for rounding
-    # https://stackoverflow.com/questions/11227620/drop-trailing-zeros-from-decimal
-    return str(amount.quantize(Decimal(step_size).normalize(), rounding=decimal.ROUND_UP))
+    return str(Decimal(amount).quantize(binance_symbol.quantity_quantizer, rounding=decimal.ROUND_UP))
 
 
 def binance_normalize_price(amount: t.Union[str, Decimal], symbol: str) -> str:
-    symbol_info = binance_get_symbol_info(symbol)
+    binance_symbol = binance_symbol_index().get(symbol)
+    assert binance_symbol is not None
+
+    return format(Decimal(amount), f"0.{binance_symbol.price_precision}f")
+
+
+def binance_minimum_order_amount(symbol: str, purchasing_currency: str) -> Decimal:
+    """
+    Smallest amount of the purchasing currency a single order for the pair can spend
+    """
+
+    binance_symbol = binance_symbol_index().get(symbol + purchasing_currency)
+    return binance_symbol.min_notional if binance_symbol else Decimal(0)
+
+
+def binance_validate_quote_order(trading_pair: str, quote_quantity: Decimal) -> order_validation.ValidatedOrder:
+    validated_order = order_validation.validate_quote_order(binance_symbol_index().get(trading_pair), trading_pair, quote_quantity)
 
-    asset_rounding_precision = symbol_info["quoteAssetPrecision"]
+    if validated_order.adjustments:
+        log.info("adjusted order to the exchange filters", trading_pair=trading_pair, adjustments=validated_order.adjustments)
 
-    tick_size = next(f["tickSize"] for f in symbol_info["filters"] if f["filterType"] == "PRICE_FILTER")
-    tick_size_rounding_precision = int(round(-math.log(float(tick_size), 10), 0))
+    return validated_order
 
-    rounding_precision = min(asset_rounding_precision, tick_size_rounding_precision)
 
-    return format(Decimal(amount), f"0.{rounding_precision}f")
+def binance_validate_limit_order(trading_pair: str, quantity: Decimal, price: Decimal) -> order_validation.ValidatedOrder:
+    validated_order = order_validation.validate_limit_order(binance_symbol_index().get(trading_pair), trading_pair, quantity, price)
 
+    if validated_order.adjustments:
+        log.info("adjusted order to the exchange filters", trading_pair=trading_pair, adjustments=validated_order.adjustments)
 
-def binance_market_sell(user: User, symbol: str, purchasing_currency: str, amount: Decimal) -> ExchangeOrder:
+    return validated_order
+
+
+def binance_market_sell(user: User, symbol: str, purchasing_currency: str, amount: Decimal) -> t.Optional[ExchangeOrder]:
     # TODO I ran into a case where I needed to subtract a cent to get binance not to fail
     #      this could have been a FPA bug, remove this if it doesn't come up again
     # amount -= 0.01
 
     sell_pair = symbol + purchasing_currency
-    normalized_amount = binance_normalize_price(amount, sell_pair)
+
+    try:
+        validated_order = binance_validate_quote_order(sell_pair, amount)
+    except order_validation.OrderRejected as e:
+        log.error("market sell order rejected", error=e)
+        return None
 
     order_params = {
         "symbol": sell_pair,
         "newOrderRespType": "FULL",
         # allows us to purchase crypto in a currency of choice
         # https://dev.binance.vision/t/beginners-guide-to-quoteorderqty-market-orders/404
-        "quoteOrderQty": normalized_amount,
+        "quoteOrderQty": binance_normalize_price(t.cast(Decimal, validated_order.quote_quantity), sell_pair),
     }
 
+    if not user.livemode and not user.exchange_test_orders:
+        log.info("test mode market sell order validated locally", order=order_params)
+        return None
+
     client = user.binance_client()
 
     if user.livemode:
         order = client.order_market_sell(**order_params)
     else:
-        order = client.create_test_order(**({"side": client.SIDE_SELL, "type": client.ORDER_TYPE_MARKET} | order_params))
+        client.create_test_order(**({"side": client.SIDE_SELL, "type": client.ORDER_TYPE_MARKET} | order_params))
+
+        # test orders do not generate a valid response hash
+        return None
 
     """
     {'clientOrderId': 'nW6LJNE8YF1R0KWVR9r1qU',
@@ -312,19 +569,30 @@ Binance Order structure:
 def binance_market_buy(user: User, symbol: str, purchasing_currency: str, amount: Decimal) -> t.Optional[ExchangeOrder]:
     from binance.exceptions import BinanceAPIException
 
-    client = user.binance_client()
     trading_pair = symbol + purchasing_currency
 
+    try:
+        validated_order = binance_validate_quote_order(trading_pair, amount)
+    except order_validation.OrderRejected as e:
+        log.error("market buy order rejected", error=e)
+        return None
+
     order_params = {
         "symbol": trading_pair,
         "newOrderRespType": "FULL",
         # `quoteOrderQty` allows us to purchase crypto in a currency of choice, instead of an amount in the token we are buying
         # https://dev.binance.vision/t/beginners-guide-to-quoteorderqty-market-orders/404
-        "quoteOrderQty": binance_normalize_price(amount, trading_pair),
+        "quoteOrderQty": binance_normalize_price(t.cast(Decimal, validated_order.quote_quantity), trading_pair),
     }
 
+    if not user.livemode and not user.exchange_test_orders:
+        log.info("test mode market buy order validated locally", order=order_params)
+        return None
+
     log.info("submitting market buy order", order=order_params)
 
+    client = user.binance_client()
+
     try:
         if user.livemode:
             binance_order = client.order_market_buy(**order_params)
@@ -354,20 +622,31 @@ def binance_market_buy(user: User, symbol: str, purchasing_currency: str, amount
 def binance_limit_buy(user: User, symbol: str, purchasing_currency: str, quantity: Decimal, price: Decimal) -> t.Optional[ExchangeOrder]:
     from binance.exceptions import BinanceAPIException
 
-    client = user.binance_client()
     trading_pair = symbol + purchasing_currency
 
+    try:
+        validated_order = binance_validate_limit_order(trading_pair, quantity, price)
+    except order_validation.OrderRejected as e:
+        log.error("limit buy order rejected", error=e)
+        return None
+
     order_params = {
         "symbol": trading_pair,
         "newOrderRespType": "FULL",
         # TODO is there a way to specify a number of hours? It seems like only the three standard TIF options are available
         "timeInForce": "GTC",
-        "quantity": binance_normalize_purchase_amount(quantity, trading_pair),
-        "price": binance_normalize_price(price, trading_pair),
+        "quantity": binance_normalize_purchase_amount(t.cast(Decimal, validated_order.quantity), trading_pair),
+        "price": binance_normalize_price(t.cast(Decimal, validated_order.price), trading_pair),
     }
 
+    if not user.livemode and not user.exchange_test_orders:
+        log.info("test mode limit buy order validated locally", order=order_params)
+        return None
+
     log.info("submitting limit buy order", order=order_params)
 
+    client = user.binance_client()
+
     try:
         if user.livemode:
             binance_order = client.order_limit_buy(**order_params)
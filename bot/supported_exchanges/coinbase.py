@@ -1,11 +1,37 @@
 # https://docs.pro.coinbase.com/#client-libraries
-import coinbasepro as cbpro
+import typing as t
 
-coinbase_public_client = cbpro.PublicClient()
-coinbase_exchange = coinbase_public_client.get_products()
+from .. import cache
 
 
-def can_buy_in_coinbase(symbol, purchasing_currency):
-    for coin in coinbase_exchange:
-        if coin["base_currency"] == symbol and coin["quote_currency"] == purchasing_currency:
-            return True
+def coinbase_public_client():
+    # imported here so users who don't trade on coinbase never load the client library
+    import coinbasepro as cbpro
+
+    return cbpro.PublicClient()
+
+
+def coinbase_products() -> t.List[t.Dict]:
+    # loaded on first use, instead of on import, so only users trading on coinbase hit the API
+    return cache.cached_result("coinbase_products", lambda: coinbase_public_client().get_products())
+
+
+# products are only reindexed when the cached product list changes
+_tradable_pairs: t.Tuple[t.Optional[t.List[t.Dict]], t.FrozenSet[t.Tuple[str, str]]] = (None, frozenset())
+
+
+def coinbase_tradable_pairs() -> t.FrozenSet[t.Tuple[str, str]]:
+    global _tradable_pairs
+
+    products = coinbase_products()
+    indexed_products, pairs = _tradable_pairs
+
+    if indexed_products is not products:
+        pairs = frozenset((product["base_currency"], product["quote_currency"]) for product in products)
+        _tradable_pairs = (products, pairs)
+
+    return pairs
+
+
+def can_buy_in_coinbase(symbol: str, purchasing_currency: str) -> bool:
+    return (symbol, purchasing_currency) in coinbase_tradable_pairs()
@@ -1,5 +1,4 @@
 import decimal
-import functools
 import typing as t
 
 from .data_types import (
@@ -46,6 +45,9 @@ class User:
     binance_secret_key: t.Optional[str] = ""
     external_portfolio: t.List[CryptoBalance] = []
     livemode: bool = False
+    # in testmode, orders are validated locally against the exchange filters. Enable this to also submit them to the
+    # exchange's test order endpoint, which costs a request per order
+    exchange_test_orders: bool = False
 
     # self explanatory common purchasing configurations
     purchasing_currency: str = "USD"
@@ -55,9 +57,17 @@ class User:
 
     index_strategy: MarketIndexStrategy = MarketIndexStrategy.MARKET_CAP
     index_strategy_sqrt_adjustment: t.Optional[str] = None
+    # maximum % of the index a single coin can take up, the excess is redistributed to the rest of the index
+    index_strategy_weight_cap: t.Optional[int] = None
+    # number of days the market cap is averaged over by the SMA strategy
+    index_strategy_sma_days: t.Optional[int] = None
+    # number of days volatility and correlations are measured over by the inverse volatility and risk parity strategies
+    index_strategy_volatility_days: t.Optional[int] = None
     buy_strategy: MarketBuyStrategy = MarketBuyStrategy.MARKET
     # automatically sell stablecoins to USD / purchasing currency?
     convert_stablecoins: bool = True
+    # max number of orders submitted to the exchange at the same time
+    order_parallelism: int = 4
     # max number of items in the market index
     index_limit: t.Optional[int] = None
 
@@ -80,16 +90,18 @@ class User:
     # if the absolute percentage of a holding drifts this amount, prioritize purchasing it even above the % drift multiple above
     allocation_drift_percentage_limit: t.Optional[int] = None
 
+    # prioritize coins which dropped the most using momentum measured from exchange candles, instead of the coinmarketcap 30d change
+    rank_by_momentum: bool = False
+
     def __init__(self):
         pass
 
     def is_primary_exchange(self, exchange: SupportedExchanges) -> bool:
         return exchange == self.exchanges[0]
 
-    @functools.cache
     def binance_client(self):
-        from binance.client import Client
+        from .supported_exchanges.binance import cached_binance_client
 
         # TODO error check for empty keys?
-
-        return Client(self.binance_api_key, self.binance_secret_key, tld="us")
+        # clients are shared by every `User` with the same keys, multi-user mode builds a new `User` for each run
+        return cached_binance_client(self.binance_api_key or "", self.binance_secret_key or "")
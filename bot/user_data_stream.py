@@ -0,0 +1,329 @@
+"""
+Binance user data stream: balance and order updates for an account, pushed over a websocket as they happen.
+
+A listener process (`python manage.py user_data_stream`) holds a stream for every enabled user and writes what it
+receives to the shared cache:
+
+* Balances. Runs read them instead of requesting the account, but only while the listener is connected.
+* Order updates. `StreamOrderUpdates` reads them, so a run sees an order fill as soon as the exchange reports it.
+* Deposits of the purchasing currency (or a stablecoin) trigger a buy within seconds, rather than on the next hourly run.
+
+Everything is keyed by a hash of the account's API key, which both the listener and the workers have.
+
+https://binance-docs.github.io/apidocs/spot/en/#user-data-streams
+"""
+
+import asyncio
+import collections
+import hashlib
+import json
+import time
+import typing as t
+from decimal import Decimal
+
+from .data_types import CryptoBalance, OrderStatus
+from .order_fills import OrderFill
+from .supported_exchanges.binance import BINANCE_STREAM_URL
+from .user import User
+from .utils import in_django_environment, log
+
+# listen keys expire after an hour unless they are kept alive
+LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60
+
+# while connected, the listener refreshes a marker which expires shortly after the listener stops
+HEARTBEAT_SECONDS = 30
+CONNECTED_TTL_SECONDS = HEARTBEAT_SECONDS * 3
+
+FIRST_RECONNECT_DELAY_SECONDS = 1.0
+MAX_RECONNECT_DELAY_SECONDS = 60.0
+
+# the last orders of an account are kept, which is plenty to cover the orders of a single run
+MAX_TRACKED_ORDERS = 200
+STREAM_STATE_TTL_SECONDS = 60 * 60 * 24
+
+# how often a worker waiting on order updates checks the shared cache
+ORDER_UPDATE_POLL_SECONDS = 0.1
+
+# a deposit is often reported as several balance updates, only the first one triggers a buy
+DEPOSIT_DEBOUNCE_SECONDS = 60
+
+# how often the listener checks for users which were enabled or disabled
+USER_REFRESH_SECONDS = 5 * 60
+
+
+def account_key(user: User) -> str:
+    return hashlib.sha256((user.binance_api_key or "").encode()).hexdigest()[:16]
+
+
+def _cache_key(user: User, name: str) -> str:
+    return f"user_data_stream:{account_key(user)}:{name}"
+
+
+def is_connected(user: User) -> bool:
+    if not in_django_environment() or not user.binance_api_key:
+        return False
+
+    from django.core.cache import cache
+
+    return cache.get(_cache_key(user, "connected")) is not None
+
+
+def streamed_portfolio(user: User) -> t.Optional[t.List[CryptoBalance]]:
+    """
+    The account balances kept up to date by the user data stream, in the same format as `binance_portfolio`. `None`
+    when the listener isn't connected for this user, in which case the balances may be out of date.
+    """
+
+    if not is_connected(user):
+        return None
+
+    from django.core.cache import cache
+
+    balances = cache.get(_cache_key(user, "balances"))
+
+    if balances is None:
+        return None
+
+    return [
+        CryptoBalance(
+            symbol=symbol,
+            amount=amount,
+            usd_price=Decimal(0),
+            usd_total=Decimal(0),
+            percentage=Decimal(0),
+            target_percentage=Decimal(0),
+        )
+        for symbol, amount in balances.items()
+        if amount > 0
+    ]
+
+
+class StreamOrderUpdates:
+    """
+    `OrderUpdateSource` backed by the order updates the listener writes to the shared cache
+    """
+
+    def __init__(self, user: User, sleep: t.Callable[[float], None] = time.sleep, clock: t.Callable[[], float] = time.monotonic):
+        self.user = user
+        self._sleep = sleep
+        self._clock = clock
+        # last state returned for each order, so each update is only returned once
+        self._returned: t.Dict[t.Any, OrderFill] = {}
+
+    def _new_updates(self, order_ids: t.List[t.Any]) -> t.List[OrderFill]:
+        from django.core.cache import cache
+
+        order_updates = cache.get(_cache_key(self.user, "orders")) or {}
+        updates = [
+            order_updates[order_id] for order_id in order_ids if order_id in order_updates and self._returned.get(order_id) != order_updates[order_id]
+        ]
+
+        for update in updates:
+            self._returned[update.id] = update
+
+        return updates
+
+    def wait_for_updates(self, order_ids: t.List[t.Any], timeout: float) -> t.List[OrderFill]:
+        deadline = self._clock() + timeout
+
+        while not (updates := self._new_updates(order_ids)) and self._clock() < deadline:
+            self._sleep(min(ORDER_UPDATE_POLL_SECONDS, max(deadline - self._clock(), 0)))
+
+        return updates
+
+
+def order_update_source(user: User) -> t.Optional[StreamOrderUpdates]:
+    if not is_connected(user):
+        return None
+
+    return StreamOrderUpdates(user)
+
+
+def balances_from_account(account: t.Dict) -> t.Dict[str, Decimal]:
+    return {balance["asset"]: Decimal(balance["free"]) for balance in account["balances"]}
+
+
+def order_fill_from_execution_report(event: t.Dict) -> OrderFill:
+    return OrderFill(
+        id=event["i"],
+        trading_pair=event["s"],
+        status=OrderStatus(event["X"]),
+        executed_quantity=Decimal(event["z"]),
+        quote_quantity=Decimal(event["Z"]),
+    )
+
+
+class UserDataStream:
+    def __init__(
+        self,
+        user_id: t.Any,
+        user: User,
+        on_deposit: t.Callable[[t.Any], None],
+        deposit_symbols: t.List[str],
+        stream_url: str = BINANCE_STREAM_URL,
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        self.user_id = user_id
+        self.user = user
+        self._on_deposit = on_deposit
+        # deposits of these assets can be invested, i.e. the purchasing currency and stablecoins which are converted to it
+        self._deposit_symbols = deposit_symbols
+        self._stream_url = stream_url
+        self._clock = clock
+
+        self.balances: t.Dict[str, Decimal] = {}
+        self.orders: t.OrderedDict[t.Any, OrderFill] = collections.OrderedDict()
+        self._last_deposit_at: t.Optional[float] = None
+
+    def _store(self, name: str, value: t.Any, timeout: float = STREAM_STATE_TTL_SECONDS) -> None:
+        from django.core.cache import cache
+
+        cache.set(_cache_key(self.user, name), value, timeout=timeout)
+
+    def _mark_connected(self) -> None:
+        self._store("connected", True, timeout=CONNECTED_TTL_SECONDS)
+
+    def _mark_disconnected(self) -> None:
+        from django.core.cache import cache
+
+        cache.delete(_cache_key(self.user, "connected"))
+
+    def handle_event(self, event: t.Dict) -> None:
+        event_type = event.get("e")
+
+        if event_type == "outboundAccountPosition":
+            # sent whenever a balance changes, with the absolute balance of every asset which changed
+            for balance in event["B"]:
+                self.balances[balance["a"]] = Decimal(balance["f"])
+
+            self._store("balances", dict(self.balances))
+
+        elif event_type == "executionReport":
+            order_fill = order_fill_from_execution_report(event)
+            self.orders[order_fill.id] = order_fill
+            self.orders.move_to_end(order_fill.id)
+
+            while len(self.orders) > MAX_TRACKED_ORDERS:
+                self.orders.popitem(last=False)
+
+            self._store("orders", dict(self.orders))
+
+        elif event_type == "balanceUpdate":
+            # deposits, withdrawals and transfers. The new balance follows in an `outboundAccountPosition` event.
+            if event["a"] in self._deposit_symbols and Decimal(event["d"]) > 0:
+                self._deposit(event["a"], Decimal(event["d"]))
+
+    def _deposit(self, symbol: str, amount: Decimal) -> None:
+        now = self._clock()
+
+        if self._last_deposit_at is not None and now - self._last_deposit_at < DEPOSIT_DEBOUNCE_SECONDS:
+            log.info("deposit received, buy already triggered", user_id=self.user_id, symbol=symbol, amount=amount)
+            return
+
+        log.info("deposit received, triggering buy", user_id=self.user_id, symbol=symbol, amount=amount)
+
+        self._last_deposit_at = now
+        self._on_deposit(self.user_id)
+
+    async def _keep_alive(self, client, listen_key: str) -> None:
+        kept_alive_at = self._clock()
+
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            self._mark_connected()
+
+            if self._clock() - kept_alive_at >= LISTEN_KEY_KEEPALIVE_SECONDS:
+                await asyncio.to_thread(client.stream_keepalive, listen_key)
+                kept_alive_at = self._clock()
+
+    async def _stream(self) -> None:
+        import websockets
+
+        client = self.user.binance_client()
+        listen_key = await asyncio.to_thread(client.stream_get_listen_key)
+
+        async with websockets.connect(f"{self._stream_url}/ws/{listen_key}") as websocket:
+            # updates sent while the account is loading are newer than it, and are applied once it is stored
+            account = await asyncio.to_thread(client.get_account)
+            self.balances = balances_from_account(account)
+            self._store("balances", dict(self.balances))
+            self._mark_connected()
+
+            log.info("user data stream connected", user_id=self.user_id)
+
+            keep_alive = asyncio.create_task(self._keep_alive(client, listen_key))
+
+            try:
+                async for message in websocket:
+                    self.handle_event(json.loads(message))
+            finally:
+                keep_alive.cancel()
+
+    async def run(self) -> None:
+        """
+        Streams until cancelled, reconnecting with a backoff when the connection drops. Binance closes every
+        connection after 24 hours, so reconnecting is expected.
+        """
+
+        delay = FIRST_RECONNECT_DELAY_SECONDS
+
+        while True:
+            connected_at = self._clock()
+
+            try:
+                await self._stream()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warn("user data stream failed", user_id=self.user_id, error=e)
+            finally:
+                # balances can't be trusted until the stream is connected again
+                self._mark_disconnected()
+
+            # a connection which stayed up for a while was healthy, start the backoff over
+            if self._clock() - connected_at > MAX_RECONNECT_DELAY_SECONDS:
+                delay = FIRST_RECONNECT_DELAY_SECONDS
+
+            log.info("reconnecting user data stream", user_id=self.user_id, delay=delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+
+async def listen(
+    load_users: t.Callable[[], t.Dict[t.Any, User]],
+    on_deposit: t.Callable[[t.Any], None],
+    stream_url: str = BINANCE_STREAM_URL,
+    refresh_seconds: float = USER_REFRESH_SECONDS,
+) -> None:
+    """
+    Holds a stream for every user returned by `load_users`, keyed by user id. Users are reloaded periodically, so
+    streams are opened for new users and closed for users which are no longer returned.
+    """
+
+    from . import convert_stablecoins
+
+    streams: t.Dict[t.Tuple[t.Any, str], asyncio.Task] = {}
+    loop = asyncio.get_running_loop()
+
+    def trigger_buy(user_id: t.Any) -> None:
+        # enqueueing the buy is a network request, which shouldn't block every other stream
+        loop.run_in_executor(None, on_deposit, user_id)
+
+    while True:
+        users = await asyncio.to_thread(load_users)
+        # a user's stream is restarted when their API key changes
+        stream_keys = {(user_id, account_key(user)): user for user_id, user in users.items()}
+
+        for stream_key in set(streams) - set(stream_keys):
+            log.info("closing user data stream", user_id=stream_key[0])
+            streams.pop(stream_key).cancel()
+
+        for stream_key, user in stream_keys.items():
+            if stream_key not in streams:
+                deposit_symbols = [user.purchasing_currency] + convert_stablecoins.stablecoin_symbols(user.purchasing_currency)
+                stream = UserDataStream(stream_key[0], user, trigger_buy, deposit_symbols, stream_url=stream_url)
+                streams[stream_key] = asyncio.create_task(stream.run())
+
+        log.info("listening to user data streams", count=len(streams))
+
+        await asyncio.sleep(refresh_seconds)
@@ -1,20 +1,10 @@
-from decimal import Decimal
-
-from rich.traceback import install as install_rich_tracebacks
-
-# install_rich_tracebacks(show_locals=True, width=200)
-install_rich_tracebacks(width=200)
-
 import logging
-import typing as t
-from typing import overload
+import sys
 
 import structlog
 from decouple import config
 from structlog.threadlocal import wrap_dict
 
-from .data_types import CryptoBalance, CryptoData
-
 
 def setLevel(level):
     level = getattr(logging, level.upper())
@@ -34,74 +24,31 @@ setLevel(log_level)
 
 log = structlog.get_logger()
 
-_cached_result = {}
 
+def install_rich_tracebacks():
+    from rich.traceback import install
 
-def cached_result(key: str, func: t.Callable):
-    if in_django_environment():
-        from django.core.cache import cache
+    # install(show_locals=True, width=200)
+    install(width=200)
 
-        if cached_value := cache.get(key):
-            return cached_value
 
-        # use a 30m timeout by default for now
-        value = func()
-        cache.set(key, value, timeout=60 * 30)
-        return value
-    else:
-        # if no django, then setup a simple dict-based cache to avoid
-        # hitting the APIs too many times within a single process
-        global _cached_result
-        if key in _cached_result:
-            return _cached_result[key]
+def _rich_excepthook(exc_type, exc_value, exc_traceback):
+    # rich is slow to import, so it's only loaded once there is a traceback to render
+    install_rich_tracebacks()
+    sys.excepthook(exc_type, exc_value, exc_traceback)
 
-        value = func()
-        _cached_result[key] = value
-        return value
+
+# IPython shells render tracebacks through their own hooks, which rich can only patch when it is installed upfront
+if "IPython" in sys.modules:
+    install_rich_tracebacks()
+else:
+    sys.excepthook = _rich_excepthook
 
 
 def in_django_environment():
     return config("DJANGO_SETTINGS_MODULE", default=None) != None
 
 
-# https://stackoverflow.com/questions/52445559/how-can-i-type-hint-a-function-where-the-return-type-depends-on-the-input-type-o
-@overload
-def entry_key_with_symbol(
-    list_of_coins: t.Union[t.List[CryptoBalance], t.List[CryptoData]], symbol_or_dict: t.Union[CryptoBalance, CryptoData, str], key: str
-) -> t.Optional[t.Union[str, Decimal]]:
-    ...
-
-
-@overload
-def entry_key_with_symbol(list_of_coins: t.List[CryptoBalance], symbol_or_dict: t.Union[CryptoBalance, str], key: None) -> t.Optional[CryptoBalance]:
-    ...
-
-
-@overload
-def entry_key_with_symbol(list_of_coins: t.List[CryptoData], symbol_or_dict: t.Union[CryptoData, str], key: None) -> t.Optional[CryptoData]:
-    ...
-
-
-def entry_key_with_symbol(
-    list_of_coins: t.Union[t.List[CryptoBalance], t.List[CryptoData]], symbol_or_dict: t.Union[str, CryptoBalance, CryptoData], key: t.Optional[str]
-) -> t.Optional[t.Union[CryptoBalance, CryptoData, str, Decimal]]:
-    if isinstance(symbol_or_dict, str):
-        symbol = symbol_or_dict
-    else:
-        symbol = symbol_or_dict["symbol"]
-
-    match = next((target for target in list_of_coins if target["symbol"] == symbol), None)
-
-    if not match:
-        return None
-
-    if not key:
-        return match
-
-    # optionally pluck a specific field from the match
-    return match[key]
-
-
 def currency_format(value):
     # https://stackoverflow.com/questions/320929/currency-formatting-in-python
     import locale
@@ -3,13 +3,13 @@ from decimal import Decimal
 import click
 from decouple import config
 
-import bot.market_buy
-import bot.market_cap
 import bot.user
 import bot.utils
-from bot.commands import BuyCommand, PortfolioCommand, SellStablecoinsCommand
 from bot.data_types import MarketIndexStrategy, SupportedExchanges
 
+# cron runs this script from a cold interpreter, so heavy modules (exchange clients, numpy, django) are only
+# imported by the commands which need them. Use `--startup-profile` to see where startup time is going.
+
 # if you use `cod` it's helpful to disable while you are hacking on the CLI
 # if you are on zsh:
 #   `preexec_functions=(${preexec_functions#__cod_preexec_zsh})`
@@ -32,17 +32,32 @@ def user_for_cli():
 @click.group(help="Tool for building your own crypto index fund.")
 # TODO this must be specified before the subcommand, which is a strange requirement. I wonder if there is a way around this.
 @click.option("--verbose", "-v", is_flag=True, help="Enables verbose mode.")
-def cli(verbose):
+@click.option("--startup-profile", is_flag=True, help="Run the command and report how long each module took to import.")
+@click.pass_context
+def cli(ctx, verbose, startup_profile):
     if verbose:
         bot.utils.setLevel("INFO")
 
+    if startup_profile:
+        import sys
+
+        from bot import startup_profile as profiler
+
+        # rerun the same command, without this flag, in a fresh interpreter
+        profile = profiler.profile_command([arg for arg in sys.argv[1:] if arg != "--startup-profile"])
+
+        click.echo(profiler.profile_report(profile), err=True)
+        ctx.exit(profile.returncode)
+
 
 @cli.command(help="Analyze configured exchanges")
 def analyze():
     import bot.exchanges as exchanges
 
-    coinbase_available_coins = {coin["base_currency"] for coin in exchanges.coinbase_exchange}
-    binance_available_coins = {coin["baseAsset"] for coin in exchanges.binance_all_symbol_info()}
+    index = exchanges.tradability_index
+
+    coinbase_available_coins = index.base_assets(SupportedExchanges.COINBASE)
+    binance_available_coins = index.base_assets(SupportedExchanges.BINANCE)
 
     print("Available, regardless of purchasing currency:")
     print(f"coinbase:\t{len(coinbase_available_coins)}")
@@ -50,12 +65,8 @@ def analyze():
 
     user = user_for_cli()
 
-    coinbase_available_coins_in_purchasing_currency = {
-        coin["base_currency"] for coin in exchanges.coinbase_exchange if coin["quote_currency"] == user.purchasing_currency
-    }
-    binance_available_coins_in_purchasing_currency = {
-        coin["baseAsset"] for coin in exchanges.binance_all_symbol_info() if coin["quoteAsset"] == user.purchasing_currency
-    }
+    coinbase_available_coins_in_purchasing_currency = index.base_assets(SupportedExchanges.COINBASE, user.purchasing_currency)
+    binance_available_coins_in_purchasing_currency = index.base_assets(SupportedExchanges.BINANCE, user.purchasing_currency)
 
     print("\nAvailable in purchasing currency:")
     print(f"coinbase:\t{len(coinbase_available_coins_in_purchasing_currency)}")
@@ -88,7 +99,10 @@ def analyze():
 )
 @click.option("-l", "--limit", type=int, help="Maximum size of index")
 @click.option("--sqrt-adjustment", type=str, help="Customized sqrt calculation")
-def index(format, limit, strategy, sqrt_adjustment):
+@click.option("--weight-cap", type=int, help="Maximum percentage of the index for a single coin")
+def index(format, limit, strategy, sqrt_adjustment, weight_cap):
+    import bot.market_cap
+
     user = user_for_cli()
 
     if strategy:
@@ -100,6 +114,9 @@ def index(format, limit, strategy, sqrt_adjustment):
     if sqrt_adjustment:
         user.index_strategy_sqrt_adjustment = sqrt_adjustment
 
+    if weight_cap:
+        user.index_strategy_weight_cap = weight_cap
+
     coins_by_exchange = bot.market_cap.coins_with_market_cap(user)
 
     click.echo(bot.utils.table_output_with_format(coins_by_exchange, format))
@@ -116,6 +133,9 @@ def index(format, limit, strategy, sqrt_adjustment):
 )
 @click.option("-m", "--missing", is_flag=True, help="Show coins that are missing from portfolio")
 def portfolio(format, missing):
+    import bot.market_buy
+    from bot.commands import PortfolioCommand
+
     user = user_for_cli()
     portfolio = PortfolioCommand.execute(user)
 
@@ -156,6 +176,8 @@ def cost_basis():
 # TODO this command needs to be cleaned up with some more options
 @cli.command(short_help="Convert stablecoins to USD for purchasing")
 def convert():
+    from bot.commands import SellStablecoinsCommand
+
     user = user_for_cli()
     orders = SellStablecoinsCommand.execute(user)
 
@@ -189,6 +211,7 @@ def convert():
 )
 @click.option("--cancel-orders", is_flag=True, help="Cancel all stale orders")
 def buy(format, dry_run, purchase_balance, convert, cancel_orders):
+    from bot.commands import BuyCommand
 
     if purchase_balance:
         purchase_balance = Decimal(purchase_balance)
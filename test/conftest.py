@@ -53,11 +53,15 @@ def clear_state():
 
     cache.clear()
 
-    import bot.utils
+    import bot.cache
 
-    bot.utils._cached_result = {}
+    bot.cache.local_cache.clear()
 
-    yield
+    # outside of django cached values are written to disk, which would leak across tests
+    from unittest.mock import patch
+
+    with patch("bot.cache.file_cache", None):
+        yield
 
 
 # TODO improve some of the fields to look more real
@@ -0,0 +1,127 @@
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from bot import analytics, index_weighting
+from bot.data_types import MarketIndexStrategy
+from bot.market_cap import calculate_market_cap_from_coin_list
+
+
+def coinmarketcap_coin(symbol, market_cap):
+    return {"symbol": symbol, "quote": {"USD": {"market_cap": market_cap, "percent_change_7d": Decimal(0), "percent_change_30d": Decimal(0)}}}
+
+
+def random_closes(count, days, seed=0):
+    generator = np.random.default_rng(seed)
+    # correlated coins: a shared market move plus a coin specific move of varying size
+    market = generator.normal(0, 0.03, days)
+    returns = market + generator.normal(0, 1, (count, days)) * generator.uniform(0.01, 0.08, (count, 1))
+    return 100 * np.exp(np.cumsum(returns, axis=1))
+
+
+class TestAnalytics(unittest.TestCase):
+    def test_metrics(self):
+        closes = np.array(
+            [
+                [100.0, 110.0, 99.0, 121.0],
+                [np.nan, np.nan, 10.0, 5.0],
+                [np.nan, np.nan, np.nan, 1.0],
+            ]
+        )
+
+        market_analytics = analytics.compute_analytics(["BTC", "ETH", "ADA"], closes)
+
+        expected_returns = np.diff(np.log(closes[0]))
+        assert market_analytics.volatility[0] == pytest.approx(np.std(expected_returns, ddof=1) * np.sqrt(365))
+        # a single return isn't enough to measure volatility
+        assert np.isnan(market_analytics.volatility[1])
+        assert np.isnan(market_analytics.volatility[2])
+
+        assert market_analytics.max_drawdown[0] == pytest.approx(0.1)
+        assert market_analytics.max_drawdown[1] == pytest.approx(0.5)
+        assert market_analytics.max_drawdown[2] == 0.0
+
+        # momentum is measured from the first available close
+        assert market_analytics.momentum_for("BTC") == pytest.approx(0.21)
+        assert market_analytics.momentum_for("ETH") == pytest.approx(-0.5)
+        assert market_analytics.momentum_for("ADA") == 0.0
+        assert market_analytics.momentum_for("DOGE") is None
+
+    def test_coins_without_candles(self):
+        closes = np.full((2, 5), np.nan)
+        closes[0] = [1.0, 2.0, 1.5, 1.8, 2.0]
+
+        market_analytics = analytics.compute_analytics(["BTC", "NEW"], closes)
+
+        assert np.isnan(market_analytics.volatility[1])
+        assert np.isnan(market_analytics.max_drawdown[1])
+        assert market_analytics.momentum_for("NEW") is None
+
+        # missing coins are given the median variance and are uncorrelated with the rest of the index
+        covariance = market_analytics.covariance()
+        assert covariance[1, 1] == pytest.approx(covariance[0, 0])
+        assert covariance[0, 1] == 0.0
+
+    def test_inverse_volatility_fills_missing_volatility(self):
+        percentages = index_weighting.inverse_volatility_percentages(np.array([0.5, 1.0, 1.0, np.nan]))
+
+        assert percentages == pytest.approx([40.0, 20.0, 20.0, 20.0])
+        assert index_weighting.inverse_volatility_percentages(np.array([np.nan, np.nan])) == pytest.approx([50.0, 50.0])
+
+    def test_risk_parity_equalizes_risk_contributions(self):
+        market_analytics = analytics.compute_analytics([f"COIN{i}" for i in range(20)], random_closes(20, 91))
+        covariance = market_analytics.covariance()
+
+        percentages = index_weighting.risk_parity_percentages(covariance)
+        assert percentages.sum() == pytest.approx(100)
+
+        # contributions are measured against the shrunk covariance the weights are solved for
+        shrunk_covariance = 0.5 * covariance + 0.5 * np.diag(np.diag(covariance))
+        weights = percentages / 100
+        contributions = weights * (shrunk_covariance @ weights)
+        assert contributions == pytest.approx(np.full(20, contributions.mean()), rel=1e-6)
+
+        # uncorrelated coins have the same weights as inverse volatility
+        diagonal = np.diag([0.04, 0.16, 0.64])
+        assert index_weighting.risk_parity_percentages(diagonal) == pytest.approx(
+            index_weighting.inverse_volatility_percentages(np.array([0.2, 0.4, 0.8]))
+        )
+
+    def test_large_index_performance(self):
+        symbols = [f"COIN{i}" for i in range(1000)]
+        closes = random_closes(1000, 91)
+        # newer coins with a shorter history
+        closes[::10, :60] = np.nan
+
+        start = time.perf_counter()
+        market_analytics = analytics.compute_analytics(symbols, closes)
+        index_weighting.inverse_volatility_percentages(market_analytics.volatility)
+        percentages = index_weighting.risk_parity_percentages(market_analytics.covariance())
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 1
+        assert percentages.sum() == pytest.approx(100)
+        assert (percentages > 0).all()
+
+    def test_index_strategies(self):
+        coins = [coinmarketcap_coin(symbol, Decimal(1000)) for symbol in ["BTC", "ETH", "ADA"]]
+        closes = random_closes(3, 91)
+
+        with patch.object(analytics, "daily_closes", return_value=closes) as daily_closes:
+            for strategy in [MarketIndexStrategy.INVERSE_VOLATILITY, MarketIndexStrategy.RISK_PARITY]:
+                index = calculate_market_cap_from_coin_list("USD", coins, strategy, None, volatility_days=30)
+
+                assert sum(coin["percentage"] for coin in index) == pytest.approx(100)
+
+            daily_closes.assert_called_with(["BTC", "ETH", "ADA"], "USD", 31)
+
+            volatility = analytics.realized_volatility(analytics.log_returns(closes))
+            expected_percentages = index_weighting.inverse_volatility_percentages(volatility)
+            index = calculate_market_cap_from_coin_list("USD", coins, MarketIndexStrategy.INVERSE_VOLATILITY, None, volatility_days=30)
+            assert {coin["symbol"]: float(coin["percentage"]) for coin in index} == pytest.approx(
+                dict(zip(["BTC", "ETH", "ADA"], expected_percentages))
+            )
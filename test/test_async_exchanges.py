@@ -0,0 +1,68 @@
+import asyncio
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from bot import async_exchanges, market_snapshot
+from bot.supported_exchanges import binance
+from bot.user import user_from_env
+
+SLOW_REQUEST_SECONDS = 0.2
+
+
+def slow_request(result):
+    def request(*_args, **_kwargs):
+        time.sleep(SLOW_REQUEST_SECONDS)
+        return result
+
+    return request
+
+
+class TestAsyncExchanges(unittest.TestCase):
+    @patch("bot.market_cap.coinmarketcap_data", side_effect=slow_request({"data": []}))
+    @patch("bot.exchanges.binance_all_prices", side_effect=slow_request({}))
+    @patch("bot.supported_exchanges.binance.binance_all_symbol_info", side_effect=slow_request([]))
+    def test_market_data_is_loaded_concurrently(self, *_mocks):
+        user = user_from_env()
+
+        started_at = time.perf_counter()
+        asyncio.run(async_exchanges.load_market_data(user))
+
+        # three requests, but only a single request's worth of wall time
+        assert time.perf_counter() - started_at < SLOW_REQUEST_SECONDS * 2
+
+    def test_pinned_snapshot_is_used_in_threads(self):
+        snapshot = market_snapshot.MarketSnapshot(
+            version="1", created_at=0, coinmarketcap_data={"data": []}, tickers={"BTCUSD": Decimal(1)}, symbol_info=[]
+        )
+
+        with market_snapshot.pinned(snapshot):
+            prices = asyncio.run(async_exchanges.in_thread(binance.binance_all_prices))
+
+        assert prices == {"BTCUSD": Decimal(1)}
+
+    @patch("bot.limit_buy.fetch_order_book", side_effect=slow_request({"asks": [["10.0", "1"]], "bids": [["9.5", "1"]]}))
+    @patch("bot.limit_buy.last_day_lows", side_effect=slow_request([Decimal("9.0")] * 3))
+    @patch("bot.exchanges.binance_price_for_symbol", return_value=Decimal(10))
+    def test_limit_prices_are_requested_concurrently(self, *_mocks):
+        started_at = time.perf_counter()
+        prices = asyncio.run(async_exchanges.limit_prices(["BTC", "ETH", "ADA"], "USD"))
+
+        # an order book for each of the three coins and the lows, but only a single request's worth of wall time
+        assert time.perf_counter() - started_at < SLOW_REQUEST_SECONDS * 2
+        assert prices == {"BTC": Decimal("9.0"), "ETH": Decimal("9.0"), "ADA": Decimal("9.0")}
+
+    @patch("bot.limit_buy.last_day_lows", return_value=[Decimal("9.0"), Decimal("9.0")])
+    @patch("bot.exchanges.binance_price_for_symbol", return_value=Decimal(10))
+    def test_limit_prices_skip_pairs_without_market_data(self, *_mocks):
+        def order_book(trading_pair):
+            if trading_pair == "ETHUSD":
+                raise Exception("connection reset")
+
+            return {"asks": [["10.0", "1"]], "bids": [["9.5", "1"]]}
+
+        with patch("bot.limit_buy.fetch_order_book", side_effect=order_book):
+            prices = asyncio.run(async_exchanges.limit_prices(["BTC", "ETH"], "USD"))
+
+        assert prices == {"BTC": Decimal("9.0")}
@@ -1,8 +1,23 @@
 import unittest
+from decimal import Decimal
 
 import pytest
 
 import bot.exchanges as exchanges
+from bot.supported_exchanges.binance import SymbolIndex
+
+BTCUSD_SYMBOL_INFO = {
+    "symbol": "BTCUSD",
+    "status": "TRADING",
+    "baseAsset": "BTC",
+    "quoteAsset": "USD",
+    "quoteAssetPrecision": 4,
+    "filters": [
+        {"filterType": "PRICE_FILTER", "minPrice": "0.0100", "maxPrice": "100000.0000", "tickSize": "0.0100"},
+        {"filterType": "LOT_SIZE", "minQty": "0.00000100", "maxQty": "9000.00000000", "stepSize": "0.00000100"},
+        {"filterType": "MIN_NOTIONAL", "minNotional": "10.0000", "applyToMarket": True, "avgPriceMins": 5},
+    ],
+}
 
 
 @pytest.mark.vcr
@@ -14,3 +29,40 @@ class TestBinance(unittest.TestCase):
             symbol_info_directly = exchanges.public_binance_client().get_symbol_info(target_trading_pair)
 
             assert symbol_info_from_batch == symbol_info_directly
+
+    def test_symbol_index(self):
+        index = SymbolIndex([BTCUSD_SYMBOL_INFO])
+        btc = index.get("BTCUSD")
+
+        assert btc is not None
+        assert index.get("ETHUSD") is None
+        assert index.has_pair("BTC", "USD")
+        assert not index.has_pair("BTC", "USDT")
+
+        assert btc.step_size == Decimal("0.000001")
+        assert btc.tick_size == Decimal("0.01")
+        assert btc.min_notional == Decimal(10)
+        # tick size is more restrictive than the quote asset precision
+        assert btc.price_precision == 2
+        assert btc.info is BTCUSD_SYMBOL_INFO
+
+    def test_symbol_index_tolerates_missing_filters(self):
+        # a newer listing using NOTIONAL rather than MIN_NOTIONAL, and without a LOT_SIZE filter
+        ethusd_symbol_info = {
+            **BTCUSD_SYMBOL_INFO,
+            "symbol": "ETHUSD",
+            "baseAsset": "ETH",
+            "filters": [
+                {"filterType": "PRICE_FILTER", "minPrice": "0.0100", "maxPrice": "100000.0000", "tickSize": "0.0100"},
+                {"filterType": "NOTIONAL", "minNotional": "5.0000", "applyMinToMarket": True, "avgPriceMins": 5},
+            ],
+        }
+
+        index = SymbolIndex([BTCUSD_SYMBOL_INFO, ethusd_symbol_info])
+        eth = index.get("ETHUSD")
+
+        assert eth is not None
+        assert index.get("BTCUSD") is not None
+        assert eth.step_size is None
+        assert eth.quantity_quantizer is None
+        assert eth.min_notional == Decimal(5)
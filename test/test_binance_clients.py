@@ -0,0 +1,75 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import binance.client
+
+from bot.supported_exchanges import binance as binance_exchange
+from bot.supported_exchanges.binance import BinanceClientRegistry, binance_client
+from bot.user import User
+
+
+def user_with_keys(api_key, secret_key):
+    user = User()
+    user.binance_api_key = api_key
+    user.binance_secret_key = secret_key
+    return user
+
+
+@patch.object(binance.client.Client, "ping", return_value={})
+class TestBinanceClients(unittest.TestCase):
+    def setUp(self):
+        self.registry = BinanceClientRegistry(max_clients=2, build_client=MagicMock(side_effect=lambda *_keys: MagicMock()))
+
+    def test_users_with_the_same_keys_share_a_client(self, ping_mock):
+        with patch.object(binance_exchange, "client_registry", BinanceClientRegistry()):
+            client = user_with_keys("key", "secret").binance_client()
+
+            # each run in multi-user mode builds a new user
+            assert user_with_keys("key", "secret").binance_client() is client
+            assert user_with_keys("other-key", "secret").binance_client() is not client
+
+        # building a client pings binance, which only happens once per API key
+        assert ping_mock.call_count == 2
+
+    def test_least_recently_used_client_is_evicted(self, _ping_mock):
+        first = self.registry.get("first", "secret")
+        second = self.registry.get("second", "secret")
+
+        # using the first client makes the second the least recently used
+        assert self.registry.get("first", "secret") is first
+        self.registry.get("third", "secret")
+
+        assert len(self.registry) == 2
+        assert self.registry.get("first", "secret") is first
+        assert self.registry.get("second", "secret") is not second
+
+    def test_changed_secret_builds_a_new_client(self, _ping_mock):
+        client = self.registry.get("key", "secret")
+
+        assert self.registry.get("key", "new-secret") is not client
+        assert len(self.registry) == 1
+
+    def test_concurrent_gets_return_one_client(self, _ping_mock):
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(self.registry.get("key", "secret"))) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        assert all(client is clients[0] for client in clients)
+
+    def test_clients_share_pooled_connections(self, _ping_mock):
+        public_client = binance_client("", "")
+        user_client = binance_client("key", "secret")
+
+        adapter = binance_exchange.pooled_http_adapter()
+        assert public_client.session.get_adapter("https://api.binance.us/api/v3/ping") is adapter
+        assert user_client.session.get_adapter("https://api.binance.us/api/v3/account") is adapter
+
+        # the API key header stays with each client's own session
+        assert "X-MBX-APIKEY" not in public_client.session.headers
+        assert user_client.session.headers["X-MBX-APIKEY"] == "key"
@@ -83,7 +83,7 @@ class TestBuyCommand(unittest.TestCase):
         assert user.exchanges == [SupportedExchanges.BINANCE]
         assert True == user.livemode
 
-        BuyCommand.execute(user=user, purchase_balance=Decimal(purchase_min * number_of_purchases))
+        [(_, _, market_buys, completed_orders)] = BuyCommand.execute(user=user, purchase_balance=Decimal(purchase_min * number_of_purchases))
 
         # TODO this should be extracted out into some helper
         for mock_call in order_market_buy_mock.mock_calls:
@@ -96,9 +96,14 @@ class TestBuyCommand(unittest.TestCase):
         #   - AXS, GRT, UNI is way off the target allocation
         #   - FIL, ATOM, AAVE, ALGO have all dropped within the last month
 
+        expected_order_tokens = ["BTCUSD", "ETHUSD", "AVAXUSD", "HNTUSD", "AXSUSD", "UNIUSD", "FILUSD", "ATOMUSD", "AAVEUSD", "ALGOUSD"]
+
+        # orders are submitted concurrently, so only the results are in preference order
         all_order_tokens = [mock_call.kwargs["symbol"] for mock_call in order_market_buy_mock.mock_calls]
         assert len(all_order_tokens) == number_of_purchases
-        assert ["BTCUSD", "ETHUSD", "AVAXUSD", "HNTUSD", "AXSUSD", "UNIUSD", "FILUSD", "ATOMUSD", "AAVEUSD", "ALGOUSD"] == all_order_tokens
+        assert set(expected_order_tokens) == set(all_order_tokens)
+        assert expected_order_tokens == [buy["symbol"] + "USD" for buy in market_buys]
+        assert expected_order_tokens == [order["trading_pair"] for order in completed_orders]
 
     # does a portfolio overallocated on a specific token still purchase tokens that capture much of the market cap?
     @patch.object(binance.client.Client, "order_market_buy", side_effect=mocked_order_result)
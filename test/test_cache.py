@@ -0,0 +1,237 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import bot.cache
+from bot.cache import CacheEntry, CachePolicy, FileCache, LocalCache, should_refresh
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        # outside of django, cached values are written to disk; keep them out of the real cache directory
+        self.cache_directory = tempfile.TemporaryDirectory()
+        file_cache_patch = patch("bot.cache.file_cache", FileCache(self.cache_directory.name))
+        file_cache_patch.start()
+
+        self.addCleanup(file_cache_patch.stop)
+        self.addCleanup(self.cache_directory.cleanup)
+
+    def test_local_cache_evicts_least_recently_used(self):
+        local_cache = LocalCache(max_entries=2)
+        local_cache.set("a", 1, ttl=60)
+        local_cache.set("b", 2, ttl=60)
+
+        # touching `a` makes `b` the least recently used entry
+        assert local_cache.get("a") == 1
+        local_cache.set("c", 3, ttl=60)
+
+        assert local_cache.get("b") is None
+        assert local_cache.get("a") == 1
+        assert local_cache.get("c") == 3
+
+    def test_policy_for_prefixed_keys(self):
+        assert bot.cache.policy_for_key("order_book:BTCUSD") == bot.cache.CACHE_POLICIES["order_book"]
+        assert bot.cache.policy_for_key("coinmarketcap_data") == bot.cache.CACHE_POLICIES["coinmarketcap_data"]
+        assert bot.cache.policy_for_key("unknown:BTCUSD") == bot.cache.DEFAULT_CACHE_POLICY
+
+    def test_local_cache_expires_entries(self):
+        local_cache = LocalCache()
+
+        with patch("bot.cache.time.monotonic", return_value=100):
+            local_cache.set("key", "value", ttl=10)
+            assert local_cache.get("key") == "value"
+
+        with patch("bot.cache.time.monotonic", return_value=111):
+            assert local_cache.get("key") is None
+
+        assert len(local_cache) == 0
+
+    def test_cached_result_serves_from_local_cache(self):
+        func = MagicMock(return_value={"BTCUSD": 1})
+
+        for _ in range(5):
+            assert bot.cache.cached_result("binance_price_for_symbol", func) == {"BTCUSD": 1}
+
+        assert func.call_count == 1
+
+    def test_falsy_results_are_cached(self):
+        func = MagicMock(return_value=[])
+
+        bot.cache.cached_result("binance_all_symbol_info", func)
+        bot.cache.cached_result("binance_all_symbol_info", func)
+
+        assert func.call_count == 1
+
+    def test_expired_entries_are_refreshed(self):
+        entry = CacheEntry(value=1, fresh_until=100, compute_seconds=1)
+        policy = CachePolicy(ttl=60, local_ttl=10, early_refresh_beta=0)
+
+        assert not should_refresh(entry, policy, now=99)
+        assert should_refresh(entry, policy, now=100)
+
+    def test_expensive_entries_are_refreshed_early(self):
+        entry = CacheEntry(value=1, fresh_until=100, compute_seconds=5)
+        policy = CachePolicy(ttl=60, local_ttl=10)
+
+        # a random value close to zero pushes the effective expiration far into the future
+        with patch("bot.cache.random.random", return_value=0.001):
+            assert should_refresh(entry, policy, now=90)
+
+        # a random value close to one barely moves the effective expiration
+        with patch("bot.cache.random.random", return_value=0.999):
+            assert not should_refresh(entry, policy, now=90)
+
+    def test_file_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = FileCache(os.path.join(directory, "cache"))
+            entry = CacheEntry(value={"BTCUSD": 1}, fresh_until=100, compute_seconds=1)
+
+            assert file_cache.get("binance_price_for_symbol") is None
+
+            file_cache.set("binance_price_for_symbol", entry)
+            assert file_cache.get("binance_price_for_symbol") == entry
+
+            # temporary files are renamed into place
+            assert os.listdir(file_cache.directory) == ["binance_price_for_symbol.pickle"]
+
+    def test_corrupt_file_cache_entries_are_a_miss(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = FileCache(directory)
+
+            with open(os.path.join(directory, "coinmarketcap_data.pickle"), "wb") as cache_file:
+                cache_file.write(b"not a pickle")
+
+            assert file_cache.get("coinmarketcap_data") is None
+
+    def test_file_cache_is_shared_across_runs(self):
+        func = MagicMock(return_value={"data": []})
+
+        with patch("bot.cache.in_django_environment", return_value=False):
+            assert bot.cache.cached_result("coinmarketcap_data", func) == {"data": []}
+
+            # a new process starts with an empty local cache
+            bot.cache.local_cache.clear()
+
+            assert bot.cache.cached_result("coinmarketcap_data", func) == {"data": []}
+            assert func.call_count == 1
+
+            # once the entry is no longer fresh, it is recomputed
+            bot.cache.local_cache.clear()
+            expired_at = time.time() + bot.cache.policy_for_key("coinmarketcap_data").ttl + 1
+
+            with patch("bot.cache.time.time", return_value=expired_at):
+                bot.cache.cached_result("coinmarketcap_data", func)
+
+            assert func.call_count == 2
+
+
+class FakeSharedCache:
+    """
+    Stands in for the redis backed django cache, `lock` returns the same mocked lock for every key
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.refresh_lock = MagicMock()
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.entries[key] = value
+
+    def lock(self, _name, timeout=None):
+        return self.refresh_lock
+
+
+class TestSharedCache(unittest.TestCase):
+    KEY = "coinmarketcap_data"
+
+    def setUp(self):
+        self.shared_cache = FakeSharedCache()
+
+        for cache_patch in [
+            patch("django.core.cache.cache", self.shared_cache),
+            patch("bot.cache.in_django_environment", return_value=True),
+        ]:
+            cache_patch.start()
+            self.addCleanup(cache_patch.stop)
+
+        bot.cache.local_cache.clear()
+        self.addCleanup(bot.cache.local_cache.clear)
+
+    def entry(self, value, fresh_for: float) -> CacheEntry:
+        return CacheEntry(value=value, fresh_until=time.time() + fresh_for, compute_seconds=0.1)
+
+    def test_lock_holder_refreshes_and_releases(self):
+        self.shared_cache.refresh_lock.acquire.return_value = True
+        func = MagicMock(return_value="fresh")
+
+        assert bot.cache.cached_result(self.KEY, func) == "fresh"
+
+        assert func.call_count == 1
+        assert self.shared_cache.entries[self.KEY].value == "fresh"
+        self.shared_cache.refresh_lock.acquire.assert_called_once_with(blocking=False)
+        self.shared_cache.refresh_lock.release.assert_called_once()
+
+    def test_stale_value_is_served_while_another_worker_refreshes(self):
+        self.shared_cache.entries[self.KEY] = self.entry("stale", fresh_for=-10)
+        self.shared_cache.refresh_lock.acquire.return_value = False
+        func = MagicMock(return_value="fresh")
+
+        assert bot.cache.cached_result(self.KEY, func) == "stale"
+
+        func.assert_not_called()
+        self.shared_cache.refresh_lock.release.assert_not_called()
+
+    def test_waits_for_another_worker_without_a_stale_value(self):
+        func = MagicMock(return_value="ours")
+
+        def acquire(blocking, blocking_timeout=None):
+            if not blocking:
+                return False
+
+            # the other worker finishes its refresh while we wait on the lock
+            self.shared_cache.entries[self.KEY] = self.entry("theirs", fresh_for=60)
+            return True
+
+        self.shared_cache.refresh_lock.acquire.side_effect = acquire
+
+        assert bot.cache.cached_result(self.KEY, func) == "theirs"
+
+        func.assert_not_called()
+        self.shared_cache.refresh_lock.release.assert_called_once()
+
+    def test_refresh_finished_before_lock_was_acquired_is_reused(self):
+        self.shared_cache.entries[self.KEY] = self.entry("stale", fresh_for=-10)
+        func = MagicMock(return_value="recomputed")
+
+        def acquire(blocking, blocking_timeout=None):
+            # another worker refreshed and released the lock between our read and our acquire
+            self.shared_cache.entries[self.KEY] = self.entry("refreshed", fresh_for=60)
+            return True
+
+        self.shared_cache.refresh_lock.acquire.side_effect = acquire
+
+        assert bot.cache.cached_result(self.KEY, func) == "refreshed"
+
+        func.assert_not_called()
+        self.shared_cache.refresh_lock.release.assert_called_once()
+
+    def test_waiting_for_another_worker_ignores_unusable_entries(self):
+        # written before entries were wrapped in `CacheEntry`
+        self.shared_cache.entries[self.KEY] = {"data": []}
+        self.shared_cache.refresh_lock.acquire.side_effect = lambda blocking, blocking_timeout=None: blocking
+        func = MagicMock(return_value="ours")
+
+        assert bot.cache.cached_result(self.KEY, func) == "ours"
+        assert self.shared_cache.entries[self.KEY].value == "ours"
+
+        # the other worker's refresh failed, leaving an expired entry behind
+        bot.cache.local_cache.clear()
+        self.shared_cache.entries[self.KEY] = self.entry("expired", fresh_for=-10)
+
+        assert bot.cache._refresh_shared_entry(self.KEY, func, bot.cache.policy_for_key(self.KEY), stale_entry=None) == "ours"
+        assert func.call_count == 2
@@ -1,8 +1,10 @@
 import unittest
 from test.conftest import mocked_order_result
+from test.test_coinbase import COINBASE_PRODUCTS
 from unittest.mock import patch
 
 import binance.client
+import coinbasepro
 import pytest
 from click.testing import CliRunner
 
@@ -70,7 +72,9 @@ class TestCLI(unittest.TestCase):
         self.assertIsNone(result.exception)
         assert result.exit_code == 0
 
-    def test_analyze(self):
+    # the cassette was recorded when coinbase products were loaded on import, outside of the cassette
+    @patch.object(coinbasepro.PublicClient, "get_products", return_value=COINBASE_PRODUCTS)
+    def test_analyze(self, _get_products_mock):
         runner = CliRunner()
         result = runner.invoke(main.analyze, [])
 
@@ -0,0 +1,26 @@
+import unittest
+from unittest.mock import patch
+
+import coinbasepro
+
+from bot.data_types import SupportedExchanges
+from bot.exchanges import can_buy_in_coinbase, can_buy_in_exchange
+
+COINBASE_PRODUCTS = [
+    {"id": "BTC-USD", "base_currency": "BTC", "quote_currency": "USD"},
+    {"id": "ETH-BTC", "base_currency": "ETH", "quote_currency": "BTC"},
+]
+
+
+class TestCoinbase(unittest.TestCase):
+    # importing the exchange modules should never hit the coinbase API
+    @patch.object(coinbasepro.PublicClient, "get_products", return_value=COINBASE_PRODUCTS)
+    def test_products_are_loaded_lazily(self, get_products_mock):
+        assert get_products_mock.call_count == 0
+
+        assert can_buy_in_coinbase("BTC", "USD")
+        assert not can_buy_in_coinbase("ETH", "USD")
+        assert can_buy_in_exchange(SupportedExchanges.COINBASE, "ETH", "BTC")
+
+        # products are cached after the first lookup
+        assert get_products_mock.call_count == 1
@@ -0,0 +1,59 @@
+import unittest
+from unittest.mock import patch
+
+from bot.data_types import SupportedExchanges
+from bot.exchanges import TradabilityIndex, tradability_index
+
+BINANCE_PAIRS = frozenset({("BTC", "USD"), ("ETH", "USD"), ("ETH", "USDT"), ("BNB", "USDT")})
+COINBASE_PAIRS = frozenset({("BTC", "USD"), ("ADA", "USD")})
+
+
+def symbol_info(base_asset: str, quote_asset: str) -> dict:
+    return {
+        "symbol": base_asset + quote_asset,
+        "status": "TRADING",
+        "baseAsset": base_asset,
+        "quoteAsset": quote_asset,
+        "quoteAssetPrecision": 4,
+        "filters": [],
+    }
+
+
+class TestTradabilityIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TradabilityIndex(
+            {
+                SupportedExchanges.BINANCE: lambda: BINANCE_PAIRS,
+                SupportedExchanges.COINBASE: lambda: COINBASE_PAIRS,
+            }
+        )
+
+    def test_can_buy(self):
+        assert self.index.can_buy(SupportedExchanges.BINANCE, "ETH", "USDT")
+        assert not self.index.can_buy(SupportedExchanges.BINANCE, "BNB", "USD")
+        assert self.index.can_buy(SupportedExchanges.COINBASE, "ADA", "USD")
+        assert not self.index.can_buy(SupportedExchanges.BINANCE, "ADA", "USD")
+
+    def test_exchanges_with_symbol(self):
+        assert self.index.exchanges_with_symbol("BTC", "USD") == [SupportedExchanges.BINANCE, SupportedExchanges.COINBASE]
+        assert self.index.exchanges_with_symbol("ETH", "USD") == [SupportedExchanges.BINANCE]
+        assert self.index.exchanges_with_symbol("DOGE", "USD") == []
+
+    def test_exchanges_with_symbol_limited_to_candidates(self):
+        assert self.index.exchanges_with_symbol("BTC", "USD", [SupportedExchanges.COINBASE]) == [SupportedExchanges.COINBASE]
+        assert self.index.exchanges_with_symbol("ETH", "USD", [SupportedExchanges.COINBASE]) == []
+
+    def test_base_assets(self):
+        assert self.index.base_assets(SupportedExchanges.BINANCE) == {"BTC", "ETH", "BNB"}
+        assert self.index.base_assets(SupportedExchanges.BINANCE, "USD") == {"BTC", "ETH"}
+        assert self.index.base_assets(SupportedExchanges.BINANCE, "USDT") == {"ETH", "BNB"}
+
+    def test_binance_pairs_are_rebuilt_when_exchange_info_changes(self):
+        with patch("bot.supported_exchanges.binance.binance_all_symbol_info", return_value=[symbol_info("BTC", "USD")]):
+            assert tradability_index.can_buy(SupportedExchanges.BINANCE, "BTC", "USD")
+            assert not tradability_index.can_buy(SupportedExchanges.BINANCE, "ETH", "USD")
+
+        # a refreshed exchange info is a new object, which the index is rebuilt from
+        with patch("bot.supported_exchanges.binance.binance_all_symbol_info", return_value=[symbol_info("ETH", "USD")]):
+            assert tradability_index.can_buy(SupportedExchanges.BINANCE, "ETH", "USD")
+            assert not tradability_index.can_buy(SupportedExchanges.BINANCE, "BTC", "USD")
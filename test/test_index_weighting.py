@@ -0,0 +1,61 @@
+import unittest
+from decimal import Decimal
+
+from bot import index_weighting
+from bot.data_types import MarketIndexStrategy
+from bot.market_cap import calculate_market_cap_from_coin_list
+
+MARKET_CAPS = [Decimal("1154376495230.12"), Decimal("489375493287.5"), Decimal("82374982374.3"), Decimal("1238749823.9"), Decimal("12387498.2")]
+
+
+def coinmarketcap_coin(symbol, market_cap):
+    return {"symbol": symbol, "quote": {"USD": {"market_cap": market_cap, "percent_change_7d": Decimal(0), "percent_change_30d": Decimal(0)}}}
+
+
+class TestIndexWeighting(unittest.TestCase):
+    def assert_percentages_match(self, percentages, expected_percentages):
+        assert len(percentages) == len(expected_percentages)
+
+        for percentage, expected_percentage in zip(percentages, expected_percentages):
+            assert abs(percentage - expected_percentage) < index_weighting.PERCENTAGE_TOLERANCE
+
+    def test_matches_decimal_calculation(self):
+        coins = [coinmarketcap_coin(f"COIN{i}", market_cap) for i, market_cap in enumerate(MARKET_CAPS)]
+
+        for strategy, sqrt_adjustment in [
+            (MarketIndexStrategy.MARKET_CAP, None),
+            (MarketIndexStrategy.SQRT_MARKET_CAP, None),
+            (MarketIndexStrategy.SQRT_MARKET_CAP, "3"),
+        ]:
+            if strategy == MarketIndexStrategy.SQRT_MARKET_CAP:
+                power = Decimal(1) / Decimal(sqrt_adjustment or 2)
+                adjusted_market_caps = [market_cap**power for market_cap in MARKET_CAPS]
+            else:
+                adjusted_market_caps = MARKET_CAPS
+
+            total = sum(adjusted_market_caps)
+            expected_percentages = [market_cap / total * 100 for market_cap in adjusted_market_caps]
+
+            index = calculate_market_cap_from_coin_list("USD", coins, strategy, sqrt_adjustment)
+
+            self.assert_percentages_match([coin["percentage"] for coin in index], expected_percentages)
+            assert abs(sum(coin["percentage"] for coin in index) - 100) < index_weighting.PERCENTAGE_TOLERANCE
+
+    def test_equal_weight(self):
+        weights = index_weighting.index_weights(index_weighting.market_cap_array(MARKET_CAPS), MarketIndexStrategy.EQUAL_WEIGHT)
+        self.assert_percentages_match([index_weighting.to_decimal_percentage(p) for p in weights.percentages], [Decimal(20)] * 5)
+
+    def test_weight_cap(self):
+        weights = index_weighting.index_weights(index_weighting.market_cap_array(MARKET_CAPS), MarketIndexStrategy.MARKET_CAP, weight_cap=40)
+        percentages = [index_weighting.to_decimal_percentage(p) for p in weights.percentages]
+
+        # the first two coins exceed the cap, the excess is redistributed to the rest of the index
+        assert percentages[0] == percentages[1] == Decimal(40)
+        assert abs(sum(percentages) - 100) < index_weighting.PERCENTAGE_TOLERANCE
+
+        # relative weights of uncapped coins are maintained
+        assert abs(percentages[2] / percentages[3] - MARKET_CAPS[2] / MARKET_CAPS[3]) < Decimal("1e-6")
+
+    def test_weight_cap_too_small_for_index(self):
+        weights = index_weighting.index_weights(index_weighting.market_cap_array(MARKET_CAPS), MarketIndexStrategy.MARKET_CAP, weight_cap=10)
+        assert list(weights.percentages) == [20.0] * 5
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+
+from bot import index_weighting, kline_store, limit_buy
+from bot.data_types import MarketIndexStrategy
+from bot.kline_store import KlineStore
+from bot.market_cap import calculate_market_cap_from_coin_list
+
+DAY_MS = 60 * 60 * 24 * 1000
+NOW = 1_700_000_000
+
+
+def candle(index: int, close: float, interval_ms: int = DAY_MS) -> list:
+    return [index * interval_ms, str(close), str(close), str(close), str(close), "1.0", (index + 1) * interval_ms - 1]
+
+
+def coinmarketcap_coin(symbol, market_cap):
+    return {"symbol": symbol, "quote": {"USD": {"market_cap": market_cap, "percent_change_7d": Decimal(0), "percent_change_30d": Decimal(0)}}}
+
+
+class FakeExchange:
+    def __init__(self, closes_by_pair, interval_ms: int = DAY_MS):
+        # candles end with the current interval
+        last_index = NOW * 1000 // interval_ms
+        self.candles = {
+            trading_pair: [candle(last_index - len(closes) + 1 + i, close, interval_ms) for i, close in enumerate(closes)]
+            for trading_pair, closes in closes_by_pair.items()
+        }
+        self.requests = []
+
+    def get_klines(self, symbol, interval, startTime, limit):
+        self.requests.append((symbol, startTime))
+        return [candle for candle in self.candles[symbol] if candle[0] >= startTime][:limit]
+
+
+class TestKlineStore(unittest.TestCase):
+    def setUp(self):
+        self.now = NOW
+        self.exchange = FakeExchange({"BTCUSD": [100.0, 110.0, 90.0, 100.0], "ETHUSD": [10.0, 20.0]})
+        self.store = KlineStore(":memory:", self.exchange.get_klines, clock=lambda: self.now)
+
+    def test_window(self):
+        self.store.sync("BTCUSD", "1d", 4)
+
+        window = self.store.window("BTCUSD", "1d", 3)
+
+        assert window.shape == (3, 5)
+        assert list(window[:, kline_store.CLOSE]) == [110.0, 90.0, 100.0]
+
+    def test_sync_is_incremental(self):
+        self.store.sync("BTCUSD", "1d", 4)
+        assert len(self.exchange.requests) == 1
+
+        # recently synced, the exchange isn't checked again
+        self.store.sync("BTCUSD", "1d", 4)
+        assert len(self.exchange.requests) == 1
+
+        # a new candle is added, only candles from the latest stored candle onwards are requested
+        self.now += kline_store.SYNC_TTL_SECONDS["1d"]
+        latest_candle = self.exchange.candles["BTCUSD"][-1]
+        self.exchange.candles["BTCUSD"].append(candle(latest_candle[0] // DAY_MS + 1, 120.0))
+
+        self.store.sync("BTCUSD", "1d", 4)
+
+        assert self.exchange.requests[-1] == ("BTCUSD", latest_candle[0])
+        assert list(self.store.window("BTCUSD", "1d", 5)[:, kline_store.CLOSE]) == [100.0, 110.0, 90.0, 100.0, 120.0]
+
+    def test_recent_listing_is_not_backfilled_again(self):
+        # ETH has two candles, fewer than the window
+        self.store.sync("ETHUSD", "1d", 4)
+        self.store.sync("ETHUSD", "1d", 4)
+        assert len(self.exchange.requests) == 1
+
+        # once the sync is stale, only candles from the latest stored candle onwards are requested
+        self.now += kline_store.SYNC_TTL_SECONDS["1d"]
+        self.store.sync("ETHUSD", "1d", 4)
+
+        assert self.exchange.requests[-1] == ("ETHUSD", self.exchange.candles["ETHUSD"][-1][0])
+
+        # a longer window isn't covered by the full fetch, so it is backfilled
+        self.store.sync("ETHUSD", "1d", 10)
+        assert self.exchange.requests[-1] == ("ETHUSD", int((self.now - 10 * kline_store.INTERVAL_SECONDS["1d"]) * 1000))
+
+    def test_stores_without_covered_from_are_upgraded(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "klines.sqlite3")
+        connection = sqlite3.connect(path)
+        connection.executescript(
+            """
+            CREATE TABLE sync_state (trading_pair TEXT NOT NULL, interval TEXT NOT NULL, synced_at REAL NOT NULL, PRIMARY KEY (trading_pair, interval))
+            WITHOUT ROWID;
+            """
+        )
+        connection.close()
+
+        store = KlineStore(path, self.exchange.get_klines, clock=lambda: self.now)
+        store.sync("ETHUSD", "1d", 4)
+
+        assert list(store.window("ETHUSD", "1d", 4)[:, kline_store.CLOSE]) == [10.0, 20.0]
+
+    def test_windows_are_aligned_to_the_latest_candle(self):
+        self.store.sync_many(["BTCUSD", "ETHUSD", "MISSINGUSD"], "1d", 3)
+
+        closes = self.store.windows(["BTCUSD", "ETHUSD", "MISSINGUSD"], "1d", 3, kline_store.CLOSE)
+
+        np.testing.assert_array_equal(closes, [[110.0, 90.0, 100.0], [np.nan, 10.0, 20.0], [np.nan, np.nan, np.nan]])
+
+    def test_sma_market_caps(self):
+        closes = np.array([[110.0, 90.0, 100.0], [np.nan, 10.0, 20.0], [np.nan, np.nan, np.nan]])
+        market_caps = index_weighting.sma_market_caps(np.array([1000.0, 200.0, 50.0]), closes)
+
+        # scaled by the average close over the latest close, coins without candles are unchanged
+        np.testing.assert_allclose(market_caps, [1000.0, 150.0, 50.0])
+
+    @patch("bot.exchanges.can_buy_in_exchange", return_value=True)
+    def test_sma_index(self, _can_buy_mock):
+        self.store.sync_many(["BTCUSD", "ETHUSD"], "1d", 3)
+        coins = [coinmarketcap_coin("BTC", Decimal(1000)), coinmarketcap_coin("ETH", Decimal(200))]
+
+        with patch("bot.kline_store.kline_store", return_value=self.store):
+            index = calculate_market_cap_from_coin_list("USD", coins, MarketIndexStrategy.SMA, None, sma_days=3)
+
+        assert [coin["market_cap"] for coin in index] == [Decimal(1000), Decimal(150)]
+        assert abs(index[0]["percentage"] - Decimal(1000) / Decimal(1150) * 100) < index_weighting.PERCENTAGE_TOLERANCE
+
+    def test_last_day_lows(self):
+        # the first candle is more than a day old
+        exchange = FakeExchange({"BTCUSD": [1.0] + [99.5, 98.25, 101.0] * 8, "ETHUSD": [10.1]}, interval_ms=60 * 60 * 1000)
+        store = KlineStore(":memory:", exchange.get_klines, clock=lambda: NOW)
+
+        # DOGE fails to sync, it has no low rather than failing every other pair
+        with patch("bot.kline_store.kline_store", return_value=store):
+            assert limit_buy.last_day_lows(["BTCUSD", "ETHUSD", "DOGEUSD"]) == [Decimal("98.25"), Decimal("10.1"), None]
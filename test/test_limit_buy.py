@@ -0,0 +1,42 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from bot import limit_buy
+from bot.cache import local_cache
+
+
+def order_book(ask, bid):
+    return {"asks": [[ask, "1"]], "bids": [[bid, "1"]]}
+
+
+@patch("bot.exchanges.binance_price_for_symbol", return_value=Decimal(10))
+class TestLimitBuy(unittest.TestCase):
+    def test_limit_prices(self, _price_mock):
+        prices = limit_buy.limit_prices_from_market_data(
+            ["BTCUSD", "ETHUSD", "ADAUSD"],
+            [order_book("100.00", "99.00"), order_book("10.00", "9.90"), order_book("1.000", "0.950")],
+            [Decimal("96.00"), Decimal("9.6"), Decimal("0.99")],
+        )
+
+        # BTC and ETH: last day low, ADA: the highest bid
+        assert prices == [Decimal("96.00"), Decimal("9.6"), Decimal("0.950")]
+
+    def test_limit_price_below_the_ask(self, _price_mock):
+        price = limit_buy.limit_price_from_market_data("BTCUSD", order_book("10.00", "9.90"), Decimal("9.80"))
+
+        assert price == Decimal("10.00") * limit_buy.MAXIMUM_ASK_MULTIPLE
+
+    def test_pair_without_candles_is_priced_from_the_order_book(self, _price_mock):
+        assert limit_buy.limit_price_from_market_data("BTCUSD", order_book("100.00", "96.00"), None) == Decimal("96.00")
+
+    def test_order_books_are_shared(self, _price_mock):
+        client = MagicMock()
+        client.get_order_book.return_value = order_book("100.00", "99.00")
+        self.addCleanup(local_cache.delete, "order_book:BTCUSD")
+
+        with patch("bot.exchanges.public_binance_client", return_value=client):
+            for _ in range(3):
+                assert limit_buy.fetch_order_book("BTCUSD") == order_book("100.00", "99.00")
+
+        client.get_order_book.assert_called_once_with(symbol="BTCUSD", limit=100)
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import websockets
+
+import bot.cache
+from bot import limit_buy, market_data_stream, market_snapshot
+from bot.market_data_stream import BookTop, MarketDataStream, MarketDataTable
+from bot.supported_exchanges import binance
+
+STREAM_MESSAGES = [
+    {
+        "stream": "!miniTicker@arr",
+        "data": [{"e": "24hrMiniTicker", "s": "BTCUSD", "c": "60100.00"}, {"e": "24hrMiniTicker", "s": "ETHUSD", "c": "4000.00"}],
+    },
+    {"stream": "!bookTicker", "data": {"u": 1, "s": "BTCUSD", "b": "60090.00", "B": "0.5", "a": "60110.00", "A": "0.25"}},
+    {"stream": "!miniTicker@arr", "data": [{"e": "24hrMiniTicker", "s": "BTCUSD", "c": "60200.00"}]},
+]
+
+
+class FakeCache:
+    """
+    Stands in for the redis backed django cache
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.entries[key] = value
+
+
+class FakeStreamServer:
+    """
+    Local websocket server which sends `messages` to every connection, then holds the connection open
+    """
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.paths = []
+        self.server = None
+
+    async def handler(self, websocket, path=None):
+        self.paths.append(path or websocket.path)
+
+        for message in self.messages:
+            await websocket.send(json.dumps(message))
+
+        await websocket.wait_closed()
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *_args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+
+class TestMarketDataStream(unittest.TestCase):
+    def setUp(self):
+        self.shared_cache = FakeCache()
+        self.public_client = MagicMock()
+        self.public_client.get_all_tickers.return_value = [{"symbol": "BTCUSD", "price": "59000.00"}, {"symbol": "DOGEUSD", "price": "0.25"}]
+
+        for state_patch in [
+            patch("django.core.cache.cache", self.shared_cache),
+            patch("bot.market_data_stream.in_django_environment", return_value=True),
+            patch("bot.supported_exchanges.binance.public_binance_client", return_value=self.public_client),
+        ]:
+            state_patch.start()
+            self.addCleanup(state_patch.stop)
+
+        bot.cache.local_cache.clear()
+        self.addCleanup(bot.cache.local_cache.clear)
+
+    def test_streamed_prices_and_book_tops_replace_rest_requests(self):
+        async def run():
+            async with FakeStreamServer(STREAM_MESSAGES) as server:
+                stream = MarketDataStream(stream_url=server.url)
+                task = asyncio.create_task(stream.run())
+
+                for _ in range(200):
+                    if stream.prices.get("BTCUSD") == Decimal("60200.00"):
+                        break
+
+                    await asyncio.sleep(0.01)
+
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+                stream.publish()
+
+                assert server.paths == ["/stream?streams=!miniTicker@arr/!bookTicker"]
+
+        asyncio.run(run())
+
+        # rarely traded pairs are seeded from the REST tickers
+        assert binance.binance_all_prices() == {"BTCUSD": Decimal("60200.00"), "ETHUSD": Decimal("4000.00"), "DOGEUSD": Decimal("0.25")}
+        assert self.public_client.get_all_tickers.call_count == 1
+
+        order_book = limit_buy.fetch_order_book("BTCUSD")
+        assert order_book == {"bids": [[Decimal("60090.00"), Decimal("0.5")]], "asks": [[Decimal("60110.00"), Decimal("0.25")]]}
+        self.public_client.get_order_book.assert_not_called()
+
+    def test_stale_table_falls_back_to_rest(self):
+        self.shared_cache.set(
+            market_data_stream.TABLE_CACHE_KEY,
+            MarketDataTable(
+                prices={"BTCUSD": Decimal(1)},
+                books={"BTCUSD": BookTop(Decimal(1), Decimal(1), Decimal(1), Decimal(1))},
+                updated_at=time.time() - market_data_stream.MAX_TABLE_AGE_SECONDS - 1,
+            ),
+        )
+
+        assert market_data_stream.streamed_prices() is None
+        assert market_data_stream.streamed_book_top("BTCUSD") is None
+
+    def test_publishes_only_new_updates(self):
+        clock = MagicMock(return_value=100.0)
+        stream = MarketDataStream(stream_url="ws://unused", clock=clock)
+
+        # nothing streamed yet
+        stream.publish()
+        assert self.shared_cache.entries == {}
+
+        stream.handle_message(STREAM_MESSAGES[0])
+        stream.publish()
+        assert self.shared_cache.get(market_data_stream.TABLE_CACHE_KEY).updated_at == 100.0
+
+        # a publish without new updates doesn't refresh the table, so it goes stale when the stream stops
+        clock.return_value = 200.0
+        stream.publish()
+        assert self.shared_cache.get(market_data_stream.TABLE_CACHE_KEY).updated_at == 100.0
+
+    def test_pinned_snapshot_prices_take_precedence(self):
+        stream = MarketDataStream(stream_url="ws://unused")
+        stream.handle_message(STREAM_MESSAGES[0])
+        stream.handle_message(STREAM_MESSAGES[1])
+        stream.publish()
+
+        snapshot = market_snapshot.MarketSnapshot(
+            version="1", created_at=0, coinmarketcap_data={"data": []}, tickers={"BTCUSD": Decimal(1)}, symbol_info=[]
+        )
+
+        # every run in the cycle values its portfolio with the snapshot's prices
+        with market_snapshot.pinned(snapshot):
+            assert binance.binance_all_prices() == {"BTCUSD": Decimal(1)}
+            # order books aren't part of the snapshot, limit prices come from the current book
+            assert limit_buy.fetch_order_book("BTCUSD")["asks"] == [[Decimal("60110.00"), Decimal("0.25")]]
+
+        assert binance.binance_all_prices()["BTCUSD"] == Decimal("60100.00")
+
+    def test_reseeding_replaces_prices_from_before_a_reconnect(self):
+        stream = MarketDataStream(stream_url="ws://unused")
+        stream.handle_message(STREAM_MESSAGES[0])
+
+        # BTC moved while disconnected
+        stream._seed_prices()
+
+        assert stream.prices == {"BTCUSD": Decimal("59000.00"), "DOGEUSD": Decimal("0.25")}
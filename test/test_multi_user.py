@@ -5,16 +5,29 @@ from unittest.mock import patch
 import pytest
 
 import bot.commands
+import bot.exchanges
+import bot.market_snapshot
 import users.celery
+from bot.market_snapshot import MarketSnapshot
+from bot.precheck import SkipReason
 from users.models import User
 
+EMPTY_MARKET_SNAPSHOT = MarketSnapshot(version="test", created_at=0, coinmarketcap_data={"data": []}, tickers={}, symbol_info=[])
+
 # Specifying `@pytest.mark.usefixtures('celery_session_worker')` causes issues with database cleaning
 
 
 @pytest.mark.django_db
 class TestMultiUser(unittest.TestCase):
+    def setUp(self):
+        # every user has something to buy unless a test says otherwise
+        precheck_patch = patch("bot.precheck.buy_skip_reason", return_value=None)
+        self.buy_skip_reason_mock = precheck_patch.start()
+        self.addCleanup(precheck_patch.stop)
+
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
     @patch.object(bot.commands.BuyCommand, "execute")
-    def test_performs_market_buy(self, buy_command_mock):
+    def test_performs_market_buy(self, buy_command_mock, _build_snapshot_mock):
         user_1 = User.objects.create(name="user 1")
         user_2 = User.objects.create(name="user 2")
 
@@ -22,6 +35,64 @@ class TestMultiUser(unittest.TestCase):
 
         assert buy_command_mock.call_count == 2
 
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
+    @patch.object(bot.commands.BuyCommand, "execute", return_value=[])
+    def test_users_share_market_snapshot(self, buy_command_mock, build_snapshot_mock):
+        User.objects.create(name="user 1")
+        User.objects.create(name="user 2")
+
+        users.celery.initiate_user_buys.delay()
+
+        # the snapshot is built once per cycle and every user is pinned to it
+        assert build_snapshot_mock.call_count == 1
+        assert [mock_call.kwargs["snapshot"].version for mock_call in buy_command_mock.call_args_list] == ["test", "test"]
+
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
+    @patch.object(users.celery.user_buy, "apply_async")
+    def test_spreads_user_buys_across_the_hour(self, apply_async_mock, _build_snapshot_mock):
+        for i in range(4):
+            User.objects.create(name=f"user {i}")
+
+        User.objects.create(name="disabled", disabled=True)
+
+        users.celery.initiate_user_buys.delay()
+
+        delays = [mock_call.kwargs["countdown"] for mock_call in apply_async_mock.call_args_list]
+        assert len(delays) == 4
+        assert delays == sorted(delays)
+        assert 0 <= delays[0] < 15 * 60 <= delays[1] < 30 * 60 <= delays[2] < 45 * 60 <= delays[3] < 60 * 60
+
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
+    @patch.object(users.celery.user_buy, "apply_async")
+    def test_shards_share_one_market_snapshot(self, apply_async_mock, build_snapshot_mock):
+        user_ids = {User.objects.create(name=f"user {i}").id for i in range(6)}
+
+        users.celery.initiate_user_buys.delay(shard_count=3)
+
+        assert build_snapshot_mock.call_count == 1
+
+        scheduled = [mock_call.args[0] for mock_call in apply_async_mock.call_args_list]
+        # every user is scheduled by exactly one shard, and priced against the same snapshot
+        assert sorted(user_id for user_id, _ in scheduled) == sorted(user_ids)
+        assert {snapshot_version for _, snapshot_version in scheduled} == {"test"}
+
+    @patch("bot.market_data_stream.streamed_prices", return_value={"BTCUSD": Decimal(2)})
+    def test_runs_late_in_the_cycle_use_the_snapshot_prices(self, _streamed_prices_mock):
+        # the snapshot is built at the start of the cycle, by the time this run starts the stream has newer prices
+        snapshot = MarketSnapshot(version="cycle", created_at=0, coinmarketcap_data={"data": []}, tickers={"BTCUSD": Decimal(1)}, symbol_info=[])
+        bot.market_snapshot.store_market_snapshot(snapshot)
+        user = User.objects.create(name="user")
+        prices = []
+
+        async def execute_async(context, purchase_balance=None):
+            prices.append(bot.exchanges.binance_all_prices())
+            return []
+
+        with patch.object(bot.commands.BuyCommand, "execute_async", side_effect=execute_async):
+            users.celery.user_buy(user.id, "cycle")
+
+        assert prices == [{"BTCUSD": Decimal(1)}]
+
     def test_external_portfolio(self):
         from decimal import Decimal
 
@@ -33,8 +104,15 @@ class TestMultiUser(unittest.TestCase):
         assert isinstance(fresh_user.external_portfolio[0]["amount"], Decimal)
 
     # TODO should add better mock for buy command return results
-    @patch.object(bot.commands.BuyCommand, "execute", return_value=[(None, None, None, [{}])])
-    def test_updating_last_ordered_at(self, buy_command_mock):
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
+    @patch.object(
+        bot.commands.BuyCommand,
+        "execute",
+        return_value=[
+            (None, Decimal(25), [{"symbol": "LINK", "amount": Decimal(20)}, {"symbol": "BTC", "amount": Decimal(5)}], [{"symbol": "LINK"}])
+        ],
+    )
+    def test_updating_last_ordered_at(self, buy_command_mock, _build_snapshot_mock):
         user = User.objects.create(name="name", external_portfolio=[{"amount": 7.09981267, "symbol": "LINK"}])
 
         users.celery.initiate_user_buys.delay()
@@ -42,4 +120,21 @@ class TestMultiUser(unittest.TestCase):
         fresh_user = User.objects.get(id=user.id)
 
         assert fresh_user.last_ordered_at is not None
+        # the BTC order didn't complete
+        assert fresh_user.pending_balance == Decimal(5)
         assert fresh_user.external_portfolio[0]["amount"] == Decimal("7.09981267")
+
+    @patch("bot.market_snapshot.build_market_snapshot", return_value=EMPTY_MARKET_SNAPSHOT)
+    @patch.object(bot.commands.BuyCommand, "execute")
+    def test_skips_users_with_nothing_to_buy(self, buy_command_mock, _build_snapshot_mock):
+        self.buy_skip_reason_mock.return_value = SkipReason.BELOW_PURCHASE_MINIMUM
+        user = User.objects.create(name="name", pending_balance=Decimal(100))
+
+        users.celery.initiate_user_buys.delay()
+
+        buy_command_mock.assert_not_called()
+
+        fresh_user = User.objects.get(id=user.id)
+        assert fresh_user.last_skip_reason == "below_purchase_minimum"
+        assert fresh_user.pending_balance == 0
+        assert fresh_user.date_checked is not None
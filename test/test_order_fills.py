@@ -0,0 +1,172 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+from bot import convert_stablecoins, order_fills
+from bot.data_types import (
+    ExchangeOrder,
+    OrderStatus,
+    OrderTimeInForce,
+    OrderType,
+    SupportedExchanges,
+)
+from bot.order_fills import FillState, OrderFill
+from bot.run_context import RunContext
+from bot.user import user_from_env
+
+
+def exchange_order(order_id, trading_pair: str = "USDCUSD") -> ExchangeOrder:
+    return ExchangeOrder(
+        symbol=trading_pair[:-3],
+        trading_pair=trading_pair,
+        quantity=Decimal(50),
+        price=Decimal(1),
+        created_at=0,
+        time_in_force=OrderTimeInForce.GTC,
+        type=OrderType.SELL,
+        id=str(order_id),
+        exchange=SupportedExchanges.BINANCE,
+    )
+
+
+def binance_order(order_id, trading_pair="USDCUSD", status="FILLED", executed="50.0"):
+    return {"orderId": str(order_id), "symbol": trading_pair, "status": status, "executedQty": executed, "cummulativeQuoteQty": executed}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestOrderFills(unittest.TestCase):
+    def setUp(self):
+        self.user = user_from_env()
+        self.client = MagicMock()
+        self.clock = FakeClock()
+
+        client_patch = patch.object(type(self.user), "binance_client", return_value=self.client)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+
+    def poll(self, orders, deadline_seconds=30.0) -> FillState:
+        return order_fills.poll_order_fills(self.user, orders, deadline_seconds=deadline_seconds, sleep=self.clock.sleep, clock=self.clock)
+
+    def test_settled_orders_need_a_single_round(self):
+        self.client.get_order.side_effect = lambda orderId, symbol: binance_order(orderId, symbol)
+
+        state = self.poll([exchange_order(1, "USDCUSD"), exchange_order(2, "USDTUSD")])
+
+        assert state.is_settled
+        assert state.quote_quantity == Decimal(100)
+        assert self.clock.sleeps == []
+        # looking up a couple of orders costs less weight than requesting the open orders
+        self.client.get_open_orders.assert_not_called()
+        assert self.client.get_order.call_count == 2
+
+    def test_polls_with_bounded_backoff_until_filled(self):
+        self.client.get_order.side_effect = [binance_order(1, status="PARTIALLY_FILLED", executed="10.0")] * 5 + [binance_order(1)]
+
+        state = self.poll([exchange_order(1)])
+
+        assert state.fills["1"].status == OrderStatus.FILLED
+        assert self.clock.sleeps == [0.25, 0.5, 1.0, 2.0, 4.0]
+        assert self.client.get_order.call_count == 6
+
+    def test_gives_up_at_deadline_with_partial_fills(self):
+        self.client.get_order.return_value = binance_order(1, status="PARTIALLY_FILLED", executed="10.0")
+
+        state = self.poll([exchange_order(1)], deadline_seconds=5)
+
+        assert not state.is_settled
+        assert state.pending == ["1"]
+        assert state.quote_quantity == Decimal(10)
+        assert sum(self.clock.sleeps) == 5
+
+    def test_many_orders_are_polled_through_open_orders(self):
+        orders = [exchange_order(order_id, "USDCUSD") for order_id in range(4)] + [exchange_order(order_id, "USDTUSD") for order_id in range(4, 8)]
+        # the first order is still open on the first round
+        still_open = {"USDCUSD": [binance_order(orders[0]["id"], "USDCUSD", status="NEW", executed="0")]}
+        self.client.get_open_orders.side_effect = lambda symbol: still_open.pop(symbol, [])
+        self.client.get_order.side_effect = lambda orderId, symbol: binance_order(orderId, symbol)
+
+        state = self.poll(orders)
+
+        assert state.is_settled
+        assert state.quote_quantity == Decimal(400)
+        # each pair is requested on its own, which is far cheaper than every open order
+        assert [call.kwargs for call in self.client.get_open_orders.call_args_list][:2] == [{"symbol": "USDCUSD"}, {"symbol": "USDTUSD"}]
+        # orders are only looked up once they have left the open orders
+        assert self.client.get_order.call_count == len(orders)
+
+    def test_orders_across_many_pairs_request_every_open_order(self):
+        trading_pairs = [f"COIN{index}USD" for index in range(14)]
+        orders = [exchange_order(f"{trading_pair}-{index}", trading_pair) for trading_pair in trading_pairs for index in range(4)]
+        self.client.get_open_orders.return_value = []
+        self.client.get_order.side_effect = lambda orderId, symbol: binance_order(orderId, symbol)
+
+        state = self.poll(orders)
+
+        assert state.is_settled
+        self.client.get_open_orders.assert_called_once_with()
+
+    def test_uses_order_updates_when_available(self):
+        updates = MagicMock()
+        updates.wait_for_updates.side_effect = [
+            [OrderFill.from_binance(binance_order(1, status="PARTIALLY_FILLED", executed="10.0"))],
+            [OrderFill.from_binance(binance_order(1))],
+        ]
+
+        state = order_fills.wait_for_fills(self.user, [exchange_order(1)], updates=updates, clock=self.clock)
+
+        assert state.is_settled
+        assert state.quote_quantity == Decimal(50)
+        self.client.get_open_orders.assert_not_called()
+
+    def test_orders_missed_by_updates_are_confirmed_by_polling(self):
+        # the stream reports nothing, e.g. the update was dropped while reconnecting
+        updates = MagicMock()
+
+        def wait_for_updates(order_ids, timeout):
+            self.clock.now += timeout
+            return []
+
+        updates.wait_for_updates.side_effect = wait_for_updates
+        self.client.get_open_orders.return_value = []
+        self.client.get_order.return_value = binance_order(1)
+
+        state = order_fills.wait_for_fills(self.user, [exchange_order(1)], deadline_seconds=5, updates=updates, clock=self.clock)
+
+        assert state.is_settled
+        assert state.fills["1"].status == OrderStatus.FILLED
+
+    @patch("bot.exchanges.portfolio")
+    def test_settled_conversions_are_recorded_on_the_context(self, portfolio_mock):
+        portfolio_mock.return_value = [
+            {"symbol": "USD", "amount": Decimal(5)},
+            {"symbol": "USDC", "amount": Decimal("50.1")},
+            {"symbol": "BTC", "amount": Decimal("0.1")},
+        ]
+        self.client.get_open_orders.return_value = []
+        self.client.get_order.return_value = binance_order(1)
+        context = RunContext(self.user)
+
+        with patch("bot.exchanges.market_sell", return_value=exchange_order(1)):
+            conversion = convert_stablecoins.convert_stablecoins(
+                self.user, SupportedExchanges.BINANCE, context.portfolio(SupportedExchanges.BINANCE), context=context
+            )
+
+        assert conversion.fill_state.is_settled
+        assert conversion.fill_state.quote_quantity == Decimal(50)
+
+        # the buys start with the proceeds, without pulling the account again
+        balances = {balance["symbol"]: balance["amount"] for balance in context.portfolio(SupportedExchanges.BINANCE)}
+        assert balances == {"USD": Decimal("54.95"), "USDC": Decimal("0.1"), "BTC": Decimal("0.1")}
+        portfolio_mock.assert_called_once()
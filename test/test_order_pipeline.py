@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from bot import market_buy, order_pipeline
+from bot.data_types import MarketBuyStrategy, SupportedExchanges
+from bot.run_context import RunContext
+from bot.user import user_from_env
+
+SLOW_ORDER_SECONDS = 0.2
+
+
+class TestOrderPipeline(unittest.TestCase):
+    def setUp(self):
+        self.user = user_from_env()
+        self.user.buy_strategy = MarketBuyStrategy.MARKET
+        self.context = RunContext(self.user)
+
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def slow_market_buy(self, exchange, user, symbol, purchasing_currency, amount):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        # later preferences finish first, the results should still be in preference order
+        time.sleep(SLOW_ORDER_SECONDS / int(amount))
+
+        with self.lock:
+            self.in_flight -= 1
+
+        if symbol == "FAIL":
+            raise Exception("connection reset")
+
+        return {"symbol": symbol, "trading_pair": symbol + purchasing_currency}
+
+    def execute(self, market_buys, **kwargs):
+        with patch("bot.exchanges.market_buy", side_effect=self.slow_market_buy):
+            return asyncio.run(order_pipeline.execute_market_buys(self.context, market_buys, **kwargs))
+
+    def test_orders_are_submitted_concurrently_in_preference_order(self):
+        market_buys = [{"symbol": symbol, "amount": Decimal(amount)} for amount, symbol in enumerate(["BTC", "ETH", "ADA", "SOL"], start=1)]
+
+        started_at = time.perf_counter()
+        orders = self.execute(market_buys, parallelism=4)
+
+        assert time.perf_counter() - started_at < SLOW_ORDER_SECONDS * 2
+        assert [order["symbol"] for order in orders] == ["BTC", "ETH", "ADA", "SOL"]
+
+    def test_parallelism_is_limited(self):
+        self.user.order_parallelism = 2
+        market_buys = [{"symbol": symbol, "amount": Decimal(10)} for symbol in ["BTC", "ETH", "ADA", "SOL", "DOT"]]
+
+        orders = self.execute(market_buys)
+
+        assert len(orders) == 5
+        assert self.max_in_flight == 2
+
+    def test_failed_orders_are_isolated(self):
+        market_buys = [{"symbol": symbol, "amount": Decimal(10)} for symbol in ["BTC", "FAIL", "ETH"]]
+
+        orders = self.execute(market_buys)
+
+        assert [order["symbol"] for order in orders] == ["BTC", "ETH"]
+
+    # ETH can't be priced
+    @patch("bot.async_exchanges.limit_prices", return_value={"BTC": Decimal(10)})
+    @patch("bot.exchanges.limit_buy", side_effect=lambda **order: {"symbol": order["symbol"], "price": order["price"]})
+    def test_orders_without_a_limit_price_are_skipped(self, limit_buy_mock, limit_prices_mock):
+        self.user.buy_strategy = MarketBuyStrategy.LIMIT
+        market_buys = [{"symbol": "BTC", "amount": Decimal(20)}, {"symbol": "ETH", "amount": Decimal(10)}, {"symbol": "ADA", "amount": Decimal(10)}]
+
+        orders = asyncio.run(order_pipeline.execute_market_buys(self.context, market_buys, limit_prices={"ADA": Decimal(1)}))
+
+        # the buy list is priced in a single batch, excluding prices which were provided
+        limit_prices_mock.assert_called_once_with(["BTC", "ETH"], "USD")
+        assert orders == [{"symbol": "BTC", "price": Decimal(10)}, {"symbol": "ADA", "price": Decimal(1)}]
+        limit_buy_mock.assert_any_call(
+            exchange=SupportedExchanges.BINANCE, user=self.user, purchasing_currency="USD", symbol="BTC", quantity=Decimal(2), price=Decimal(10)
+        )
+
+    def test_sync_interface(self):
+        with patch("bot.exchanges.market_buy", side_effect=self.slow_market_buy):
+            orders = market_buy.make_market_buys(self.user, [{"symbol": "BTC", "amount": Decimal(10)}], context=self.context)
+
+        assert orders == [{"symbol": "BTC", "trading_pair": "BTCUSD"}]
@@ -0,0 +1,107 @@
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from bot import order_validation
+from bot.order_validation import OrderRejected
+from bot.supported_exchanges import binance
+from bot.supported_exchanges.binance import BinanceSymbol, SymbolIndex
+from bot.user import user_from_env
+
+
+def symbol_info(trading_pair: str = "ADAUSD", status: str = "TRADING", notional_filter: dict = None) -> dict:
+    return {
+        "symbol": trading_pair,
+        "status": status,
+        "baseAsset": trading_pair[:-3],
+        "quoteAsset": trading_pair[-3:],
+        "quoteAssetPrecision": 4,
+        "filters": [
+            {"filterType": "PRICE_FILTER", "minPrice": "0.00010000", "maxPrice": "1000.00000000", "tickSize": "0.00010000"},
+            {"filterType": "LOT_SIZE", "minQty": "0.10000000", "maxQty": "9000000.00000000", "stepSize": "0.10000000"},
+            notional_filter or {"filterType": "MIN_NOTIONAL", "minNotional": "10.0000", "applyToMarket": True, "avgPriceMins": 5},
+        ],
+    }
+
+
+class TestOrderValidation(unittest.TestCase):
+    def setUp(self):
+        self.symbol = BinanceSymbol(symbol_info())
+
+    def test_quote_order(self):
+        order = order_validation.validate_quote_order(self.symbol, "ADAUSD", Decimal("25"))
+
+        assert order.quote_quantity == Decimal(25)
+        assert order.adjustments == []
+
+    def test_quote_order_is_rounded_down(self):
+        order = order_validation.validate_quote_order(self.symbol, "ADAUSD", Decimal("24.98765"))
+
+        assert order.quote_quantity == Decimal("24.9876")
+        assert order.adjustments == ["amount rounded from 24.98765 to 24.9876"]
+
+    def test_quote_order_below_min_notional(self):
+        with self.assertRaises(OrderRejected):
+            order_validation.validate_quote_order(self.symbol, "ADAUSD", Decimal("9.99"))
+
+        # the minimum can be disabled for market orders
+        notional_filter = {
+            "filterType": "NOTIONAL",
+            "minNotional": "10.00",
+            "applyMinToMarket": False,
+            "maxNotional": "100.00",
+            "applyMaxToMarket": True,
+        }
+        symbol = BinanceSymbol(symbol_info(notional_filter=notional_filter))
+
+        assert order_validation.validate_quote_order(symbol, "ADAUSD", Decimal("5")).quote_quantity == Decimal(5)
+
+        with self.assertRaises(OrderRejected):
+            order_validation.validate_quote_order(symbol, "ADAUSD", Decimal("101"))
+
+    def test_untradable_symbols(self):
+        with self.assertRaisesRegex(OrderRejected, "not listed"):
+            order_validation.validate_quote_order(None, "ADAUSD", Decimal(25))
+
+        with self.assertRaisesRegex(OrderRejected, "BREAK"):
+            order_validation.validate_quote_order(BinanceSymbol(symbol_info(status="BREAK")), "ADAUSD", Decimal(25))
+
+    def test_limit_order_is_adjusted_to_filters(self):
+        order = order_validation.validate_limit_order(self.symbol, "ADAUSD", Decimal("10.04"), Decimal("2.123456"))
+
+        # the price never rounds up, the quantity rounds up to the next step
+        assert order.price == Decimal("2.1234")
+        assert order.quantity == Decimal("10.1")
+        assert len(order.adjustments) == 2
+
+    def test_limit_order_rejections(self):
+        # below the minimum quantity
+        with self.assertRaisesRegex(OrderRejected, "quantity"):
+            order_validation.validate_limit_order(self.symbol, "ADAUSD", Decimal(0), Decimal(2))
+
+        # above the maximum price
+        with self.assertRaisesRegex(OrderRejected, "price"):
+            order_validation.validate_limit_order(self.symbol, "ADAUSD", Decimal(1), Decimal(2000))
+
+        # 4 * 2 is below the $10 minimum notional
+        with self.assertRaisesRegex(OrderRejected, "order value"):
+            order_validation.validate_limit_order(self.symbol, "ADAUSD", Decimal(4), Decimal(2))
+
+    @patch("bot.supported_exchanges.binance.binance_symbol_index", return_value=SymbolIndex([symbol_info()]))
+    def test_testmode_orders_make_no_requests(self, _symbol_index_mock):
+        user = user_from_env()
+        user.livemode = False
+
+        with patch.object(type(user), "binance_client", side_effect=AssertionError("no requests should be made")):
+            assert binance.binance_market_buy(user, "ADA", "USD", Decimal(25)) is None
+            assert binance.binance_limit_buy(user, "ADA", "USD", Decimal(10), Decimal(2)) is None
+            assert binance.binance_market_sell(user, "ADA", "USD", Decimal(25)) is None
+
+    @patch("bot.supported_exchanges.binance.binance_symbol_index", return_value=SymbolIndex([symbol_info()]))
+    def test_rejected_orders_are_not_submitted(self, _symbol_index_mock):
+        user = user_from_env()
+        user.livemode = True
+
+        with patch.object(type(user), "binance_client", side_effect=AssertionError("no requests should be made")):
+            assert binance.binance_market_buy(user, "ADA", "USD", Decimal(5)) is None
+            assert binance.binance_limit_buy(user, "BTC", "USD", Decimal(1), Decimal(2)) is None
@@ -0,0 +1,89 @@
+import unittest
+from decimal import Decimal
+
+from bot.data_types import CryptoBalance
+from bot.portfolio import (
+    Portfolio,
+    PortfolioEntry,
+    merge_portfolio,
+    portfolio_with_allocation_percentages,
+)
+
+
+class TestPortfolio(unittest.TestCase):
+    def test_entry_field_access(self):
+        entry = PortfolioEntry(symbol="BTC", amount=Decimal(1))
+
+        assert entry["amount"] == entry.amount == Decimal(1)
+        assert "usd_total" in entry
+        assert "market_cap" not in entry
+
+        entry["usd_price"] = Decimal(10)
+        assert entry.usd_price == Decimal(10)
+
+        with self.assertRaises(KeyError):
+            entry["market_cap"]
+
+    def test_duplicate_symbols_are_combined(self):
+        portfolio = Portfolio.from_balances([{"symbol": "BTC", "amount": Decimal(1)}, {"symbol": "BTC", "amount": Decimal("0.5")}])
+
+        assert len(portfolio) == 1
+        assert portfolio.get("BTC").amount == Decimal("1.5")
+
+    def test_merge_portfolio(self):
+        exchange_portfolio = [
+            CryptoBalance(
+                symbol="BTC", amount=Decimal(1), usd_price=Decimal(0), usd_total=Decimal(0), percentage=Decimal(0), target_percentage=Decimal(0)
+            ),
+            CryptoBalance(
+                symbol="ETH", amount=Decimal(2), usd_price=Decimal(0), usd_total=Decimal(0), percentage=Decimal(0), target_percentage=Decimal(0)
+            ),
+        ]
+        external_portfolio = [{"symbol": "ETH", "amount": Decimal(3)}, {"symbol": "ADA", "amount": Decimal(100)}]
+
+        merged_portfolio = merge_portfolio(exchange_portfolio, external_portfolio)
+
+        # order is preserved: assets from the first portfolio, then new assets from the second
+        assert [(entry.symbol, entry.amount) for entry in merged_portfolio] == [("BTC", Decimal(1)), ("ETH", Decimal(5)), ("ADA", Decimal(100))]
+
+        # source portfolios are not modified
+        assert exchange_portfolio[1]["amount"] == Decimal(2)
+        assert external_portfolio[0]["amount"] == Decimal(3)
+
+    def test_allocation_percentages(self):
+        portfolio = Portfolio(
+            [
+                PortfolioEntry(symbol="BTC", amount=Decimal(1), usd_price=Decimal(30)),
+                PortfolioEntry(symbol="ETH", amount=Decimal(2), usd_price=Decimal(5)),
+                # assets without any value have no allocation and are removed
+                PortfolioEntry(symbol="DUST", amount=Decimal(10), usd_price=Decimal(0)),
+                PortfolioEntry(symbol="ADA", amount=Decimal(0), usd_price=Decimal(1)),
+            ]
+        )
+
+        portfolio = portfolio_with_allocation_percentages(portfolio)
+
+        assert "DUST" not in portfolio
+        assert "ADA" not in portfolio
+        assert portfolio.get("BTC").usd_total == Decimal(30)
+        assert portfolio.get("BTC").percentage == Decimal(75)
+        assert portfolio.get("ETH").percentage == Decimal(25)
+
+    def test_to_list(self):
+        portfolio = Portfolio(
+            [
+                PortfolioEntry(symbol="ETH", amount=Decimal(2), usd_price=Decimal(5), target_percentage=Decimal(20)),
+                PortfolioEntry(symbol="BTC", amount=Decimal(1), usd_price=Decimal(30), target_percentage=Decimal(80)),
+            ]
+        )
+
+        portfolio.sort(key=lambda entry: entry.target_percentage, reverse=True)
+
+        assert portfolio.to_list() == [
+            CryptoBalance(
+                symbol="BTC", amount=Decimal(1), usd_price=Decimal(30), usd_total=Decimal(0), percentage=Decimal(0), target_percentage=Decimal(80)
+            ),
+            CryptoBalance(
+                symbol="ETH", amount=Decimal(2), usd_price=Decimal(5), usd_total=Decimal(0), percentage=Decimal(0), target_percentage=Decimal(20)
+            ),
+        ]
@@ -0,0 +1,85 @@
+import datetime
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from bot import precheck
+from bot.data_types import (
+    MarketBuyStrategy,
+    OrderTimeInForce,
+    OrderType,
+    SupportedExchanges,
+)
+from bot.precheck import SkipReason
+from bot.run_context import RunContext
+from bot.user import user_from_env
+
+
+def balance(symbol, amount):
+    return {"symbol": symbol, "amount": Decimal(amount)}
+
+
+def open_order(hours_ago):
+    return {
+        "symbol": "BTC",
+        "trading_pair": "BTCUSD",
+        "type": OrderType.BUY,
+        "time_in_force": OrderTimeInForce.GTC,
+        "created_at": (datetime.datetime.now() - datetime.timedelta(hours=hours_ago)).timestamp(),
+        "id": "1",
+        "quantity": Decimal(1),
+        "price": Decimal(1),
+        "exchange": SupportedExchanges.BINANCE,
+    }
+
+
+class TestPrecheck(unittest.TestCase):
+    def setUp(self):
+        self.user = user_from_env()
+        self.user.convert_stablecoins = True
+        self.user.buy_strategy = MarketBuyStrategy.LIMIT
+        self.user.cancel_stale_orders = True
+        self.user.stale_order_hour_limit = 24
+
+        self.open_orders_patch = patch("bot.exchanges.open_orders", return_value=[])
+        self.open_orders_mock = self.open_orders_patch.start()
+        self.addCleanup(self.open_orders_patch.stop)
+
+    def skip_reason(self, portfolio):
+        with patch("bot.exchanges.portfolio", return_value=portfolio) as portfolio_mock:
+            context = RunContext(self.user)
+            skip_reason = precheck.buy_skip_reason(context)
+
+            # the balances are reused by the rest of the run
+            context.portfolio(SupportedExchanges.BINANCE)
+            assert portfolio_mock.call_count == 1
+
+        return skip_reason
+
+    def test_purchasing_currency_is_actionable(self):
+        assert self.skip_reason([balance("USD", 50)]) is None
+        # account data beyond the balance isn't needed
+        self.open_orders_mock.assert_not_called()
+
+    def test_skip_reasons(self):
+        assert self.skip_reason([]) == SkipReason.NO_PURCHASING_CURRENCY
+        assert self.skip_reason([balance("BTC", 1), balance("USD", 5)]) == SkipReason.BELOW_PURCHASE_MINIMUM
+
+    def test_stablecoins_to_convert_are_actionable(self):
+        assert self.skip_reason([balance("USDC", 50)]) is None
+
+        # too little to convert
+        assert self.skip_reason([balance("USDC", 5)]) == SkipReason.NO_PURCHASING_CURRENCY
+
+        self.user.convert_stablecoins = False
+        assert self.skip_reason([balance("USDC", 50)]) == SkipReason.NO_PURCHASING_CURRENCY
+
+    def test_stale_orders_are_actionable(self):
+        self.open_orders_mock.return_value = [open_order(hours_ago=1)]
+        assert self.skip_reason([]) == SkipReason.NO_PURCHASING_CURRENCY
+
+        self.open_orders_mock.return_value = [open_order(hours_ago=48)]
+        assert self.skip_reason([]) is None
+
+        self.user.buy_strategy = MarketBuyStrategy.MARKET
+        assert self.skip_reason([]) == SkipReason.NO_PURCHASING_CURRENCY
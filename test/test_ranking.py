@@ -0,0 +1,67 @@
+import unittest
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from bot import analytics, ranking
+from bot.portfolio import Portfolio, PortfolioEntry
+from bot.user import user_from_env
+
+
+def coin(symbol, percentage, change_30d=0):
+    return {"symbol": symbol, "percentage": Decimal(percentage), "change_30d": change_30d}
+
+
+class TestRanking(unittest.TestCase):
+    def setUp(self):
+        self.user = user_from_env()
+        self.user.allocation_drift_multiple_limit = 5
+        self.user.allocation_drift_percentage_limit = None
+
+        self.coins = [coin("BTC", 40, change_30d=10), coin("ETH", 20, change_30d=-5), coin("ADA", 10), coin("DOGE", 5)]
+        self.portfolio = Portfolio([PortfolioEntry(symbol="BTC", amount=Decimal(1), percentage=Decimal(30))])
+        self.context = ranking.RankingContext(merged_portfolio=self.portfolio, deprioritized_coins=["DOGE"], user=self.user)
+
+    def test_score_breakdown(self):
+        ranked_coins = ranking.rank_coins(self.coins, self.context)
+
+        assert [ranked_coin.coin["symbol"] for ranked_coin in ranked_coins] == ["ETH", "ADA", "BTC", "DOGE"]
+
+        # disabled criteria are not scored
+        assert list(ranked_coins[0].scores.keys()) == ["deprioritized", "allocation_drift_multiple", "unowned", "change_30d", "target_delta"]
+
+        # unowned coins are treated as marginally owned, so ADA & ETH exceed the drift multiple
+        assert ranked_coins[0].scores["allocation_drift_multiple"] == -2000
+        assert ranked_coins[1].scores["allocation_drift_multiple"] == -1000
+        assert ranked_coins[2].scores == {
+            "deprioritized": 0,
+            "allocation_drift_multiple": 0,
+            "unowned": 1,
+            "change_30d": 10,
+            "target_delta": Decimal(-10),
+        }
+        assert ranked_coins[3].scores["deprioritized"] == 1
+
+    def test_custom_criteria(self):
+        # ignore everything except the 30d change
+        criteria = [criterion for criterion in ranking.DEFAULT_RANKING_CRITERIA if criterion.name == "change_30d"]
+        ranked_coins = ranking.rank_coins(self.coins, self.context, criteria=criteria)
+
+        # ties keep the original order
+        assert [ranked_coin.coin["symbol"] for ranked_coin in ranked_coins] == ["ETH", "ADA", "DOGE", "BTC"]
+
+    def test_momentum_replaces_30d_change(self):
+        self.user.rank_by_momentum = True
+
+        # ETH rose on the exchange, ADA dropped, BTC & DOGE have no candles
+        closes = np.array([[np.nan, np.nan], [100.0, 110.0], [10.0, 8.0], [np.nan, np.nan]])
+        context = self.context._replace(analytics=analytics.compute_analytics(["BTC", "ETH", "ADA", "DOGE"], closes))
+
+        criteria = [criterion for criterion in ranking.DEFAULT_RANKING_CRITERIA if criterion.name in ("change_30d", "momentum")]
+        ranked_coins = ranking.rank_coins(self.coins, context, criteria=criteria)
+
+        assert [ranked_coin.coin["symbol"] for ranked_coin in ranked_coins] == ["ADA", "BTC", "DOGE", "ETH"]
+        assert list(ranked_coins[0].scores.keys()) == ["momentum"]
+        assert ranked_coins[0].scores["momentum"] == pytest.approx(-0.2)
+        assert ranked_coins[1].scores["momentum"] == 0.0
@@ -0,0 +1,171 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import binance.client
+import pytest
+
+from bot import rate_limit
+from bot.rate_limit import (
+    ORDER_LIMIT,
+    REQUEST_WEIGHT_LIMIT,
+    LocalTokenBuckets,
+    RateLimitExceeded,
+    RateLimitGovernor,
+    RedisTokenBuckets,
+)
+from bot.supported_exchanges.binance import binance_client
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def fake_response(status_code=200, headers=None, body=None):
+    response = MagicMock(status_code=status_code, headers=headers or {}, text="{}")
+    response.json.return_value = body if body is not None else {}
+    return response
+
+
+class TestRateLimit(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.buckets = LocalTokenBuckets(clock=self.clock)
+        self.governor = RateLimitGovernor(self.buckets, sleep=self.clock.sleep)
+
+    def test_request_costs(self):
+        assert rate_limit.request_costs("get", "https://api.binance.us/api/v3/openOrders", {"symbol": "BTCUSD"}) == [(REQUEST_WEIGHT_LIMIT, 3)]
+        assert rate_limit.request_costs("get", "https://api.binance.us/api/v3/openOrders", {}) == [(REQUEST_WEIGHT_LIMIT, 40)]
+        assert rate_limit.request_costs("get", "https://api.binance.us/api/v3/account", {}) == [(REQUEST_WEIGHT_LIMIT, 10)]
+        assert rate_limit.request_costs("post", "https://api.binance.us/api/v3/order", {"symbol": "BTCUSD"}) == [
+            (REQUEST_WEIGHT_LIMIT, 1),
+            (ORDER_LIMIT, 1),
+        ]
+        assert rate_limit.request_costs("post", "https://api.binance.us/api/v3/order/test", {"symbol": "BTCUSD"}) == [(REQUEST_WEIGHT_LIMIT, 1)]
+
+    def test_throttles_once_budget_is_spent(self):
+        for _ in range(int(REQUEST_WEIGHT_LIMIT.capacity // 40)):
+            self.governor.acquire("get", "https://api.binance.us/api/v3/openOrders")
+
+        assert self.clock.now == 1000.0
+
+        self.governor.acquire("get", "https://api.binance.us/api/v3/openOrders")
+
+        # waited just long enough for the bucket to refill the missing tokens
+        assert self.clock.now > 1000.0
+        assert self.clock.now - 1000.0 <= 40 / REQUEST_WEIGHT_LIMIT.refill_per_second
+
+    def test_order_budget_is_separate(self):
+        for _ in range(int(ORDER_LIMIT.capacity)):
+            self.governor.acquire("post", "https://api.binance.us/api/v3/order")
+
+        # orders are exhausted, but plain requests still have plenty of weight left
+        self.governor.acquire("get", "https://api.binance.us/api/v3/account")
+        assert self.clock.now == 1000.0
+
+        self.governor.acquire("post", "https://api.binance.us/api/v3/order")
+        assert self.clock.now > 1000.0
+
+    def test_used_weight_header_includes_other_workers(self):
+        # another process has used almost the entire budget
+        self.governor.record_response(fake_response(headers={"x-mbx-used-weight-1m": str(int(REQUEST_WEIGHT_LIMIT.capacity) - 5)}))
+
+        self.governor.acquire("get", "https://api.binance.us/api/v3/ticker/price", {"symbol": "BTCUSD"})
+        assert self.clock.now == 1000.0
+
+        self.governor.acquire("get", "https://api.binance.us/api/v3/account")
+        assert self.clock.now > 1000.0
+
+    def test_rate_limited_response_blocks_requests(self):
+        self.governor.record_response(fake_response(status_code=429, headers={"retry-after": "30"}))
+
+        self.governor.acquire("get", "https://api.binance.us/api/v3/ping")
+        assert self.clock.now >= 1030.0
+
+    def test_gives_up_after_max_wait(self):
+        governor = RateLimitGovernor(self.buckets, max_wait_seconds=10, sleep=self.clock.sleep)
+        governor.record_response(fake_response(status_code=418, headers={"retry-after": "600"}))
+
+        with pytest.raises(RateLimitExceeded):
+            governor.acquire("get", "https://api.binance.us/api/v3/ping")
+
+    @patch.object(binance.client.Client, "ping", return_value={})
+    def test_client_requests_are_governed(self, _ping_mock):
+        governor = RateLimitGovernor(self.buckets, sleep=self.clock.sleep)
+
+        with patch("bot.rate_limit.governor", return_value=governor):
+            client = binance_client("", "")
+            client.session.get = MagicMock(return_value=fake_response(headers={"x-mbx-used-weight-1m": "1000"}, body=[]))
+
+            assert client.get_all_tickers() == []
+
+        # the weight reported by binance is reflected in the shared budget
+        assert self.buckets.take(REQUEST_WEIGHT_LIMIT, 100) > 0
+
+    @patch.object(binance.client.Client, "ping", return_value={})
+    def test_concurrent_requests_on_one_client_get_their_own_response(self, _ping_mock):
+        governor = RateLimitGovernor(self.buckets, sleep=self.clock.sleep)
+        symbols = ["BTCUSD", "ETHUSD", "ADAUSD", "SOLUSD"]
+        # every response is handled at the same time, after every request has completed
+        handling = threading.Barrier(len(symbols))
+        recorded = []
+        results = {}
+
+        def get(uri, params, **_kwargs):
+            symbol = params.split("=")[1]
+            response = fake_response(headers={"x-mbx-used-weight-1m": "1"})
+            response.symbol = symbol
+
+            def json():
+                handling.wait(timeout=5)
+                return {"symbol": symbol, "price": "1.0"}
+
+            response.json.side_effect = json
+            return response
+
+        with patch("bot.rate_limit.governor", return_value=governor), patch.object(governor, "record_response", side_effect=recorded.append):
+            client = binance_client("", "")
+            client.session.get = MagicMock(side_effect=get)
+
+            def request(symbol):
+                results[symbol] = client.get_symbol_ticker(symbol=symbol)
+
+            threads = [threading.Thread(target=request, args=(symbol,)) for symbol in symbols]
+
+            for thread in threads:
+                thread.start()
+
+            for thread in threads:
+                thread.join()
+
+        assert {symbol: result["symbol"] for symbol, result in results.items()} == {symbol: symbol for symbol in symbols}
+        # each response is recorded once
+        assert sorted(response.symbol for response in recorded) == sorted(symbols)
+
+    def test_falls_back_to_local_buckets_without_redis_scripting(self):
+        from redis.exceptions import ResponseError
+
+        connection = MagicMock()
+        connection.register_script.return_value = MagicMock(side_effect=ResponseError("unknown command 'evalsha'"))
+        buckets = RedisTokenBuckets(connection)
+
+        assert buckets.take(ORDER_LIMIT, 1) == 0
+        buckets.observe(ORDER_LIMIT, int(ORDER_LIMIT.capacity), 0)
+
+        # the budget is still enforced, within this process
+        assert buckets.take(ORDER_LIMIT, 1) > 0
+
+    @patch("bot.rate_limit.in_django_environment", return_value=True)
+    @patch("django_redis.get_redis_connection", side_effect=NotImplementedError("This backend does not support this feature"))
+    def test_non_redis_cache_backend_uses_local_buckets(self, *_mocks):
+        rate_limit.governor.cache_clear()
+        self.addCleanup(rate_limit.governor.cache_clear)
+
+        assert isinstance(rate_limit.governor().buckets, LocalTokenBuckets)
@@ -0,0 +1,95 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest.mock import patch
+
+from bot.data_types import SupportedExchanges
+from bot.run_context import RunContext
+from bot.user import user_from_env
+
+
+class TestRunContext(unittest.TestCase):
+    @patch("bot.exchanges.open_orders", return_value=[])
+    @patch("bot.exchanges.portfolio", return_value=[])
+    def test_account_data_is_pulled_once(self, portfolio_mock, open_orders_mock):
+        context = RunContext(user_from_env())
+
+        for _ in range(3):
+            context.portfolio(SupportedExchanges.BINANCE)
+            context.open_orders(SupportedExchanges.BINANCE)
+
+        assert portfolio_mock.call_count == 1
+        assert open_orders_mock.call_count == 1
+
+    @patch("bot.exchanges.portfolio", return_value=[])
+    def test_concurrent_reads_share_a_single_request(self, portfolio_mock):
+        context = RunContext(user_from_env())
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: context.portfolio(SupportedExchanges.BINANCE), range(8)))
+
+        assert portfolio_mock.call_count == 1
+
+    @patch("bot.exchanges.market_buy", return_value={})
+    @patch("bot.exchanges.cancel_order", return_value={})
+    @patch("bot.exchanges.open_orders", return_value=[])
+    @patch("bot.exchanges.portfolio", return_value=[])
+    def test_orders_invalidate_account_data(self, portfolio_mock, open_orders_mock, cancel_order_mock, market_buy_mock):
+        user = user_from_env()
+        context = RunContext(user)
+
+        context.portfolio(SupportedExchanges.BINANCE)
+        context.open_orders(SupportedExchanges.BINANCE)
+
+        context.market_buy(SupportedExchanges.BINANCE, symbol="BTC", purchasing_currency="USD", amount=Decimal(10))
+        market_buy_mock.assert_called_once_with(
+            exchange=SupportedExchanges.BINANCE, user=user, symbol="BTC", purchasing_currency="USD", amount=Decimal(10)
+        )
+
+        context.portfolio(SupportedExchanges.BINANCE)
+        context.open_orders(SupportedExchanges.BINANCE)
+
+        assert portfolio_mock.call_count == 2
+        assert open_orders_mock.call_count == 2
+
+        context.cancel_order(SupportedExchanges.BINANCE, {})
+        context.portfolio(SupportedExchanges.BINANCE)
+
+        assert portfolio_mock.call_count == 3
+
+    @patch("bot.exchanges.portfolio", return_value=[])
+    @patch("bot.exchanges.market_sell", side_effect=Exception("order rejected"))
+    def test_failed_orders_still_invalidate(self, _market_sell_mock, portfolio_mock):
+        context = RunContext(user_from_env())
+        context.portfolio(SupportedExchanges.BINANCE)
+
+        # a failed request may still have reached the exchange, so the balances can't be trusted
+        with self.assertRaises(Exception):
+            context.market_sell(SupportedExchanges.BINANCE, symbol="USDC", purchasing_currency="USD", amount=Decimal(10))
+
+        context.portfolio(SupportedExchanges.BINANCE)
+
+        assert portfolio_mock.call_count == 2
+
+    @patch("bot.exchanges.market_buy", return_value={})
+    def test_load_in_flight_during_an_order_is_not_stored(self, _market_buy_mock):
+        context = RunContext(user_from_env())
+        loads = []
+
+        def portfolio(exchange, user):
+            loads.append(exchange)
+
+            # the order is placed while the first request is still waiting on the exchange
+            if len(loads) == 1:
+                context.market_buy(SupportedExchanges.BINANCE, symbol="BTC", purchasing_currency="USD", amount=Decimal(10))
+
+            return [{"symbol": "USD", "amount": Decimal(len(loads))}]
+
+        with patch("bot.exchanges.portfolio", side_effect=portfolio):
+            context.portfolio(SupportedExchanges.BINANCE)
+
+            # the balance from before the order was not kept
+            assert context.portfolio(SupportedExchanges.BINANCE) == [{"symbol": "USD", "amount": Decimal(2)}]
+            assert context.portfolio(SupportedExchanges.BINANCE) == [{"symbol": "USD", "amount": Decimal(2)}]
+
+        assert len(loads) == 2
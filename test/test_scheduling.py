@@ -0,0 +1,61 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from bot import scheduling
+from bot.scheduling import SchedulableUser
+
+NOW = datetime(2021, 11, 20, tzinfo=timezone.utc)
+
+
+def schedulable_user(user_id, last_ordered_days_ago=1, pending_balance=None):
+    last_ordered_at = NOW - timedelta(days=last_ordered_days_ago) if last_ordered_days_ago is not None else None
+    return SchedulableUser(id=user_id, last_ordered_at=last_ordered_at, pending_balance=pending_balance)
+
+
+class TestScheduling(unittest.TestCase):
+    def test_runs_are_spread_evenly_across_the_period(self):
+        users = [schedulable_user(user_id) for user_id in range(600)]
+
+        runs = scheduling.schedule_user_runs(users)
+
+        assert len(runs) == 600
+
+        # every minute of the hour starts the same number of runs
+        runs_per_minute = [0] * 60
+        for run in runs:
+            runs_per_minute[int(run.delay // 60)] += 1
+
+        assert max(runs_per_minute) - min(runs_per_minute) <= 1
+
+    def test_offsets_are_stable(self):
+        users = [schedulable_user(user_id) for user_id in range(50)]
+
+        assert scheduling.schedule_user_runs(users) == scheduling.schedule_user_runs(list(reversed(users)))
+
+    def test_shards_partition_users(self):
+        users = [schedulable_user(user_id) for user_id in range(300)]
+
+        shards = [scheduling.schedule_user_runs(users, shard=shard, shard_count=3) for shard in range(3)]
+        scheduled_ids = [run.user_id for runs in shards for run in runs]
+
+        assert sorted(scheduled_ids) == list(range(300))
+        assert all(len(runs) > 50 for runs in shards)
+
+        # each shard spreads its own users across the whole period
+        for runs in shards:
+            assert runs[-1].delay > 55 * 60
+
+    def test_priority(self):
+        users = [
+            schedulable_user(1, last_ordered_days_ago=1),
+            schedulable_user(2, last_ordered_days_ago=10),
+            schedulable_user(3, last_ordered_days_ago=None),
+            schedulable_user(4, pending_balance=Decimal(5)),
+            schedulable_user(5, pending_balance=Decimal(500)),
+        ]
+
+        runs = scheduling.schedule_user_runs(users)
+
+        assert [run.user_id for run in runs] == [5, 4, 3, 2, 1]
+        assert [run.delay for run in runs] == sorted(run.delay for run in runs)
@@ -0,0 +1,52 @@
+import unittest
+
+from bot import startup_profile
+
+# modules which are slow to import and must only be loaded by the commands which use them
+HEAVY_MODULES = ["binance.client", "coinbasepro", "numpy", "django", "celery"]
+
+# generous, this catches regressions like an accidental top-level import of django or the exchange clients
+COLD_START_BUDGET_SECONDS = 3
+
+# modules each command imports before it makes any API calls
+COMMAND_IMPORTS = {
+    "index": ["bot.market_cap"],
+    "portfolio": ["bot.market_buy", "bot.commands"],
+    "buy --dry-run": ["bot.commands"],
+}
+
+
+class TestStartup(unittest.TestCase):
+    def test_parse_import_times(self):
+        imports, other_lines = startup_profile.parse_import_times(
+            "\n".join(
+                [
+                    "import time: self [us] | cumulative | imported package",
+                    "import time:       137 |        137 |   _io",
+                    "import time:       292 |        756 | _frozen_importlib_external",
+                    "a warning",
+                ]
+            )
+        )
+
+        assert imports == [
+            startup_profile.ImportTiming(module="_io", self_us=137, cumulative_us=137, depth=1),
+            startup_profile.ImportTiming(module="_frozen_importlib_external", self_us=292, cumulative_us=756, depth=0),
+        ]
+        assert other_lines == ["a warning"]
+
+    def test_cli_startup_is_lazy(self):
+        profile = startup_profile.profile_imports([])
+
+        assert profile.returncode == 0
+        assert not profile.imported_modules() & set(HEAVY_MODULES)
+
+    def test_command_cold_start_budget(self):
+        for command, modules in COMMAND_IMPORTS.items():
+            profile = startup_profile.profile_imports(modules)
+
+            assert profile.returncode == 0, command
+            assert profile.wall_seconds < COLD_START_BUDGET_SECONDS, command
+
+            # django is only needed when running against the database
+            assert "django" not in profile.imported_modules(), command
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import websockets
+
+from bot import user_data_stream
+from bot.data_types import OrderStatus, SupportedExchanges
+from bot.order_fills import OrderFill
+from bot.run_context import RunContext
+from bot.user import user_from_env
+
+ACCOUNT = {"balances": [{"asset": "USD", "free": "5.00", "locked": "0"}, {"asset": "BTC", "free": "0.1", "locked": "0"}]}
+
+STREAM_EVENTS = [
+    # withdrawals and assets which can't be invested don't trigger a buy
+    {"e": "balanceUpdate", "a": "USD", "d": "-2.00"},
+    {"e": "balanceUpdate", "a": "BTC", "d": "0.5"},
+    {"e": "executionReport", "s": "USDCUSD", "i": 42, "X": "PARTIALLY_FILLED", "z": "10.0", "Z": "10.0"},
+    {"e": "executionReport", "s": "USDCUSD", "i": 42, "X": "FILLED", "z": "50.0", "Z": "50.0"},
+    {"e": "balanceUpdate", "a": "USD", "d": "100.00"},
+    {"e": "outboundAccountPosition", "B": [{"a": "USD", "f": "105.00", "l": "0"}]},
+    # the same deposit reported again
+    {"e": "balanceUpdate", "a": "USD", "d": "100.00"},
+]
+
+
+class FakeCache:
+    """
+    Stands in for the redis backed django cache
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.entries[key] = value
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+
+class FakeStreamServer:
+    """
+    Local websocket server which sends `events` to every connection, then holds the connection open
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.paths = []
+        self.server = None
+
+    async def handler(self, websocket, path=None):
+        self.paths.append(path or websocket.path)
+
+        for event in self.events:
+            await websocket.send(json.dumps(event))
+
+        await websocket.wait_closed()
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *_args):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self):
+        return f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+
+class TestUserDataStream(unittest.TestCase):
+    def setUp(self):
+        self.user = user_from_env()
+        self.user.binance_api_key = "stream-test-key"
+
+        self.client = MagicMock()
+        self.client.stream_get_listen_key.return_value = "listen-key"
+        self.client.get_account.return_value = ACCOUNT
+
+        self.shared_cache = FakeCache()
+
+        for state_patch in [
+            patch.object(type(self.user), "binance_client", return_value=self.client),
+            patch("django.core.cache.cache", self.shared_cache),
+            patch("bot.user_data_stream.in_django_environment", return_value=True),
+        ]:
+            state_patch.start()
+            self.addCleanup(state_patch.stop)
+
+    def test_stream_updates_balances_orders_and_triggers_buys(self):
+        deposits = []
+        observed = {}
+
+        async def run():
+            async with FakeStreamServer(STREAM_EVENTS) as server:
+                stream = user_data_stream.UserDataStream(1, self.user, deposits.append, ["USD", "USDC"], stream_url=server.url)
+
+                def received_every_event():
+                    return bool(deposits) and stream.balances.get("USD") == Decimal("105.00")
+
+                task = asyncio.create_task(stream.run())
+
+                for _ in range(200):
+                    if received_every_event():
+                        break
+
+                    await asyncio.sleep(0.01)
+
+                # read while the stream is still connected
+                observed["portfolio"] = user_data_stream.streamed_portfolio(self.user)
+                observed["updates"] = user_data_stream.order_update_source(self.user).wait_for_updates([42], timeout=1)
+
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+                assert server.paths == ["/ws/listen-key"]
+
+        asyncio.run(run())
+
+        # only the first report of the deposit triggers a buy
+        assert deposits == [1]
+
+        balances = {balance["symbol"]: balance["amount"] for balance in observed["portfolio"]}
+        assert balances == {"USD": Decimal("105.00"), "BTC": Decimal("0.1")}
+
+        assert observed["updates"] == [
+            OrderFill(id=42, trading_pair="USDCUSD", status=OrderStatus.FILLED, executed_quantity=Decimal(50), quote_quantity=Decimal(50))
+        ]
+
+        # once the stream stops, its balances are no longer trusted
+        assert user_data_stream.streamed_portfolio(self.user) is None
+        assert user_data_stream.order_update_source(self.user) is None
+
+    @patch("bot.exchanges.portfolio", return_value=[])
+    def test_run_context_uses_streamed_balances_until_an_order(self, portfolio_mock):
+        stream = user_data_stream.UserDataStream(1, self.user, MagicMock(), ["USD"])
+        stream._mark_connected()
+        stream.handle_event({"e": "outboundAccountPosition", "B": [{"a": "USD", "f": "50.00", "l": "0"}]})
+
+        context = RunContext(self.user)
+
+        assert [balance["amount"] for balance in context.portfolio(SupportedExchanges.BINANCE)] == [Decimal(50)]
+        portfolio_mock.assert_not_called()
+
+        # the stream may not have reported the order's effect on the balance yet
+        context.invalidate(SupportedExchanges.BINANCE)
+        assert context.portfolio(SupportedExchanges.BINANCE) == []
+        portfolio_mock.assert_called_once()
+
+    def test_order_updates_are_returned_once(self):
+        stream = user_data_stream.UserDataStream(1, self.user, MagicMock(), ["USD"])
+        sleeps = []
+
+        updates = user_data_stream.StreamOrderUpdates(self.user, sleep=sleeps.append, clock=lambda: sum(sleeps))
+
+        stream.handle_event({"e": "executionReport", "s": "USDCUSD", "i": 1, "X": "NEW", "z": "0", "Z": "0"})
+        assert [update.status for update in updates.wait_for_updates([1], timeout=1)] == [OrderStatus.NEW]
+
+        # nothing changed, so it waits until the timeout
+        assert updates.wait_for_updates([1], timeout=1) == []
+        assert sum(sleeps) >= 1
+
+        # updates to other orders are ignored
+        stream.handle_event({"e": "executionReport", "s": "USDTUSD", "i": 2, "X": "FILLED", "z": "5", "Z": "5"})
+        stream.handle_event({"e": "executionReport", "s": "USDCUSD", "i": 1, "X": "FILLED", "z": "5", "Z": "5"})
+        assert [update.id for update in updates.wait_for_updates([1], timeout=1)] == [1]
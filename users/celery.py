@@ -1,4 +1,5 @@
 import os
+import typing as t
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "botweb.settings.development")
@@ -15,11 +16,16 @@ from django_structlog.celery.steps import DjangoStructLogInitStep
 assert app.steps is not None
 app.steps["worker"].add(DjangoStructLogInitStep)
 
+from decimal import Decimal
+
 import django.utils.timezone
 import sentry_sdk
 from celery.signals import setup_logging
+from decouple import config
 
+from bot import market_snapshot, precheck, scheduling
 from bot.commands import BuyCommand
+from bot.run_context import RunContext
 from bot.utils import log
 
 
@@ -33,25 +39,61 @@ def receiver_setup_logging(loglevel, logfile, format, colorize, **kwargs):  # py
 assert app.on_after_configure is not None
 
 
+# with multiple worker nodes, each shard's runs are sent to its own queue (`user_buys_<shard>`), which a node consumes
+# with `celery worker -Q user_buys_<shard>`
+USER_BUY_SHARD_COUNT = config("USER_BUY_SHARD_COUNT", default=1, cast=int)
+
+
+def user_buy_queue(shard: int, shard_count: int) -> t.Optional[str]:
+    # a single shard uses the default queue, so a single node doesn't need any queue configuration
+    return f"user_buys_{shard}" if shard_count > 1 else None
+
+
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     # this method has a *lot* of kw params that can modify functionality
-    sender.add_periodic_task(60 * 60, initiate_user_buys.s(), name="check all accounts every hour for updates")
+    sender.add_periodic_task(
+        scheduling.DEFAULT_SCHEDULE_PERIOD_SECONDS,
+        initiate_user_buys.s(),
+        name="check all accounts every hour for updates",
+    )
 
 
 @app.task
-def initiate_user_buys():
-    from users.models import User
+def initiate_user_buys(shard_count=USER_BUY_SHARD_COUNT):
+    log.info("initiating all buys for user", shard_count=shard_count)
 
-    log.info("initiating all buys for user")
+    # build market data once for the whole cycle so every user, across every shard, is priced against the same data.
+    # Runs are spread across the cycle, so the last runs value portfolios with prices from up to a cycle ago.
+    snapshot = market_snapshot.build_market_snapshot()
+    market_snapshot.store_market_snapshot(snapshot)
+
+    for shard in range(shard_count):
+        schedule_user_buys.apply_async((shard, shard_count, snapshot.version), queue=user_buy_queue(shard, shard_count))
+
+
+@app.task
+def schedule_user_buys(shard, shard_count, snapshot_version):
+    from users.models import User
 
     # TODO using `iterator` here was causing the queryset contents to be cached
-    for user in User.objects.all():
-        user_buy.delay(user.id)
+    users = [user.schedulable_user() for user in User.objects.filter(disabled=False)]
+
+    # runs are spread across the cycle rather than all enqueued to start at once
+    scheduled_runs = scheduling.schedule_user_runs(users, shard=shard, shard_count=shard_count)
+
+    for scheduled_run in scheduled_runs:
+        user_buy.apply_async(
+            (scheduled_run.user_id, snapshot_version),
+            countdown=scheduled_run.delay,
+            queue=user_buy_queue(shard, shard_count),
+        )
+
+    log.info("scheduled user buys", count=len(scheduled_runs), shard=shard)
 
 
 @app.task
-def user_buy(user_id):
+def user_buy(user_id, snapshot_version=None):
     from users.models import User
 
     user = User.objects.get(id=user_id)
@@ -60,6 +102,14 @@ def user_buy(user_id):
         log.info("user is disabled, skipping", user=user)
         return
 
+    snapshot = None
+
+    if snapshot_version:
+        snapshot = market_snapshot.load_market_snapshot(snapshot_version)
+
+        if snapshot is None:
+            log.warn("market snapshot expired, using live market data", snapshot_version=snapshot_version)
+
     bot_user = user.bot_user()
 
     sentry_sdk.set_user({"id": user_id, "username": user.name})
@@ -67,17 +117,38 @@ def user_buy(user_id):
     log.bind(user_id=user.id)
     log.info("initiating buys for user")
 
-    buy_results_by_exchange = BuyCommand.execute(bot_user)
+    context = RunContext(bot_user)
+
+    # most runs have nothing to buy, which only requires the account balances to determine
+    if skip_reason := precheck.buy_skip_reason(context):
+        log.info("nothing to buy, skipping", skip_reason=skip_reason)
+
+        user.last_skip_reason = skip_reason.value
+        user.pending_balance = Decimal(0)
+        user.date_checked = django.utils.timezone.now()
+        user.save()
+        return
+
+    buy_results_by_exchange = BuyCommand.execute(bot_user, snapshot=snapshot, context=context)
 
     # TODO this data structure is pretty messy
     # aggregate buy results
     completed_orders = []
-    for (_, _, _, completed_orders_in_exchange) in buy_results_by_exchange:
+    pending_balance = Decimal(0)
+
+    for (_, purchase_balance, market_buys, completed_orders_in_exchange) in buy_results_by_exchange:
         completed_orders += completed_orders_in_exchange
 
+        # whatever wasn't spent by a completed order is still waiting to be invested
+        ordered_symbols = {order["symbol"] for order in completed_orders_in_exchange}
+        spent = sum((buy["amount"] for buy in market_buys if buy["symbol"] in ordered_symbols), Decimal(0))
+        pending_balance += max(purchase_balance - spent, Decimal(0))
+
     if len(completed_orders) > 0:
         log.info("completed orders", completed_orders=len(completed_orders))
         user.last_ordered_at = django.utils.timezone.now()
 
+    user.pending_balance = pending_balance
+    user.last_skip_reason = None
     user.date_checked = django.utils.timezone.now()
     user.save()
@@ -0,0 +1,12 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from bot.market_data_stream import MarketDataStream
+
+
+class Command(BaseCommand):
+    help = "Streams binance prices and order book tops, publishing them for workers to use instead of polling the exchange"
+
+    def handle(self, *args, **options):
+        asyncio.run(MarketDataStream().run())
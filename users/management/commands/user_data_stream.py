@@ -0,0 +1,23 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from bot import user_data_stream
+from users.models import User
+
+
+def enabled_users():
+    return {user.id: user.bot_user() for user in User.objects.filter(disabled=False) if user.binance_api_key}
+
+
+def trigger_buy(user_id):
+    from users.celery import user_buy
+
+    user_buy.delay(user_id)
+
+
+class Command(BaseCommand):
+    help = "Listens to the binance user data stream of every enabled user, keeping balances current and buying when a deposit arrives"
+
+    def handle(self, *args, **options):
+        asyncio.run(user_data_stream.listen(enabled_users, trigger_buy))
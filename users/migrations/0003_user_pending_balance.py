@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20211120_1933'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='pending_balance',
+            field=models.DecimalField(decimal_places=12, max_digits=30, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_pending_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_skip_reason',
+            field=models.CharField(max_length=50, null=True),
+        ),
+    ]
@@ -37,6 +37,10 @@ class User(models.Model):
     name = models.CharField(max_length=100)
     date_checked = models.DateTimeField(null=True)
     last_ordered_at = models.DateTimeField(null=True)
+    # purchasing currency left uninvested by the last run, used to prioritize the user in the next cycle
+    pending_balance = models.DecimalField(max_digits=30, decimal_places=12, null=True)
+    # why the last run was skipped without a full buy, null if it wasn't skipped
+    last_skip_reason = models.CharField(max_length=50, null=True)
     disabled = models.BooleanField(default=False)
 
     def bot_user(self):
@@ -56,5 +60,10 @@ class User(models.Model):
 
         return bot_user
 
+    def schedulable_user(self):
+        from bot.scheduling import SchedulableUser
+
+        return SchedulableUser(id=self.id, last_ordered_at=self.last_ordered_at, pending_balance=self.pending_balance)
+
     def __repr__(self):
         return f"<{self} {self.name} {self.date_checked}>"